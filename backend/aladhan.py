@@ -0,0 +1,217 @@
+import argparse
+import math
+from collections import OrderedDict
+from datetime import date as date_cls, timedelta
+from typing import Dict, List, Optional, Tuple
+
+# Calculation method sent with every request (2 = ISNA)
+METHOD = 2
+
+# Mosques whose coordinates fall in the same grid cell share one upstream
+# calendar, fetched for the cell's centre. In a 0.05 degree cell every
+# prayer stays within ~25 seconds of the centre's up to 60 degrees latitude
+# (python aladhan.py --validate 0.05). 0 disables grouping and every
+# mosque is fetched at its own point. A cell that straddles a zone border
+# gets one calendar per zone, each requested in that zone.
+DEFAULT_GRID_DEGREES = 0.05
+
+PRAYER_TIMINGS = {"fajr": "Fajr", "dhuhr": "Dhuhr", "asr": "Asr", "maghrib": "Maghrib", "isha": "Isha"}
+
+Cell = Tuple[float, float]
+# (cell, IANA zone): Aladhan's times are local, so a cell's timetable is
+# only shared by the mosques in it that keep the same clock
+GridKey = Tuple[Cell, str]
+
+
+def grid_cell(latitude: Optional[float], longitude: Optional[float],
+              grid_degrees: float = DEFAULT_GRID_DEGREES) -> Optional[Cell]:
+    """Centre of the grid cell holding the point, None without coordinates or grid."""
+    if latitude is None or longitude is None or grid_degrees <= 0:
+        return None
+    # Rounding the centre keeps float noise out of the cell key
+    return (round(round(latitude / grid_degrees) * grid_degrees, 6),
+            round(round(longitude / grid_degrees) * grid_degrees, 6))
+
+
+def grid_key(latitude: Optional[float], longitude: Optional[float], zone: str,
+             grid_degrees: float = DEFAULT_GRID_DEGREES) -> Optional[GridKey]:
+    """(cell, zone) for a mosque at the point, None without coordinates or grid."""
+    cell = grid_cell(latitude, longitude, grid_degrees)
+    return (cell, zone) if cell else None
+
+
+def cell_radius_km(grid_degrees: float) -> float:
+    """Search radius that covers a whole cell around its centre."""
+    return grid_degrees * 111.2 * math.sqrt(2) / 2 * 1.01
+
+
+def calendar_path(year: int, month: Optional[int] = None) -> str:
+    return f"/v1/calendar/{year}/{month}" if month else f"/v1/calendar/{year}"
+
+
+def parse_calendar(payload: dict) -> Dict[str, Dict[str, str]]:
+    """{ISO date: {prayer: "HH:MM"}} from a month (list) or year (dict by month) calendar."""
+    data = payload['data']
+    days = data if isinstance(data, list) else [day for month in data.values() for day in month]
+    parsed = {}
+    for day in days:
+        # Gregorian dates come as DD-MM-YYYY; timings carry a " (EST)" style suffix
+        dd, mm, yyyy = day['date']['gregorian']['date'].split("-")
+        parsed[f"{yyyy}-{mm}-{dd}"] = {
+            prayer: day['timings'][name].split(" ")[0] for prayer, name in PRAYER_TIMINGS.items()
+        }
+    return parsed
+
+
+def months_between(first: date_cls, last: date_cls) -> List[Tuple[int, int]]:
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+class GridTimetableCache:
+    """Upstream timetables by (grid cell, zone, date, method), shared by
+    every mosque in the cell and zone and evicting the least recently used
+    day.
+
+    Filled from calendar fetches, so a mosque added to a cell after its
+    month was fetched, or missed when the rows were written, is served
+    without another upstream call.
+    """
+
+    def __init__(self, max_entries: int = 200_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._days: "OrderedDict[Tuple[GridKey, str, int], Dict[str, str]]" = OrderedDict()
+
+    def get(self, grid: GridKey, day: str, method: int = METHOD) -> Optional[Dict[str, str]]:
+        key = (grid, day, method)
+        times = self._days.get(key)
+        if times is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._days.move_to_end(key)
+        return times
+
+    def put_many(self, grid: GridKey, days: Dict[str, Dict[str, str]], method: int = METHOD):
+        for day, times in days.items():
+            self._days[(grid, day, method)] = times
+            self._days.move_to_end((grid, day, method))
+        while len(self._days) > self.max_entries:
+            self._days.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"entries": len(self._days), "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None}
+
+
+def validate_grid(grid_degrees: float = DEFAULT_GRID_DEGREES, cells: int = 2000, max_latitude: float = 60.0,
+                  seed: int = 42) -> bool:
+    """Check that serving a cell centre's times to the whole cell is off by
+    less than a minute.
+
+    Compares prayer_calc's unrounded times at each corner of sampled cells
+    (the farthest a mosque can be from the centre) with the centre's, on
+    every 7th day of a year, and reports the worst error by latitude band.
+    Cells are sampled from the synthetic mosques plus uniformly over
+    |latitude| <= max_latitude.
+    """
+    import random
+
+    from prayer_calc import solar_hours
+    from seed_data import generate_mosques
+
+    rng = random.Random(seed)
+    points = [(m['latitude'], m['longitude']) for m in generate_mosques(rng, cells // 2, "")]
+    points += [(rng.uniform(-max_latitude, max_latitude), rng.uniform(-180, 180)) for _ in range(cells - len(points))]
+    days = [date_cls(2025, 1, 1) + timedelta(days=offset) for offset in range(0, 365, 7)]
+    half = grid_degrees / 2
+    bands: Dict[int, Dict[str, float]] = {}
+    for latitude, longitude in points:
+        centre = grid_cell(latitude, longitude, grid_degrees)
+        band = bands.setdefault(int(abs(centre[0]) // 15 * 15), {})
+        for day in days:
+            expected = solar_hours(*centre, day)
+            for d_lat in (-half, half):
+                for d_lng in (-half, half):
+                    actual = solar_hours(centre[0] + d_lat, centre[1] + d_lng, day)
+                    for prayer, hour in actual.items():
+                        error = abs(hour - expected[prayer]) * 3600
+                        band[prayer] = max(band.get(prayer, 0.0), error)
+
+    print(f"grid {grid_degrees} degrees: worst error at a cell corner vs its centre, seconds")
+    print(f"  {'|latitude|':<12}" + "".join(f"{prayer:>9}" for prayer in PRAYER_TIMINGS))
+    worst = 0.0
+    for start in sorted(bands):
+        errors = bands[start]
+        worst = max(worst, *errors.values())
+        print(f"  {f'{start}-{start + 15}':<12}" + "".join(f"{errors.get(p, 0):>9.1f}" for p in PRAYER_TIMINGS))
+    passed = worst < 60
+    print(f"{'PASS' if passed else 'FAIL'}: worst {worst:.1f}s over {len(points):,} cells x {len(days)} days "
+          f"({'under' if passed else 'not under'} one minute)")
+    return passed
+
+
+def validate_zone_border(grid_degrees: float = DEFAULT_GRID_DEGREES, resolve_zone=None, latitude: float = 39.5,
+                         west: float = -9.0, east: float = -3.0) -> bool:
+    """Check a cell straddling a zone border (Portugal/Spain by default).
+
+    Mosques on either side of the border keep different clocks, so serving
+    them the centre's times in the centre's zone is an hour out for one
+    side. Keyed by (cell, zone), each side gets the centre's times in its
+    own zone and is off by no more than the grid's quantization.
+    """
+    from datetime import datetime, timezone
+
+    from prayer_calc import solar_hours
+    from timezones import TimezoneResolver, get_zone
+
+    resolve_zone = resolve_zone or TimezoneResolver().lookup
+
+    def local_hours(point: Cell, day: date_cls, zone: str) -> Dict[str, float]:
+        noon = datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc)
+        offset = noon.astimezone(get_zone(zone)).utcoffset().total_seconds() / 3600
+        return {prayer: hour + offset for prayer, hour in solar_hours(*point, day).items()}
+
+    half = grid_degrees / 2
+    for step in range(int((east - west) / grid_degrees) + 1):
+        centre = grid_cell(latitude, west + step * grid_degrees, grid_degrees)
+        corners = [(centre[0] + d_lat, centre[1] + d_lng) for d_lat in (-half, half) for d_lng in (-half, half)]
+        zones = {corner: resolve_zone(*corner) for corner in corners}
+        if len(set(zones.values())) > 1:
+            break
+    else:
+        print(f"FAIL: no cell on latitude {latitude} between {west} and {east} straddles a zone border")
+        return False
+
+    centre_zone = resolve_zone(*centre)
+    keyed = by_cell = 0.0
+    for day in [date_cls(2025, 1, 1) + timedelta(days=offset) for offset in range(0, 365, 7)]:
+        for corner, zone in zones.items():
+            actual = local_hours(corner, day, zone)
+            own_zone, centre_clock = local_hours(centre, day, zone), local_hours(centre, day, centre_zone)
+            for prayer, hour in actual.items():
+                keyed = max(keyed, abs(hour - own_zone[prayer]) * 3600)
+                by_cell = max(by_cell, abs(hour - centre_clock[prayer]) * 3600)
+
+    passed = keyed < 60
+    print(f"{'PASS' if passed else 'FAIL'}: cell {centre} spans {', '.join(sorted(set(zones.values())))}; worst "
+          f"error {keyed:.1f}s keyed by (cell, zone), {by_cell:.0f}s keyed by cell alone")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate a grid size for the shared Aladhan timetables")
+    parser.add_argument("--validate", type=float, metavar="GRID_DEGREES", default=DEFAULT_GRID_DEGREES,
+                        help="Grid size to check the quantization error of")
+    parser.add_argument("--max-latitude", type=float, default=60.0)
+    args = parser.parse_args()
+    passed = validate_grid(args.validate, max_latitude=args.max_latitude)
+    passed = validate_zone_border(args.validate) and passed
+    raise SystemExit(0 if passed else 1)
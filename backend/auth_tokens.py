@@ -0,0 +1,80 @@
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import jwt
+from fastapi import HTTPException
+
+ALGORITHM = "HS256"
+
+
+class TokenManager:
+    """Issues and verifies HMAC-signed access and refresh tokens.
+
+    Verifying an access token is a signature and expiry check in memory; no
+    database lookup. Refresh goes through the database (see the refresh
+    route), so an account change is picked up by the next refresh at the
+    latest. For faster cut-off, `revoke` rejects every token issued to a user
+    before now, for as long as such tokens could be valid. That takes effect
+    on this worker at once; other workers learn of it through `apply`, fed
+    from the shared revocations repository.
+    """
+
+    def __init__(self, secret: str, access_ttl: int = 900, refresh_ttl: int = 14 * 86400):
+        if not secret:
+            raise ValueError("TokenManager needs a signing secret")
+        self.secret = secret
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self._revoked: Dict[str, float] = {}
+
+    def _encode(self, user: dict, token_type: str, ttl: int, now: int) -> str:
+        claims = {
+            "sub": user['id'],
+            "role": user['role'],
+            "mosque_id": user.get('mosque_id'),
+            "type": token_type,
+            "iat": now,
+            "exp": now + ttl,
+        }
+        return jwt.encode(claims, self.secret, algorithm=ALGORITHM)
+
+    def issue(self, user: dict) -> dict:
+        now = int(time.time())
+        return {
+            "access_token": self._encode(user, "access", self.access_ttl, now),
+            "refresh_token": self._encode(user, "refresh", self.refresh_ttl, now),
+            "token_type": "bearer",
+            "expires_in": self.access_ttl,
+        }
+
+    def verify(self, token: str, token_type: str = "access") -> dict:
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[ALGORITHM])
+        except jwt.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired", headers={"WWW-Authenticate": "Bearer"})
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+        if claims.get("type") != token_type:
+            raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+
+        revoked_at = self._revoked.get(claims["sub"])
+        if revoked_at is not None and claims["iat"] <= revoked_at:
+            raise HTTPException(status_code=401, detail="Token revoked", headers={"WWW-Authenticate": "Bearer"})
+        return claims
+
+    def revoke(self, user_id: str) -> float:
+        """Revoke on this worker; returns the revocation time to share."""
+        now = time.time()
+        self.apply([(user_id, now)])
+        return now
+
+    def apply(self, revocations: Iterable[Tuple[str, float]]):
+        """Merge revocations made here or on other workers."""
+        for user_id, revoked_at in revocations:
+            if revoked_at > self._revoked.get(user_id, 0):
+                self._revoked[user_id] = revoked_at
+        # Entries only matter while a token issued before them can still be live
+        cutoff = time.time() - self.refresh_ttl
+        for key in [k for k, at in self._revoked.items() if at < cutoff]:
+            del self._revoked[key]
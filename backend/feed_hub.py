@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+ALL_MOSQUES = None  # subscription key for the global feed
+
+
+class FeedHub:
+    """In-process pub/sub for approved posts, keyed by mosque id.
+
+    Each post is serialized once and the same payload string is put on every
+    subscriber queue. Queues are bounded; a slow subscriber loses its oldest
+    undelivered events rather than growing without limit.
+    """
+
+    def __init__(self, queue_size: int = 32):
+        self.queue_size = queue_size
+        self._subscribers: Dict[Optional[str], Set[asyncio.Queue]] = defaultdict(set)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    @contextmanager
+    def subscribe(self, mosque_id: Optional[str] = ALL_MOSQUES):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[mosque_id].add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(mosque_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[mosque_id]
+
+    def publish(self, post: dict) -> int:
+        payload = json.dumps(post, default=str)
+        delivered = 0
+        for key in (post.get('mosque_id'), ALL_MOSQUES):
+            for queue in self._subscribers.get(key, ()):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(payload)
+                delivered += 1
+        return delivered
+
+    async def serve_websocket(self, websocket, mosque_id: Optional[str] = ALL_MOSQUES):
+        """Send posts to an accepted WebSocket until the client goes away.
+
+        The socket is read as well as written: an idle client's disconnect
+        only shows up on the receiving side, and waiting for the next
+        publish to notice it would keep its subscription indefinitely.
+        Messages from the client are ignored.
+        """
+        with self.subscribe(mosque_id) as queue:
+            async def forward():
+                while True:
+                    await websocket.send_text(await queue.get())
+
+            async def receive_until_closed():
+                while (await websocket.receive())["type"] != "websocket.disconnect":
+                    pass
+
+            tasks = {asyncio.ensure_future(forward()), asyncio.ensure_future(receive_until_closed())}
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    # Sending to a socket that just closed fails; that is a disconnect too
+                    logger.debug(f"Post WebSocket closed: {task.exception()!r}")
+
+    async def watch_change_stream(self, collection):
+        """Publish posts approved by any worker, using a Mongo change stream.
+
+        Requires a replica set. When this runs, handlers should not publish
+        locally as well, or subscribers would see every post twice.
+        """
+        pipeline = [{"$match": {
+            "operationType": "update",
+            "updateDescription.updatedFields.status": "approved"
+        }}]
+        while True:
+            try:
+                async with collection.watch(pipeline, full_document="updateLookup") as stream:
+                    async for change in stream:
+                        post = change.get('fullDocument')
+                        if post:
+                            post.pop('_id', None)
+                            self.publish(post)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Post change stream failed, retrying: {e}")
+                await asyncio.sleep(5)
@@ -0,0 +1,74 @@
+from collections import defaultdict
+from typing import Iterable, List, Optional
+
+ALL_MOSQUES = "all"
+DEFAULT_FEED_SIZE = 50
+
+
+class FeedStore:
+    """Materialized "latest approved posts" lists, one document per feed.
+
+    Each mosque has a feed document holding its newest approved posts, capped
+    and sorted by created_at, and a global feed is kept the same way under the
+    id "all". Approvals are applied with a single $push/$sort/$slice per feed,
+    so reads are one find_one instead of a sorted scan over posts.
+    """
+
+    def __init__(self, feeds, posts, size: int = DEFAULT_FEED_SIZE):
+        self.feeds = feeds
+        self.posts = posts
+        self.size = size
+
+    async def _push(self, feed_id: str, posts: List[dict]):
+        result = await self.feeds.update_one(
+            {"id": feed_id},
+            {"$push": {"posts": {"$each": posts, "$sort": {"created_at": -1}, "$slice": self.size}}}
+        )
+        if result.matched_count == 0:
+            # No feed yet: build it from posts so older approvals are included
+            await self.rebuild(feed_id)
+
+    async def add(self, posts: Iterable[dict]):
+        """Add newly approved posts; call after their status is saved."""
+        by_mosque = defaultdict(list)
+        for post in posts:
+            by_mosque[post['mosque_id']].append({**post, "status": "approved"})
+        if not by_mosque:
+            return
+        await self._push(ALL_MOSQUES, [post for group in by_mosque.values() for post in group])
+        for mosque_id, group in by_mosque.items():
+            await self._push(mosque_id, group)
+
+    async def remove(self, post: dict):
+        # Removing an entry can leave room for an older post that was sliced
+        # off, so affected feeds are rebuilt instead of just pulled from
+        for feed_id in (post['mosque_id'], ALL_MOSQUES):
+            feed = await self.feeds.find_one({"id": feed_id, "posts.id": post['id']}, {"_id": 1})
+            if feed:
+                await self.rebuild(feed_id)
+
+    async def read(self, mosque_id: Optional[str] = None, limit: Optional[int] = None, feeds=None) -> List[dict]:
+        """A feed's posts; `feeds` reads from another handle, e.g. a secondary."""
+        feed_id = mosque_id or ALL_MOSQUES
+        feed = await (feeds if feeds is not None else self.feeds).find_one({"id": feed_id}, {"_id": 0, "posts": 1})
+        if feed is None:
+            posts = await self.rebuild(feed_id)
+        else:
+            posts = feed.get('posts', [])
+        return posts[:limit] if limit else posts
+
+    async def rebuild(self, feed_id: str) -> List[dict]:
+        query = {"status": "approved"}
+        if feed_id != ALL_MOSQUES:
+            query['mosque_id'] = feed_id
+        posts = await self.posts.find(query, {"_id": 0}).sort("created_at", -1).limit(self.size).to_list(self.size)
+        await self.feeds.update_one({"id": feed_id}, {"$set": {"posts": posts}}, upsert=True)
+        return posts
+
+    async def rebuild_all(self) -> int:
+        mosque_ids = await self.posts.distinct("mosque_id", {"status": "approved"})
+        await self.feeds.delete_many({"id": {"$nin": mosque_ids + [ALL_MOSQUES]}})
+        for feed_id in mosque_ids + [ALL_MOSQUES]:
+            await self.rebuild(feed_id)
+        return len(mosque_ids) + 1
+
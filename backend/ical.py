@@ -0,0 +1,173 @@
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date as date_cls, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from timezones import PRAYERS, get_zone, local_to_utc
+
+PRODID = "-//Salah Reminder//Prayer Times//EN"
+UID_DOMAIN = "salah-reminder"
+EVENT_MINUTES = 15
+CALENDAR_FOOTER = b"END:VCALENDAR\r\n"
+
+MonthKey = Tuple[str, int, int]  # (mosque_id, year, month)
+
+
+def escape_text(value: str) -> str:
+    """Escape a TEXT value (RFC 5545 3.3.11)."""
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str, limit: int = 75) -> str:
+    """Split a content line into 75-octet pieces joined by CRLF + space,
+    never inside a UTF-8 sequence (RFC 5545 3.1)."""
+    if len(line) <= limit and line.isascii():
+        return line
+    pieces, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode())
+        if size + width > limit:
+            pieces.append("".join(current))
+            # Continuation lines start with a space, which counts too
+            current, size = [" "], 1
+        current.append(char)
+        size += width
+    pieces.append("".join(current))
+    return "\r\n".join(pieces)
+
+
+def format_utc(moment: datetime) -> str:
+    return moment.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _lines(lines: Iterable[str]) -> bytes:
+    return "".join(fold(line) + "\r\n" for line in lines).encode()
+
+
+def calendar_header(mosque: dict) -> bytes:
+    return _lines([
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{escape_text(mosque.get('name') or 'Prayer times')}",
+        f"X-WR-TIMEZONE:{mosque.get('timezone') or 'UTC'}",
+        # Hint for calendar apps that honour it; ETags make refreshes cheap
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+        "X-PUBLISHED-TTL:PT1H",
+    ])
+
+
+def day_events(mosque: dict, doc: dict) -> bytes:
+    """The VEVENTs for one prayer_times row, with instants in UTC."""
+    zone = get_zone(mosque.get('timezone'))
+    created_at = doc.get('created_at')
+    if isinstance(created_at, str):
+        created_at = datetime.fromisoformat(created_at)
+    # DTSTAMP comes from the row so unchanged days render identical bytes
+    stamp = format_utc(created_at) if created_at else "19700101T000000Z"
+    name = mosque.get('name') or "Mosque"
+    location = ", ".join(part for part in (mosque.get('address'), mosque.get('city'), mosque.get('country')) if part)
+    lines = []
+    for prayer in PRAYERS:
+        value = doc.get(prayer)
+        if not value:
+            continue
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{mosque['id']}-{doc['date']}-{prayer}@{UID_DOMAIN}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{format_utc(local_to_utc(doc['date'], value, zone))}",
+            f"DURATION:PT{EVENT_MINUTES}M",
+            f"SUMMARY:{escape_text(f'{prayer.title()} – {name}')}",
+        ]
+        if location:
+            lines.append(f"LOCATION:{escape_text(location)}")
+        lines += ["TRANSP:TRANSPARENT", "END:VEVENT"]
+    return _lines(lines)
+
+
+@dataclass
+class MonthBlock:
+    """One mosque's rendered events for a calendar month, by ISO date."""
+
+    days: Dict[str, bytes]
+    hash: str
+
+    @classmethod
+    def build(cls, mosque: dict, docs: Iterable[dict]) -> "MonthBlock":
+        by_date: Dict[str, dict] = {}
+        for doc in docs:
+            # Manual times win over cached API times for the same day
+            if doc['date'] not in by_date or doc.get('is_manual'):
+                by_date[doc['date']] = doc
+        days = {day: day_events(mosque, by_date[day]) for day in sorted(by_date)}
+        digest = hashlib.sha256()
+        for day, events in days.items():
+            digest.update(day.encode())
+            digest.update(events)
+        return cls(days, digest.hexdigest())
+
+    def between(self, first: str, last: str) -> bytes:
+        return b"".join(events for day, events in self.days.items() if first <= day <= last)
+
+
+def month_keys(mosque_id: str, start: date_cls, end: date_cls) -> List[MonthKey]:
+    keys = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        keys.append((mosque_id, year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return keys
+
+
+def month_bounds(year: int, month: int) -> Tuple[str, str]:
+    first = date_cls(year, month, 1)
+    following = date_cls(year + 1, 1, 1) if month == 12 else date_cls(year, month + 1, 1)
+    return first.isoformat(), (following - timedelta(days=1)).isoformat()
+
+
+class CalendarCache:
+    """Rendered month blocks, evicting the least recently used.
+
+    Entries expire after `ttl` seconds so days cached from the API since a
+    block was built show up; setting manual times drops the month at once.
+    """
+
+    def __init__(self, max_entries: int = 20_000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._blocks: "OrderedDict[MonthKey, Tuple[float, MonthBlock]]" = OrderedDict()
+
+    def get(self, key: MonthKey) -> Optional[MonthBlock]:
+        entry = self._blocks.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._blocks[key]
+            return None
+        self._blocks.move_to_end(key)
+        return entry[1]
+
+    def put(self, key: MonthKey, block: MonthBlock):
+        self._blocks[key] = (time.monotonic() + self.ttl, block)
+        self._blocks.move_to_end(key)
+        if len(self._blocks) > self.max_entries:
+            self._blocks.popitem(last=False)
+
+    def invalidate(self, mosque_id: str, day: str):
+        parsed = date_cls.fromisoformat(day)
+        self._blocks.pop((mosque_id, parsed.year, parsed.month), None)
+
+
+def feed_etag(header: bytes, first: str, last: str, blocks: List[MonthBlock]) -> str:
+    digest = hashlib.sha256(header)
+    digest.update(f"{first}/{last}".encode())
+    for block in blocks:
+        digest.update(block.hash.encode())
+    return f'"{digest.hexdigest()[:32]}"'
+
@@ -0,0 +1,152 @@
+import asyncio
+import base64
+import hashlib
+import importlib.util
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+from metrics import record_cache
+
+# Pillow is optional; uploads are stored as-is without it. It is imported
+# in the worker processes that do the normalizing, not by the server.
+HAVE_PILLOW = importlib.util.find_spec("PIL") is not None
+
+MAX_DIMENSION = 512
+THUMBNAIL_SIZES = (128,)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _trim_border(img):
+    from PIL import Image, ImageChops
+
+    # Crop away a uniform border using the top-left pixel as background colour
+    background = Image.new(img.mode, img.size, img.getpixel((0, 0)))
+    diff = ImageChops.difference(img, background).convert("L").point(lambda p: 255 if p > 48 else 0)
+    bbox = diff.getbbox()
+    if not bbox:
+        return img
+    pad = max(4, (bbox[2] - bbox[0]) // 20)
+    left, top = max(0, bbox[0] - pad), max(0, bbox[1] - pad)
+    right, bottom = min(img.width, bbox[2] + pad), min(img.height, bbox[3] + pad)
+    return img.crop((left, top, right, bottom))
+
+
+def _flatten(img):
+    """RGB on a white background. Converting straight to RGB would keep the
+    colour under transparent pixels, usually black, and wipe out a QR code
+    drawn on a transparent background."""
+    from PIL import Image
+
+    if img.mode == "P" and "transparency" in img.info:
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA", "PA"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def _encode_png(img) -> bytes:
+    out = io.BytesIO()
+    img.quantize(colors=256).save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def normalize_image(data: bytes, max_dimension: int = MAX_DIMENSION) -> Dict[str, bytes]:
+    """Decode, crop, downsample and re-encode an image as a small PNG.
+
+    Returns the normalized image under "full" plus one entry per thumbnail
+    size. Runs in a worker process, so it only deals in plain bytes.
+    """
+    from PIL import Image, ImageOps
+
+    img = Image.open(io.BytesIO(data))
+    img = _flatten(ImageOps.exif_transpose(img))
+    img = _trim_border(img)
+    img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    variants = {"full": _encode_png(img)}
+    for size in THUMBNAIL_SIZES:
+        thumb = img.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        variants[str(size)] = _encode_png(thumb)
+    return variants
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=int(os.environ.get('IMAGE_WORKERS', 2)))
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def store_normalized_image(images, source: bytes, source_sha256: str) -> dict:
+    """Normalize an upload off the event loop and store it content-addressed.
+
+    Images are keyed by the SHA-256 of the source bytes, so re-uploading the
+    same file reuses the stored variants instead of processing it again.
+    """
+    existing = await images.get(source_sha256)
+    record_cache("images", existing is not None)
+    if existing:
+        return existing
+
+    if not HAVE_PILLOW:
+        variants = {"full": source}
+        content_type = None
+    else:
+        loop = asyncio.get_running_loop()
+        variants = await loop.run_in_executor(get_executor(), normalize_image, source)
+        content_type = "image/png"
+
+    doc = {
+        "id": source_sha256,
+        "content_type": content_type,
+        "source_size": len(source),
+        "size": len(variants["full"]),
+        "sha256": hashlib.sha256(variants["full"]).hexdigest(),
+        "variants": {name: base64.b64encode(blob).decode('ascii') for name, blob in variants.items()},
+    }
+    await images.insert_if_absent(doc)
+    return doc
+
+
+def report_size_reduction(directory: str):
+    """Print per-file and total size reduction for a directory of images."""
+    total_before = total_after = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            after = len(normalize_image(data)["full"])
+        except Exception as e:
+            print(f"{name}: skipped ({e})")
+            continue
+        total_before += len(data)
+        total_after += after
+        print(f"{name}: {len(data):>10} -> {after:>8} bytes ({100 - after * 100 / len(data):.1f}% smaller)")
+
+    if total_before:
+        print(f"Total: {total_before} -> {total_after} bytes "
+              f"({100 - total_after * 100 / total_before:.1f}% smaller)")
+
+
+if __name__ == "__main__":
+    if not HAVE_PILLOW:
+        sys.exit("Pillow is required to normalize images")
+    report_size_reduction(sys.argv[1] if len(sys.argv) > 1 else ".")
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """What a handler gets: the job's params and a way to report progress."""
+
+    def __init__(self, repository, job: dict):
+        self.job = job
+        self.params: Dict[str, Any] = job.get('params') or {}
+        self._repository = repository
+
+    async def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None):
+        await self._repository.progress(self.job['id'], {"done": done, "total": total, "message": message})
+
+
+Handler = Callable[[JobContext], Awaitable[Any]]
+
+
+class JobRunner:
+    """Runs admin-side work outside request handlers.
+
+    Jobs are documents in the jobs repository (see repositories.py), so they
+    survive restarts and any worker process can run them: each of
+    `concurrency` loops claims the queued job with the highest priority,
+    atomically, and holds it under a lease it renews while the handler runs.
+    A job whose worker died is claimed again once its lease runs out. A
+    handler that raises is retried with exponential backoff until it has
+    made `max_attempts` attempts. At shutdown running jobs are cancelled and
+    put back in the queue without using up an attempt.
+
+    Handlers are registered by kind with `@runner.handler("kind")`; what they
+    return is stored as the job's result.
+    """
+
+    def __init__(self, repository: Callable[[], object], concurrency: int = 2, poll_seconds: float = 1.0,
+                 lease_seconds: float = 60, retry_seconds: float = 5):
+        self._repository = repository  # called on use, as storage is built lazily
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self.handlers: Dict[str, Handler] = {}
+        self.worker_id = uuid.uuid4().hex[:12]
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._workers: Set[asyncio.Task] = set()
+        self._running: Set[asyncio.Task] = set()
+
+    @property
+    def repository(self):
+        return self._repository()
+
+    def handler(self, kind: str):
+        def register(fn: Handler):
+            self.handlers[kind] = fn
+            return fn
+        return register
+
+    async def submit(self, kind: str, params: Optional[dict] = None, priority: int = 0,
+                     max_attempts: int = DEFAULT_MAX_ATTEMPTS, created_by: Optional[str] = None) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind {kind}")
+        now = _now().isoformat()
+        job = {
+            "id": str(uuid.uuid4()), "kind": kind, "params": params or {}, "status": QUEUED,
+            "priority": priority, "attempts": 0, "max_attempts": max_attempts,
+            "progress": None, "result": None, "error": None,
+            "created_by": created_by, "created_at": now, "run_after": now, "started_at": None, "finished_at": None,
+            "worker": None, "lease_until": None,
+        }
+        await self.repository.insert(job)
+        metrics.jobs_submitted.inc(kind)
+        self._wake.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.repository.get(job_id)
+
+    def start(self):
+        for number in range(self.concurrency):
+            self._workers.add(asyncio.create_task(self._work(f"{self.worker_id}-{number}")))
+
+    async def _work(self, worker: str):
+        while not self._closed:
+            try:
+                now = _now()
+                job = await self.repository.claim(
+                    worker, now.isoformat(), (now + timedelta(seconds=self.lease_seconds)).isoformat()
+                )
+            except Exception as e:
+                logger.error(f"Error claiming a job: {e}")
+                job = None
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if self._closed:
+                await self.repository.release(job['id'], worker)
+                break
+            # Another job may be waiting; let an idle loop look
+            self._wake.set()
+            await self._execute(worker, job)
+
+    async def _execute(self, worker: str, job: dict):
+        kind = job['kind']
+        handler = self.handlers.get(kind)
+        if handler is None:
+            await self._finish(worker, job, FAILED, error=f"Unknown job kind {kind}")
+            return
+        task = asyncio.create_task(handler(JobContext(self.repository, job)))
+        self._running.add(task)
+        heartbeat = asyncio.create_task(self._heartbeat(worker, job['id']))
+        metrics.jobs_running.inc(kind)
+        started = time.perf_counter()
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            # Shutting down: another worker (or this one, restarted) takes it
+            await self.repository.release(job['id'], worker)
+            logger.info(f"Job {job['id']} ({kind}) put back in the queue at shutdown")
+            return
+        except Exception as e:
+            if job['attempts'] < job['max_attempts']:
+                delay = self.retry_seconds * 2 ** (job['attempts'] - 1)
+                await self._finish(worker, job, QUEUED, error=str(e),
+                                   run_after=(_now() + timedelta(seconds=delay)).isoformat())
+                logger.warning(f"Job {job['id']} ({kind}) failed attempt {job['attempts']}, retrying in {delay:.0f}s: {e}")
+            else:
+                await self._finish(worker, job, FAILED, error=str(e))
+                logger.error(f"Job {job['id']} ({kind}) failed after {job['attempts']} attempts: {e}")
+        else:
+            await self._finish(worker, job, SUCCEEDED, result=result)
+        finally:
+            heartbeat.cancel()
+            self._running.discard(task)
+            metrics.jobs_running.dec(kind)
+            metrics.job_duration.observe(time.perf_counter() - started, kind)
+
+    async def _finish(self, worker: str, job: dict, status: str, result=None, error: Optional[str] = None,
+                      run_after: Optional[str] = None):
+        changes = {"status": status, "error": error, "worker": None, "lease_until": None}
+        if status == QUEUED:
+            changes['run_after'] = run_after
+        else:
+            changes['result'] = result
+            changes['finished_at'] = _now().isoformat()
+        if not await self.repository.finish(job['id'], worker, changes):
+            # The lease ran out and another worker claimed the job
+            logger.warning(f"Job {job['id']} ({job['kind']}) finished after losing its lease")
+        metrics.jobs_finished.inc(job['kind'], "retried" if status == QUEUED else status)
+
+    async def _heartbeat(self, worker: str, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                lease_until = (_now() + timedelta(seconds=self.lease_seconds)).isoformat()
+                await self.repository.renew(job_id, worker, lease_until)
+            except Exception as e:
+                logger.warning(f"Error renewing the lease on job {job_id}: {e}")
+
+    async def close(self):
+        """Stop claiming jobs and put running ones back in the queue."""
+        self._closed = True
+        self._wake.set()
+        for task in self._running:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
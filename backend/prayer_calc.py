@@ -0,0 +1,92 @@
+import math
+import sys
+from datetime import date as date_cls, datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from timezones import get_zone
+
+# Twilight angles and Asr shadow factor of the ISNA method, which is what
+# the Aladhan requests use (method=2)
+FAJR_ANGLE = 15.0
+ISHA_ANGLE = 15.0
+ASR_SHADOW_FACTOR = 1
+SUNSET_ANGLE = 0.833  # refraction plus the sun's radius
+
+
+def _sun_position(julian_day: float):
+    """Declination (degrees) and equation of time (hours), after PrayTimes.org."""
+    d = julian_day - 2451545.0
+    g = math.radians((357.529 + 0.98560028 * d) % 360)
+    q = (280.459 + 0.98564736 * d) % 360
+    ecliptic = math.radians((q + 1.915 * math.sin(g) + 0.020 * math.sin(2 * g)) % 360)
+    obliquity = math.radians(23.439 - 0.00000036 * d)
+    right_ascension = math.degrees(math.atan2(math.cos(obliquity) * math.sin(ecliptic), math.cos(ecliptic))) / 15
+    declination = math.degrees(math.asin(math.sin(obliquity) * math.sin(ecliptic)))
+    equation_of_time = q / 15 - right_ascension % 24
+    return declination, (equation_of_time + 12) % 24 - 12
+
+
+def solar_hours(latitude: float, longitude: float, day: date_cls) -> Dict[str, float]:
+    """Each prayer as fractional hours after 00:00 UTC on `day`."""
+    julian_day = day.toordinal() + 1721424.5 - longitude / 360
+    lat = math.radians(latitude)
+
+    def noon(hour: float) -> float:
+        _, equation_of_time = _sun_position(julian_day + hour / 24)
+        return 12 - equation_of_time
+
+    def sun_angle_time(angle: float, hour: float, before_noon: bool) -> float:
+        declination, _ = _sun_position(julian_day + hour / 24)
+        decl = math.radians(declination)
+        cos_h = (-math.sin(math.radians(angle)) - math.sin(decl) * math.sin(lat)) / (math.cos(decl) * math.cos(lat))
+        offset = math.degrees(math.acos(max(-1.0, min(1.0, cos_h)))) / 15
+        return noon(hour) + (-offset if before_noon else offset)
+
+    def asr_time(hour: float) -> float:
+        declination, _ = _sun_position(julian_day + hour / 24)
+        angle = -math.degrees(math.atan(1 / (ASR_SHADOW_FACTOR + math.tan(abs(lat - math.radians(declination))))))
+        return sun_angle_time(angle, hour, False)
+
+    # Local solar hours, each refined from a first guess of its time of day
+    sunrise = sun_angle_time(SUNSET_ANGLE, 6, True)
+    sunset = sun_angle_time(SUNSET_ANGLE, 18, False)
+    hours = {
+        "fajr": sun_angle_time(FAJR_ANGLE, 5, True),
+        "dhuhr": noon(12),
+        "asr": asr_time(13),
+        "maghrib": sunset,
+        "isha": sun_angle_time(ISHA_ANGLE, 18, False),
+    }
+    # Angle-based high-latitude rule, Aladhan's default: where twilight
+    # lasts (or never ends) past angle/60 of the night, cap it there
+    night = 24 - (sunset - sunrise)
+    hours["fajr"] = max(hours["fajr"], sunrise - FAJR_ANGLE / 60 * night)
+    hours["isha"] = min(hours["isha"], sunset + ISHA_ANGLE / 60 * night)
+    return {prayer: hour - longitude / 15 for prayer, hour in hours.items()}
+
+
+def calculate_prayer_times(latitude: float, longitude: float, day: date_cls,
+                           zone_name: Optional[str] = None) -> Dict[str, str]:
+    """Local "HH:MM" prayer times computed from the sun's position.
+
+    Used when the upstream API is unavailable; agrees with Aladhan's ISNA
+    times to within a minute or two, including its angle-based adjustment
+    at high latitudes.
+    """
+    base = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    zone = get_zone(zone_name)
+    times = {}
+    for prayer, hour in solar_hours(latitude, longitude, day).items():
+        # Round to the minute in UTC first so DST edges round consistently
+        utc_minutes = round(hour * 60)
+        local = (base + timedelta(minutes=utc_minutes)).astimezone(zone)
+        times[prayer] = local.strftime("%H:%M")
+    return times
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit("usage: python prayer_calc.py LAT LNG [YYYY-MM-DD] [ZONE]")
+    lat, lng = float(sys.argv[1]), float(sys.argv[2])
+    day = date_cls.fromisoformat(sys.argv[3]) if len(sys.argv) > 3 else date_cls.today()
+    print(calculate_prayer_times(lat, lng, day, sys.argv[4] if len(sys.argv) > 4 else None))
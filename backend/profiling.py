@@ -0,0 +1,141 @@
+import asyncio
+import hmac
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Optional
+
+from metrics import route_template
+
+MAX_STACKS_PER_ROUTE = 5000
+MAX_STACK_DEPTH = 64
+
+# Stacks are cut at the event loop's callback dispatch, so they start at the
+# request's own task instead of the loop and server internals
+_LOOP_CALLBACK_CODE = asyncio.events.Handle._run.__code__
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        if code is _LOOP_CALLBACK_CODE:
+            break
+        names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the event loop thread while profiled requests are running.
+
+    A daemon thread wakes every `interval` seconds, reads the loop thread's
+    current frame and credits the stack to whichever profiled request's task
+    is running at that moment. Time a request spends awaiting I/O is not on
+    the loop thread, so profiles show CPU spent in handlers, not waiting.
+    Nothing runs at all while no request is being profiled.
+    """
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.routes: Dict[str, Counter] = defaultdict(Counter)
+        self.requests: Dict[str, int] = defaultdict(int)
+        self._active: Dict[asyncio.Task, Counter] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._loop = None
+        self._loop_thread_id = None
+
+    def start_request(self) -> Counter:
+        task = asyncio.current_task()
+        samples = Counter()
+        with self._lock:
+            self._active[task] = samples
+            if self._thread is None:
+                self._loop = asyncio.get_running_loop()
+                self._loop_thread_id = threading.get_ident()
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        return samples
+
+    def finish_request(self, route: str, samples: Counter):
+        with self._lock:
+            self._active.pop(asyncio.current_task(), None)
+            self.requests[route] += 1
+            aggregate = self.routes[route]
+            for stack, count in samples.items():
+                if stack in aggregate or len(aggregate) < MAX_STACKS_PER_ROUTE:
+                    aggregate[stack] += count
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                task = asyncio.current_task(self._loop)
+                samples = self._active.get(task)
+                if samples is None:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread_id)
+                if frame is not None:
+                    samples[_collapse(frame)] += 1
+
+    def collapsed(self, route: Optional[str] = None) -> str:
+        """Profiles in flamegraph.pl / speedscope collapsed-stack format."""
+        lines = []
+        with self._lock:
+            for name, stacks in sorted(self.routes.items()):
+                if route and name != route:
+                    continue
+                for stack, count in stacks.most_common():
+                    lines.append(f"{name};{stack} {count}" if not route else f"{stack} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                route: {"requests": self.requests[route], "samples": sum(stacks.values())}
+                for route, stacks in self.routes.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.requests.clear()
+
+
+class ProfilingMiddleware:
+    """Profiles a sample of requests, or any request carrying the admin token.
+
+    With a zero sample rate and no token configured the middleware returns
+    straight to the app, so it costs one attribute check when disabled.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler, sample_rate: float = 0.0, token: Optional[str] = None):
+        self.app = app
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.token = token.encode() if token else None
+        self.enabled = bool(sample_rate or token)
+
+    def _wants_profile(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == b"x-profile" and hmac.compare_digest(value, self.token):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not self._wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        samples = self.profiler.start_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.finish_request(f"{scope['method']} {route_template(scope)}", samples)
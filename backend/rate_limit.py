@@ -0,0 +1,168 @@
+import asyncio
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+
+@dataclass(frozen=True)
+class Rate:
+    per_second: float
+    burst: int
+
+    @classmethod
+    def per_minute(cls, count: int, burst: Optional[int] = None) -> "Rate":
+        return cls(count / 60, burst or count)
+
+
+class MemoryRateLimitBackend:
+    """Token buckets held in this process, evicting the least recently used."""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, rate: Rate) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (rate.burst, now))
+        tokens = min(rate.burst, tokens + (now - updated) * rate.per_second)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return allowed, 0.0 if allowed else (1 - tokens) / rate.per_second
+
+
+class MongoRateLimitBackend:
+    """Token buckets shared by all workers in a `rate_limits` collection.
+
+    Refill and take happen in a single pipeline update, so concurrent
+    workers never lose tokens. Buckets idle for an hour expire via TTL.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("updated", expireAfterSeconds=3600)
+
+    async def take(self, key: str, rate: Rate) -> Tuple[bool, float]:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        refilled = {"$min": [
+            rate.burst,
+            {"$add": [
+                {"$ifNull": ["$tokens", rate.burst]},
+                {"$multiply": [
+                    {"$divide": [{"$subtract": ["$$NOW", {"$ifNull": ["$updated", "$$NOW"]}]}, 1000]},
+                    rate.per_second
+                ]}
+            ]}
+        ]}
+        pipeline = [
+            {"$set": {"refilled": refilled}},
+            {"$set": {
+                "allowed": {"$gte": ["$refilled", 1]},
+                "tokens": {"$cond": [{"$gte": ["$refilled", 1]}, {"$subtract": ["$refilled", 1]}, "$refilled"]},
+                "updated": "$$NOW",
+            }},
+            {"$unset": "refilled"},
+        ]
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"key": key}, pipeline, upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Another worker created the bucket between our match and insert;
+            # it exists now, so the retry updates it
+            doc = await self.collection.find_one_and_update(
+                {"key": key}, pipeline, return_document=ReturnDocument.AFTER
+            )
+        if doc["allowed"]:
+            return True, 0.0
+        return False, (1 - doc["tokens"]) / rate.per_second
+
+
+class RateLimiter:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryRateLimitBackend()
+
+    async def check(self, key: str, rate: Rate):
+        allowed, retry_after = await self.backend.take(key, rate)
+        if not allowed:
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+
+class AdmissionController:
+    """Caps in-flight requests per route class and sheds the excess.
+
+    A request that cannot get a slot within `queue_timeout` is rejected with
+    503 and Retry-After instead of queueing behind work the worker is
+    already too busy to finish.
+    """
+
+    def __init__(self, limits: Dict[str, int], queue_timeout: float = 0.05):
+        self.queue_timeout = queue_timeout
+        self._semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, route_class: str):
+        semaphore = self._semaphores[route_class]
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def parse_trusted_proxies(value: str) -> Tuple:
+    """Addresses and CIDR ranges from a comma-separated list, e.g. "10.0.0.0/8,127.0.0.1"."""
+    return tuple(ipaddress.ip_network(item.strip(), strict=False) for item in value.split(",") if item.strip())
+
+
+def _is_trusted(address: str, trusted_proxies) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request: Request, trusted_proxies: Iterable = ()) -> str:
+    """The address to rate-limit by.
+
+    X-Forwarded-For is anyone's to set, so it is only read when the direct
+    peer is one of `trusted_proxies`; then the client is the right-most
+    address that is not itself a trusted proxy.
+    """
+    peer = request.client.host if request.client else "unknown"
+    if not trusted_proxies or not _is_trusted(peer, trusted_proxies):
+        return peer
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded:
+        return peer
+    hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not _is_trusted(hop, trusted_proxies):
+            return hop
+    return hops[0] if hops else peer
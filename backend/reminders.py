@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date as date_cls, datetime, timedelta, timezone, tzinfo
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from timezones import get_zone
+
+logger = logging.getLogger(__name__)
+
+PRAYERS = ("fajr", "dhuhr", "asr", "maghrib", "isha")
+
+
+# ==================== CLOCKS ====================
+
+class SystemClock:
+    def now(self) -> float:
+        return time.time()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class SimulatedClock:
+    """Clock for tests and simulations; time only moves when advanced."""
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._changed = asyncio.Event()
+
+    def now(self) -> float:
+        return self._now
+
+    async def sleep(self, seconds: float):
+        wake_at = self._now + seconds
+        while self._now < wake_at:
+            self._changed.clear()
+            await self._changed.wait()
+
+    def advance(self, seconds: float):
+        self._now += seconds
+        self._changed.set()
+
+
+# ==================== SINKS ====================
+
+@dataclass
+class ReminderBatch:
+    mosque_id: str
+    prayer: str
+    fire_at: float
+    subscribers: List[str]
+
+
+# One reminder per mosque, prayer and local date, whatever its time
+ReminderKey = Tuple[str, str, str]
+
+
+class LogSink:
+    async def deliver(self, batch: ReminderBatch):
+        logger.info(f"Reminder {batch.prayer} at mosque {batch.mosque_id} for {len(batch.subscribers)} subscribers")
+
+
+class WebhookSink:
+    """POSTs each batch as JSON through the shared HTTP client.
+
+    `http` returns the client when called, so it is only built once a
+    reminder is actually sent.
+    """
+
+    def __init__(self, url: str, http: Callable[[], object], timeout: float = 5):
+        self.url = url
+        self.http = http
+        self.timeout = timeout
+
+    async def deliver(self, batch: ReminderBatch):
+        payload = {
+            "mosque_id": batch.mosque_id,
+            "prayer": batch.prayer,
+            "fire_at": datetime.fromtimestamp(batch.fire_at, timezone.utc).isoformat(),
+            "subscribers": batch.subscribers,
+        }
+        response = await self.http().post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class WebPushSink:
+    """Placeholder until push subscriptions (VAPID keys, endpoints) are stored."""
+
+    async def deliver(self, batch: ReminderBatch):
+        logger.debug(f"Web Push not configured; dropping {len(batch.subscribers)} {batch.prayer} reminders")
+
+
+def make_sink(kind: str, webhook_url: Optional[str] = None, http: Optional[Callable[[], object]] = None):
+    if kind == "webhook":
+        if not webhook_url:
+            raise ValueError("REMINDER_WEBHOOK_URL is required for the webhook sink")
+        if http is None:
+            raise ValueError("The webhook sink needs an HTTP client")
+        return WebhookSink(webhook_url, http)
+    if kind == "webpush":
+        return WebPushSink()
+    return LogSink()
+
+
+# ==================== DISPATCHER ====================
+
+class ReminderDispatcher:
+    """Fires prayer reminders to subscribers of each mosque.
+
+    Everyone subscribed to a mosque shares its prayer timestamps, so the
+    schedule holds one heap entry per (mosque, prayer) rather than one per
+    subscriber, and each firing is sent as batches of subscriber ids. Memory
+    is the subscriber sets plus five entries per scheduled mosque-day.
+
+    A reminder is identified by mosque, prayer and date: scheduling it again
+    at another time (an admin edited the times) moves it, and once fired it
+    does not fire again that day. With several worker processes each runs a
+    dispatcher; `claim(mosque_id, prayer, day)` must return True in exactly
+    one of them (see repositories' reminder claims), so each reminder is
+    sent once. Sinks are called concurrently, each with `sink_timeout`.
+    """
+
+    def __init__(self, sinks, clock=None, batch_size: int = 1000,
+                 claim: Optional[Callable[[str, str, str], Awaitable[bool]]] = None, sink_timeout: float = 10):
+        self.sinks = list(sinks)
+        self.clock = clock or SystemClock()
+        self.batch_size = batch_size
+        self.claim = claim
+        self.sink_timeout = sink_timeout
+        self.subscriptions: Dict[str, Set[str]] = {}
+        self._heap = []
+        self._scheduled: Dict[ReminderKey, float] = {}  # key -> current fire_at
+        self._fired: Dict[ReminderKey, float] = {}
+        self._wakeup = asyncio.Event()
+        self.fired = 0
+        self.delivered = 0
+
+    # ----- subscriptions -----
+
+    def subscribe(self, mosque_id: str, subscriber_id: str):
+        self.subscriptions.setdefault(mosque_id, set()).add(subscriber_id)
+
+    def unsubscribe(self, mosque_id: str, subscriber_id: str):
+        subscribers = self.subscriptions.get(mosque_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber_id)
+            if not subscribers:
+                del self.subscriptions[mosque_id]
+
+    def replace_subscriptions(self, subscriptions: Dict[str, Set[str]]):
+        """Swap in the full set, dropping unsubscribes made by other workers."""
+        self.subscriptions = {mosque_id: subscribers for mosque_id, subscribers in subscriptions.items() if subscribers}
+
+    @property
+    def subscription_count(self) -> int:
+        return sum(len(s) for s in self.subscriptions.values())
+
+    # ----- schedule -----
+
+    def schedule(self, mosque_id: str, prayer: str, fire_at: float, day: Optional[str] = None):
+        """Schedule or move the reminder for `day` (by default the UTC date of `fire_at`)."""
+        if day is None:
+            day = datetime.fromtimestamp(fire_at, timezone.utc).date().isoformat()
+        key = (mosque_id, prayer, day)
+        if key in self._fired or self._scheduled.get(key) == fire_at or fire_at < self.clock.now():
+            return
+        # A moved reminder leaves its old heap entry behind; firing skips it
+        self._scheduled[key] = fire_at
+        heapq.heappush(self._heap, (fire_at, mosque_id, prayer, day))
+        self._wakeup.set()
+
+    def schedule_day(self, mosque_id: str, day: str, times: dict, tz: tzinfo = timezone.utc):
+        """Schedule the five prayers of one day from "HH:MM" strings."""
+        base = date_cls.fromisoformat(day)
+        for prayer in PRAYERS:
+            value = times.get(prayer)
+            if not value:
+                continue
+            hour, minute = (int(part) for part in value.split(" ")[0].split(":")[:2])
+            fire_at = datetime(base.year, base.month, base.day, hour, minute, tzinfo=tz).timestamp()
+            self.schedule(mosque_id, prayer, fire_at, day)
+
+    def pending(self) -> int:
+        return len(self._scheduled)
+
+    def forget_before(self, cutoff: float):
+        """Drop fired reminders older than `cutoff`; they can no longer be rescheduled."""
+        self._fired = {key: fire_at for key, fire_at in self._fired.items() if fire_at >= cutoff}
+
+    async def fire_due(self) -> int:
+        now = self.clock.now()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            fire_at, mosque_id, prayer, day = heapq.heappop(self._heap)
+            key = (mosque_id, prayer, day)
+            if self._scheduled.get(key) != fire_at:
+                continue  # moved, or already fired
+            del self._scheduled[key]
+            self._fired[key] = fire_at
+            subscribers = self.subscriptions.get(mosque_id)
+            if subscribers:
+                due.append((key, fire_at, list(subscribers)))
+        fired = sum(await asyncio.gather(*(self._fire(key, fire_at, subscribers)
+                                           for key, fire_at, subscribers in due)))
+        self.fired += fired
+        return fired
+
+    async def _fire(self, key: ReminderKey, fire_at: float, subscribers: List[str]) -> int:
+        mosque_id, prayer, day = key
+        if self.claim is not None:
+            try:
+                if not await self.claim(mosque_id, prayer, day):
+                    return 0  # another worker sends this one
+            except Exception as e:
+                # Skipping risks one missed reminder; sending risks one per worker
+                logger.error(f"Could not claim reminder {key}: {e}")
+                return 0
+        await self._dispatch(mosque_id, prayer, fire_at, subscribers)
+        return 1
+
+    async def _dispatch(self, mosque_id, prayer, fire_at, subscribers):
+        for start in range(0, len(subscribers), self.batch_size):
+            batch = ReminderBatch(mosque_id, prayer, fire_at, subscribers[start:start + self.batch_size])
+            results = await asyncio.gather(
+                *(asyncio.wait_for(sink.deliver(batch), self.sink_timeout) for sink in self.sinks),
+                return_exceptions=True
+            )
+            for sink, result in zip(self.sinks, results):
+                if isinstance(result, asyncio.TimeoutError):
+                    logger.error(f"Reminder sink {type(sink).__name__} timed out after {self.sink_timeout}s")
+                elif isinstance(result, Exception):
+                    logger.error(f"Reminder sink {type(sink).__name__} failed: {result}")
+            self.delivered += len(batch.subscribers)
+
+    async def run(self):
+        while True:
+            await self.fire_due()
+            self._wakeup.clear()
+            delay = self._heap[0][0] - self.clock.now() if self._heap else 3600
+            sleeper = asyncio.ensure_future(self.clock.sleep(max(delay, 0)))
+            waker = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({sleeper, waker}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                sleeper.cancel()
+                waker.cancel()
+
+
+async def load_schedule(dispatcher: ReminderDispatcher, users, resolve_times: Callable[[str, str], Awaitable[Optional[dict]]], days: int = 2):
+    """Load favourites as subscriptions and schedule the next `days` days.
+
+    Safe to call repeatedly: subscriptions are replaced by what is stored,
+    so unsubscribes made on other workers apply; prayers already scheduled
+    are skipped, or moved if their time changed. Times are read in the zone
+    named by their "timezone" field, UTC without one.
+    """
+    subscriptions: Dict[str, Set[str]] = {}
+    async for user_id, mosque_ids in users.favorites():
+        for mosque_id in mosque_ids:
+            subscriptions.setdefault(mosque_id, set()).add(user_id)
+    dispatcher.replace_subscriptions(subscriptions)
+    dispatcher.forget_before(dispatcher.clock.now() - 2 * 86400)
+
+    today = datetime.fromtimestamp(dispatcher.clock.now(), timezone.utc).date()
+    for mosque_id in list(dispatcher.subscriptions):
+        for offset in range(days):
+            day = (today + timedelta(days=offset)).isoformat()
+            times = await resolve_times(mosque_id, day)
+            if times:
+                dispatcher.schedule_day(mosque_id, day, times, get_zone(times.get('timezone')))
+
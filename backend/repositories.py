@@ -0,0 +1,1082 @@
+import bisect
+import contextvars
+import math
+from contextlib import contextmanager
+from datetime import date as date_cls, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from feeds import DEFAULT_FEED_SIZE, FeedStore
+from write_behind import WriteBehindFull
+
+# Pending counts reported to moderators, keyed as in moderation_counters
+PENDING_ADMINS = "pending_admins"
+PENDING_POSTS = "pending_posts"
+
+# Listings never need ID proof blobs or password hashes
+PRIVATE_USER_FIELDS = ("id_proof", "password_hash")
+USER_SUMMARY_PROJECTION = {"_id": 0, **{field: 0 for field in PRIVATE_USER_FIELDS}}
+
+KM_PER_DEGREE = 111.2
+
+# Reminders are scheduled at most two days ahead, so older claims are dead
+REMINDER_CLAIM_TTL_SECONDS = 3 * 86400
+
+# Keyset position of the last item on the previous page: (created_at, id)
+PageAfter = Optional[Tuple[str, str]]
+
+# Both storages below expose the same async repositories:
+#   mosques       get, get_many, list, in_region, near, insert, update, timezones, all
+#   users         get, get_by_email, insert, set_status, moderate_pending_admins,
+#                 add_favorite, remove_favorite, pending_admins, count_pending_admins,
+#                 favorites, all
+#   prayer_times  get, range, manual_since, insert, insert_missing, replace, all
+#                 (insert_missing(docs, deferred=True) may queue the writes)
+#   posts         insert, list, latest_approved, set_status, moderate_pending,
+#                 pending, count_pending, rebuild_feeds, all
+#   jobs          insert, get, claim, renew, progress, finish, release (jobs.py)
+#   images        get, insert_if_absent, all
+#   uploads       write_chunk, chunks, delete, all (raw upload bytes, one document per chunk)
+#   reminders     claim (one worker sends each reminder; reminders.py)
+#   revocations   revoke, since (token revocations shared by workers; auth_tokens.py)
+# plus pending_counts(), seed_pending_counts(), rebuild_pending_counts() and
+# ensure_indexes().
+# Documents are plain dicts without _id, with created_at as an ISO string.
+
+# Read-only routes call allow_secondary_reads() so the Mongo repositories
+# may serve mosque, approved-post and prayer-time reads from a secondary.
+# Writes, and reads anywhere else, always go to the primary.
+secondary_reads: contextvars.ContextVar[bool] = contextvars.ContextVar('secondary_reads', default=False)
+
+
+def allow_secondary_reads():
+    secondary_reads.set(True)
+
+
+@contextmanager
+def primary_reads():
+    """For a read that must see a write the same request just made."""
+    token = secondary_reads.set(False)
+    try:
+        yield
+    finally:
+        secondary_reads.reset(token)
+
+
+def _bounding_box(latitude: float, longitude: float, radius_km: float):
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(0.01, math.cos(math.radians(latitude))))
+    return (latitude - lat_delta, latitude + lat_delta), (longitude - lng_delta, longitude + lng_delta)
+
+
+def _by_distance(docs: Iterable[dict], latitude: float, longitude: float, radius_km: float, limit: int) -> List[dict]:
+    """Docs within radius_km, nearest first (equirectangular distance)."""
+    scale = math.cos(math.radians(latitude))
+    ranked = []
+    for doc in docs:
+        d_lat = doc['latitude'] - latitude
+        d_lng = (doc['longitude'] - longitude) * scale
+        distance = math.hypot(d_lat, d_lng) * KM_PER_DEGREE
+        if distance <= radius_km:
+            ranked.append((distance, doc['id'], doc))
+    ranked.sort(key=lambda item: item[:2])
+    return [doc for _, _, doc in ranked[:limit]]
+
+
+# ==================== MONGO ====================
+
+def _after_query(after: PageAfter) -> dict:
+    created_at, item_id = after
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": item_id}}
+    ]}
+
+
+async def _mongo_page(collection, query: dict, projection: dict, limit: int, after: PageAfter) -> List[dict]:
+    if after:
+        query = {"$and": [query, _after_query(after)]}
+    return await collection.find(query, projection).sort([("created_at", -1), ("id", -1)]).limit(limit).to_list(limit)
+
+
+class MongoCounters:
+    """Counts kept in moderation_counters and adjusted on every transition
+    into or out of "pending", so dashboards never count documents.
+
+    A counter only moves once seeded from a real count (at warm-up): an
+    $inc on a missing counter would start it from zero and, with pending
+    documents already in the database, drive it negative.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def adjust(self, counter: str, delta: int):
+        if delta:
+            await self.collection.update_one({"id": counter}, {"$inc": {"count": delta}})
+
+    async def seed(self, counts: Dict[str, int]):
+        """Create missing counters; existing ones are left as they are."""
+        from pymongo.errors import DuplicateKeyError
+
+        for counter, count in counts.items():
+            try:
+                await self.collection.update_one({"id": counter}, {"$setOnInsert": {"count": count}}, upsert=True)
+            except DuplicateKeyError:
+                pass  # another worker seeded it first
+
+    async def set(self, counts: Dict[str, int]):
+        for counter, count in counts.items():
+            await self.collection.update_one({"id": counter}, {"$set": {"count": count}}, upsert=True)
+
+    async def get(self, names: Iterable[str]) -> Dict[str, int]:
+        names = list(names)
+        docs = await self.collection.find({"id": {"$in": names}}, {"_id": 0}).to_list(len(names))
+        return {doc['id']: doc['count'] for doc in docs}
+
+
+class _SecondaryReadable:
+    """`reader` is the secondary-preferring handle when the route allows it."""
+
+    collection = None
+    replica = None
+
+    @property
+    def reader(self):
+        return self.replica if secondary_reads.get() else self.collection
+
+
+class MongoMosqueRepository(_SecondaryReadable):
+    def __init__(self, collection, replica=None):
+        self.collection = collection
+        self.replica = replica if replica is not None else collection
+
+    async def get(self, mosque_id: str) -> Optional[dict]:
+        return await self.reader.find_one({"id": mosque_id}, {"_id": 0})
+
+    async def get_many(self, mosque_ids: List[str]) -> List[dict]:
+        return await self.reader.find({"id": {"$in": mosque_ids}}, {"_id": 0}).to_list(len(mosque_ids))
+
+    async def list(self, limit: int = 1000) -> List[dict]:
+        return await self.reader.find({}, {"_id": 0}).limit(limit).to_list(limit)
+
+    async def in_region(self, country: str, state: Optional[str] = None, city: Optional[str] = None,
+                        limit: int = 10_000) -> List[dict]:
+        query = {"country": country}
+        if state:
+            query['state'] = state
+        if city:
+            query['city'] = city
+        return await self.reader.find(query, {"_id": 0}).sort("id", 1).limit(limit).to_list(limit)
+
+    async def near(self, latitude: float, longitude: float, radius_km: float, limit: int = 10) -> List[dict]:
+        (lat_min, lat_max), (lng_min, lng_max) = _bounding_box(latitude, longitude, radius_km)
+        docs = await self.reader.find(
+            {"latitude": {"$gte": lat_min, "$lte": lat_max}, "longitude": {"$gte": lng_min, "$lte": lng_max}},
+            {"_id": 0, "id": 1, "latitude": 1, "longitude": 1}
+        ).to_list(1000)
+        return _by_distance(docs, latitude, longitude, radius_km, limit)
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one({**doc})
+
+    async def update(self, mosque_id: str, fields: dict) -> bool:
+        result = await self.collection.update_one({"id": mosque_id}, {"$set": fields})
+        return result.matched_count > 0
+
+    async def timezones(self) -> AsyncIterator[Tuple[str, str]]:
+        async for doc in self.collection.find({"timezone": {"$type": "string"}}, {"_id": 0, "id": 1, "timezone": 1}):
+            yield doc['id'], doc['timezone']
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for doc in self.collection.find({}, {"_id": 0}):
+            yield doc
+
+
+class MongoUserRepository:
+    """With `write_behind` (write_behind.py) favourite changes are queued and
+    applied in batches, so they show up in reads up to one window late."""
+
+    def __init__(self, collection, counters: MongoCounters, write_behind=None):
+        self.collection = collection
+        self.counters = counters
+        self.write_behind = write_behind
+
+    async def get(self, user_id: str, summary: bool = False) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, USER_SUMMARY_PROJECTION if summary else {"_id": 0})
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one({**doc})
+        if doc['role'] == "admin" and doc['status'] == "pending":
+            await self.counters.adjust(PENDING_ADMINS, 1)
+
+    async def set_status(self, user_id: str, status: str) -> Optional[dict]:
+        """Set a user's status; returns their role and previous status."""
+        from pymongo import ReturnDocument
+
+        previous = await self.collection.find_one_and_update(
+            {"id": user_id},
+            {"$set": {"status": status}},
+            projection={"_id": 0, "role": 1, "status": 1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous and previous['role'] == "admin" and previous['status'] == "pending" and status != "pending":
+            await self.counters.adjust(PENDING_ADMINS, -1)
+        return previous
+
+    async def moderate_pending_admins(self, user_ids: List[str], status: str) -> List[str]:
+        """Move pending admins to `status`; returns the ids that moved."""
+        # Only pending admins move, so the counter stays exact when an id is
+        # repeated, unknown or already moderated
+        pending = {"id": {"$in": user_ids}, "role": "admin", "status": "pending"}
+        ids = [doc['id'] for doc in await self.collection.find(pending, {"_id": 0, "id": 1}).to_list(len(user_ids))]
+        if not ids:
+            return []
+        result = await self.collection.update_many({**pending, "id": {"$in": ids}}, {"$set": {"status": status}})
+        await self.counters.adjust(PENDING_ADMINS, -result.modified_count)
+        if result.modified_count < len(ids):
+            # A concurrent batch moderated some of them; keep only ours
+            moved = await self.collection.find({"id": {"$in": ids}, "status": status}, {"_id": 0, "id": 1}).to_list(len(ids))
+            ids = [doc['id'] for doc in moved]
+        return ids
+
+    async def add_favorite(self, user_id: str, mosque_id: str) -> bool:
+        return await self._update_favorites(user_id, mosque_id, {"$addToSet": {"favorite_mosques": mosque_id}})
+
+    async def remove_favorite(self, user_id: str, mosque_id: str) -> bool:
+        return await self._update_favorites(user_id, mosque_id, {"$pull": {"favorite_mosques": mosque_id}})
+
+    async def _update_favorites(self, user_id: str, mosque_id: str, update: dict) -> bool:
+        if self.write_behind is None:
+            result = await self.collection.update_one({"id": user_id}, update)
+            return result.matched_count > 0
+        from pymongo import UpdateOne
+
+        if not await self.collection.find_one({"id": user_id}, {"_id": 1}):
+            return False
+        # Adding then removing the same favourite within a window is one write
+        try:
+            await self.write_behind.put(self.collection, ("favorite", user_id, mosque_id),
+                                        UpdateOne({"id": user_id}, update))
+        except WriteBehindFull:
+            # The queue is backed up on a failing database: write now, and
+            # fail the request if the database is still down
+            await self.collection.update_one({"id": user_id}, update)
+        return True
+
+    async def pending_admins(self, limit: int = 1000, after: PageAfter = None) -> List[dict]:
+        """Pending admin summaries, newest first."""
+        return await _mongo_page(self.collection, {"role": "admin", "status": "pending"},
+                                 USER_SUMMARY_PROJECTION, limit, after)
+
+    async def count_pending_admins(self) -> int:
+        return await self.collection.count_documents({"role": "admin", "status": "pending"})
+
+    async def favorites(self) -> AsyncIterator[Tuple[str, List[str]]]:
+        async for user in self.collection.find({"favorite_mosques.0": {"$exists": True}},
+                                               {"_id": 0, "id": 1, "favorite_mosques": 1}):
+            yield user['id'], user['favorite_mosques']
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for doc in self.collection.find({}, {"_id": 0}):
+            yield doc
+
+
+class MongoPrayerTimeRepository(_SecondaryReadable):
+    def __init__(self, collection, replica=None, write_behind=None):
+        self.collection = collection
+        self.replica = replica if replica is not None else collection
+        self.write_behind = write_behind
+
+    async def get(self, mosque_id: str, date: str) -> Optional[dict]:
+        """The day's times, preferring a manual entry over cached API times."""
+        docs = await self.reader.find(
+            {"mosque_id": mosque_id, "date": date}, {"_id": 0}
+        ).sort("is_manual", -1).to_list(1)
+        return docs[0] if docs else None
+
+    async def range(self, mosque_ids: List[str], start: str, end: str) -> List[dict]:
+        """Every stored row for these mosques from start to end inclusive; a
+        day may have both a manual and a cached row."""
+        return await self.reader.find(
+            {"mosque_id": {"$in": mosque_ids}, "date": {"$gte": start, "$lte": end}}, {"_id": 0}
+        ).to_list(None)
+
+    async def manual_since(self, after: str) -> List[dict]:
+        """Manual rows set at or after `after` (an ISO timestamp), from the primary."""
+        return await self.collection.find(
+            {"is_manual": True, "created_at": {"$gte": after}}, {"_id": 0}
+        ).to_list(None)
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one({**doc})
+
+    async def insert_missing(self, docs: List[dict], deferred: bool = False) -> int:
+        """Bulk insert, skipping mosque-days that already have a row.
+
+        Deferred inserts go through the write-behind queue, if there is one,
+        as upserts that leave an existing row alone; they return the number
+        queued and are readable after the next flush. While the queue is full
+        on a failing database the rest are skipped: they are cached upstream
+        times, fetched again on the next miss.
+        """
+        if not docs:
+            return 0
+        if deferred and self.write_behind is not None:
+            from pymongo import UpdateOne
+
+            queued = 0
+            for doc in docs:
+                try:
+                    await self.write_behind.put(
+                        self.collection, ("prayer_times", doc['mosque_id'], doc['date']),
+                        UpdateOne({"mosque_id": doc['mosque_id'], "date": doc['date']}, {"$setOnInsert": {**doc}}, upsert=True)
+                    )
+                except WriteBehindFull:
+                    break
+                queued += 1
+            return queued
+        dates = [doc['date'] for doc in docs]
+        existing = set()
+        async for row in self.collection.find(
+            {"mosque_id": {"$in": list({doc['mosque_id'] for doc in docs})},
+             "date": {"$gte": min(dates), "$lte": max(dates)}},
+            {"_id": 0, "mosque_id": 1, "date": 1}
+        ):
+            existing.add((row['mosque_id'], row['date']))
+        missing = [{**doc} for doc in docs if (doc['mosque_id'], doc['date']) not in existing]
+        if missing:
+            await self.collection.insert_many(missing, ordered=False)
+        return len(missing)
+
+    async def replace(self, doc: dict):
+        await self.collection.delete_many({"mosque_id": doc['mosque_id'], "date": doc['date']})
+        await self.collection.insert_one({**doc})
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for doc in self.collection.find({}, {"_id": 0}):
+            yield doc
+
+
+class MongoPostRepository(_SecondaryReadable):
+    """Posts plus the materialized latest-approved feeds (see feeds.py)."""
+
+    def __init__(self, collection, feeds, counters: MongoCounters, feed_size: int = DEFAULT_FEED_SIZE,
+                 replica=None, replica_feeds=None):
+        self.collection = collection
+        self.replica = replica if replica is not None else collection
+        self.replica_feeds = replica_feeds if replica_feeds is not None else feeds
+        self.counters = counters
+        self.feed_store = FeedStore(feeds, collection, feed_size)
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one({**doc})
+        if doc['status'] == "pending":
+            await self.counters.adjust(PENDING_POSTS, 1)
+
+    async def list(self, mosque_id: Optional[str] = None, status: Optional[str] = None, limit: int = 1000) -> List[dict]:
+        query = {}
+        if mosque_id:
+            query['mosque_id'] = mosque_id
+        if status:
+            query['status'] = status
+        # Only approved posts are public; moderation listings stay on the primary
+        reader = self.reader if status == "approved" else self.collection
+        return await reader.find(query, {"_id": 0}).sort("created_at", -1).limit(limit).to_list(limit)
+
+    async def latest_approved(self, mosque_id: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        return await self.feed_store.read(mosque_id, limit, self.replica_feeds if secondary_reads.get() else None)
+
+    async def set_status(self, post_id: str, status: str) -> Optional[dict]:
+        """Set a post's status and keep counters and feeds in step; returns the post as it was."""
+        from pymongo import ReturnDocument
+
+        previous = await self.collection.find_one_and_update(
+            {"id": post_id},
+            {"$set": {"status": status}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+        if previous is None:
+            return None
+
+        if previous['status'] == "pending" and status != "pending":
+            await self.counters.adjust(PENDING_POSTS, -1)
+        if status == "approved" and previous['status'] != "approved":
+            await self.feed_store.add([previous])
+        elif status != "approved" and previous['status'] == "approved":
+            await self.feed_store.remove(previous)
+        return previous
+
+    async def moderate_pending(self, post_ids: List[str], status: str) -> Tuple[int, List[dict]]:
+        """Move pending posts to `status`; returns the count and, when approving, the posts."""
+        pending = {"id": {"$in": post_ids}, "status": "pending"}
+        posts = []
+        if status == "approved":
+            posts = await self.collection.find(pending, {"_id": 0}).to_list(len(post_ids))
+
+        result = await self.collection.update_many(pending, {"$set": {"status": status}})
+        await self.counters.adjust(PENDING_POSTS, -result.modified_count)
+        if posts:
+            await self.feed_store.add(posts)
+        return result.modified_count, [{**post, "status": status} for post in posts]
+
+    async def pending(self, limit: int = 1000, after: PageAfter = None) -> List[dict]:
+        return await _mongo_page(self.collection, {"status": "pending"}, {"_id": 0}, limit, after)
+
+    async def count_pending(self) -> int:
+        return await self.collection.count_documents({"status": "pending"})
+
+    async def rebuild_feeds(self) -> int:
+        return await self.feed_store.rebuild_all()
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for doc in self.collection.find({}, {"_id": 0}):
+            yield doc
+
+
+class MongoImageRepository:
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, image_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": image_id}, {"_id": 0})
+
+    async def insert_if_absent(self, doc: dict):
+        await self.collection.update_one({"id": doc['id']}, {"$setOnInsert": doc}, upsert=True)
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for doc in self.collection.find({}, {"_id": 0}):
+            yield doc
+
+
+class MongoUploadRepository:
+    """Uploaded files stored as they are read, GridFS style: one document per
+    chunk, so no request ever holds a whole file."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def write_chunk(self, upload_id: str, n: int, data: bytes):
+        await self.collection.insert_one({"upload_id": upload_id, "n": n, "data": data})
+
+    async def chunks(self, upload_id: str) -> AsyncIterator[bytes]:
+        async for doc in self.collection.find({"upload_id": upload_id}, {"_id": 0, "data": 1}).sort("n", 1):
+            yield bytes(doc['data'])
+
+    async def delete(self, upload_id: str):
+        await self.collection.delete_many({"upload_id": upload_id})
+
+    async def all(self) -> AsyncIterator[dict]:
+        async for doc in self.collection.find({}, {"_id": 0}):
+            yield {**doc, "data": bytes(doc['data'])}
+
+
+class MongoReminderClaimRepository:
+    """Which worker sends each reminder: the first insert of a key wins, as
+    _id is unique. Claims expire after REMINDER_CLAIM_TTL_SECONDS."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def claim(self, mosque_id: str, prayer: str, day: str) -> bool:
+        from datetime import datetime, timezone
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            await self.collection.insert_one({"_id": f"{mosque_id}|{prayer}|{day}",
+                                              "created_at": datetime.now(timezone.utc)})
+        except DuplicateKeyError:
+            return False
+        return True
+
+
+class MongoRevocationRepository:
+    """Token revocations, one document per user holding the latest. Each
+    expires once no token issued before it can still be valid."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def revoke(self, user_id: str, revoked_at: float, expires_at: float):
+        from datetime import datetime, timezone
+
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$max": {"revoked_at": revoked_at, "expires_at": datetime.fromtimestamp(expires_at, timezone.utc)}},
+            upsert=True
+        )
+
+    async def since(self, revoked_after: float) -> List[Tuple[str, float]]:
+        docs = await self.collection.find({"revoked_at": {"$gt": revoked_after}}).to_list(None)
+        return [(doc['_id'], doc['revoked_at']) for doc in docs]
+
+
+class MongoJobRepository:
+    """Background jobs; see jobs.py. Timestamps are ISO strings in UTC, so
+    they compare in order."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert(self, doc: dict):
+        await self.collection.insert_one({**doc})
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+    async def claim(self, worker: str, now: str, lease_until: str, tries: int = 5) -> Optional[dict]:
+        """Take the highest-priority job that is due, or whose lease ran out."""
+        from pymongo import ReturnDocument
+
+        due = {"$or": [{"status": "queued", "run_after": {"$lte": now}},
+                       {"status": "running", "lease_until": {"$lt": now}}]}
+        for _ in range(tries):
+            candidates = await self.collection.find(due, {"_id": 0, "id": 1}).sort(
+                [("priority", -1), ("run_after", 1)]).to_list(1)
+            if not candidates:
+                return None
+            # Conditional on still being due, so only one worker gets it
+            claimed = {"status": "running", "worker": worker, "lease_until": lease_until, "started_at": now}
+            job = await self.collection.find_one_and_update(
+                {"$and": [{"id": candidates[0]['id']}, due]},
+                {"$set": claimed, "$inc": {"attempts": 1}},
+                projection={"_id": 0},
+                return_document=ReturnDocument.BEFORE
+            )
+            if job:
+                return {**job, **claimed, "attempts": job['attempts'] + 1}
+        return None
+
+    async def renew(self, job_id: str, worker: str, lease_until: str) -> bool:
+        result = await self.collection.update_one({"id": job_id, "worker": worker},
+                                                  {"$set": {"lease_until": lease_until}})
+        return result.matched_count > 0
+
+    async def progress(self, job_id: str, progress: dict):
+        await self.collection.update_one({"id": job_id}, {"$set": {"progress": progress}})
+
+    async def finish(self, job_id: str, worker: str, changes: dict) -> bool:
+        """Apply `changes` if `worker` still holds the job."""
+        result = await self.collection.update_one({"id": job_id, "worker": worker, "status": "running"},
+                                                  {"$set": changes})
+        return result.matched_count > 0
+
+    async def release(self, job_id: str, worker: str):
+        """Queue the job again without counting the interrupted attempt."""
+        await self.collection.update_one(
+            {"id": job_id, "worker": worker, "status": "running"},
+            {"$set": {"status": "queued", "worker": None, "lease_until": None}, "$inc": {"attempts": -1}}
+        )
+
+
+class MongoStorage:
+    """MongoDB repositories. With `replica_db` (the same database opened with
+    a secondary read preference) read-only routes read through it; with
+    `write_behind` favourites and deferred prayer-time inserts are batched."""
+
+    def __init__(self, db, feed_size: int = DEFAULT_FEED_SIZE, replica_db=None, write_behind=None):
+        self.db = db
+        replica = replica_db if replica_db is not None else db
+        self.counters = MongoCounters(db.moderation_counters)
+        self.mosques = MongoMosqueRepository(db.mosques, replica.mosques)
+        self.users = MongoUserRepository(db.users, self.counters, write_behind)
+        self.prayer_times = MongoPrayerTimeRepository(db.prayer_times, replica.prayer_times, write_behind)
+        self.posts = MongoPostRepository(db.posts, db.feeds, self.counters, feed_size,
+                                         replica.posts, replica.feeds)
+        self.images = MongoImageRepository(db.images)
+        self.uploads = MongoUploadRepository(db.upload_chunks)
+        self.jobs = MongoJobRepository(db.jobs)
+        self.reminders = MongoReminderClaimRepository(db.reminder_claims)
+        self.revocations = MongoRevocationRepository(db.token_revocations)
+
+    async def ensure_indexes(self):
+        await self.db.mosques.create_index([("country", 1), ("state", 1), ("city", 1), ("id", 1)])
+        await self.db.mosques.create_index([("latitude", 1), ("longitude", 1)])
+        await self.db.users.create_index([("role", 1), ("status", 1), ("created_at", -1), ("id", -1)])
+        await self.db.posts.create_index([("status", 1), ("created_at", -1), ("id", -1)])
+        await self.db.prayer_times.create_index([("mosque_id", 1), ("date", 1), ("is_manual", -1)])
+        await self.db.prayer_times.create_index([("is_manual", 1), ("created_at", 1)])
+        await self.db.feeds.create_index("id", unique=True)
+        await self.db.upload_chunks.create_index([("upload_id", 1), ("n", 1)], unique=True)
+        await self.db.jobs.create_index("id", unique=True)
+        await self.db.jobs.create_index([("status", 1), ("priority", -1), ("run_after", 1)])
+        await self.db.reminder_claims.create_index("created_at", expireAfterSeconds=REMINDER_CLAIM_TTL_SECONDS)
+        await self.db.moderation_counters.create_index("id", unique=True)
+        await self.db.token_revocations.create_index("revoked_at")
+        await self.db.token_revocations.create_index("expires_at", expireAfterSeconds=0)
+
+    async def rebuild_pending_counts(self) -> Dict[str, int]:
+        counts = await self._count_pending()
+        await self.counters.set(counts)
+        return counts
+
+    async def _count_pending(self) -> Dict[str, int]:
+        return {
+            PENDING_ADMINS: await self.users.count_pending_admins(),
+            PENDING_POSTS: await self.posts.count_pending(),
+        }
+
+    async def seed_pending_counts(self):
+        missing = {PENDING_ADMINS, PENDING_POSTS} - set(await self.counters.get([PENDING_ADMINS, PENDING_POSTS]))
+        if missing:
+            counts = await self._count_pending()
+            await self.counters.seed({name: counts[name] for name in missing})
+
+    async def pending_counts(self) -> Dict[str, int]:
+        counts = await self.counters.get([PENDING_ADMINS, PENDING_POSTS])
+        if len(counts) < 2 or min(counts.values()) < 0:
+            # Not seeded yet, or drifted: count once and store it
+            return await self.rebuild_pending_counts()
+        return counts
+
+
+# ==================== IN-MEMORY ====================
+
+def _sort_key(doc: dict) -> Tuple[str, str]:
+    created_at = doc['created_at']
+    return (created_at if isinstance(created_at, str) else created_at.isoformat(), doc['id'])
+
+
+class _SortedIndex:
+    """Document ids ordered by (created_at, id), read newest first."""
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str]] = []
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, doc: dict):
+        bisect.insort(self._keys, _sort_key(doc))
+
+    def discard(self, doc: dict):
+        key = _sort_key(doc)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def newest(self, limit: Optional[int] = None, after: PageAfter = None) -> List[str]:
+        end = bisect.bisect_left(self._keys, after) if after else len(self._keys)
+        start = max(0, end - limit) if limit else 0
+        return [item_id for _, item_id in reversed(self._keys[start:end])]
+
+
+def _public(doc: dict) -> dict:
+    return {key: value for key, value in doc.items() if key not in PRIVATE_USER_FIELDS}
+
+
+class MemoryMosqueRepository:
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+
+    async def get(self, mosque_id: str) -> Optional[dict]:
+        doc = self._by_id.get(mosque_id)
+        return dict(doc) if doc else None
+
+    async def get_many(self, mosque_ids: List[str]) -> List[dict]:
+        return [dict(self._by_id[mosque_id]) for mosque_id in dict.fromkeys(mosque_ids) if mosque_id in self._by_id]
+
+    async def list(self, limit: int = 1000) -> List[dict]:
+        return [dict(doc) for _, doc in zip(range(limit), self._by_id.values())]
+
+    async def in_region(self, country: str, state: Optional[str] = None, city: Optional[str] = None,
+                        limit: int = 10_000) -> List[dict]:
+        matches = sorted(
+            (doc for doc in self._by_id.values()
+             if doc.get('country') == country
+             and (not state or doc.get('state') == state)
+             and (not city or doc.get('city') == city)),
+            key=lambda doc: doc['id'])
+        return [dict(doc) for doc in matches[:limit]]
+
+    async def near(self, latitude: float, longitude: float, radius_km: float, limit: int = 10) -> List[dict]:
+        (lat_min, lat_max), (lng_min, lng_max) = _bounding_box(latitude, longitude, radius_km)
+        docs = [{"id": doc['id'], "latitude": doc['latitude'], "longitude": doc['longitude']}
+                for doc in self._by_id.values()
+                if doc.get('latitude') is not None and doc.get('longitude') is not None
+                and lat_min <= doc['latitude'] <= lat_max and lng_min <= doc['longitude'] <= lng_max]
+        return _by_distance(docs, latitude, longitude, radius_km, limit)
+
+    async def insert(self, doc: dict):
+        self._by_id[doc['id']] = dict(doc)
+
+    async def update(self, mosque_id: str, fields: dict) -> bool:
+        doc = self._by_id.get(mosque_id)
+        if doc is None:
+            return False
+        doc.update(fields)
+        return True
+
+    async def timezones(self) -> AsyncIterator[Tuple[str, str]]:
+        for doc in list(self._by_id.values()):
+            if doc.get('timezone'):
+                yield doc['id'], doc['timezone']
+
+    async def all(self) -> AsyncIterator[dict]:
+        for doc in list(self._by_id.values()):
+            yield dict(doc)
+
+
+class MemoryUserRepository:
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+        self._by_email: Dict[str, dict] = {}
+        self._pending_admins = _SortedIndex()
+
+    async def get(self, user_id: str, summary: bool = False) -> Optional[dict]:
+        doc = self._by_id.get(user_id)
+        if doc is None:
+            return None
+        return _public(doc) if summary else dict(doc)
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        doc = self._by_email.get(email)
+        return dict(doc) if doc else None
+
+    async def insert(self, doc: dict):
+        doc = {**doc, "favorite_mosques": list(doc.get('favorite_mosques') or [])}
+        self._by_id[doc['id']] = doc
+        self._by_email[doc['email']] = doc
+        if doc['role'] == "admin" and doc['status'] == "pending":
+            self._pending_admins.add(doc)
+
+    async def set_status(self, user_id: str, status: str) -> Optional[dict]:
+        doc = self._by_id.get(user_id)
+        if doc is None:
+            return None
+        previous = {"role": doc['role'], "status": doc['status']}
+        if doc['role'] == "admin":
+            if doc['status'] == "pending":
+                self._pending_admins.discard(doc)
+            if status == "pending":
+                self._pending_admins.add(doc)
+        doc['status'] = status
+        return previous
+
+    async def moderate_pending_admins(self, user_ids: List[str], status: str) -> List[str]:
+        moved = []
+        for user_id in dict.fromkeys(user_ids):
+            doc = self._by_id.get(user_id)
+            if doc and doc['role'] == "admin" and doc['status'] == "pending":
+                await self.set_status(user_id, status)
+                moved.append(user_id)
+        return moved
+
+    async def add_favorite(self, user_id: str, mosque_id: str) -> bool:
+        doc = self._by_id.get(user_id)
+        if doc is None:
+            return False
+        if mosque_id not in doc['favorite_mosques']:
+            doc['favorite_mosques'].append(mosque_id)
+        return True
+
+    async def remove_favorite(self, user_id: str, mosque_id: str) -> bool:
+        doc = self._by_id.get(user_id)
+        if doc is None:
+            return False
+        doc['favorite_mosques'] = [favorite for favorite in doc['favorite_mosques'] if favorite != mosque_id]
+        return True
+
+    async def pending_admins(self, limit: int = 1000, after: PageAfter = None) -> List[dict]:
+        return [_public(self._by_id[user_id]) for user_id in self._pending_admins.newest(limit, after)]
+
+    async def count_pending_admins(self) -> int:
+        return len(self._pending_admins)
+
+    async def favorites(self) -> AsyncIterator[Tuple[str, List[str]]]:
+        for doc in list(self._by_id.values()):
+            if doc['favorite_mosques']:
+                yield doc['id'], list(doc['favorite_mosques'])
+
+    async def all(self) -> AsyncIterator[dict]:
+        for doc in list(self._by_id.values()):
+            yield dict(doc)
+
+
+class MemoryPrayerTimeRepository:
+    def __init__(self):
+        self._by_day: Dict[Tuple[str, str], dict] = {}
+        self._manual: Dict[Tuple[str, str], dict] = {}
+
+    def _set(self, key: Tuple[str, str], doc: dict):
+        self._by_day[key] = dict(doc)
+        if doc.get('is_manual'):
+            self._manual[key] = self._by_day[key]
+        else:
+            self._manual.pop(key, None)
+
+    async def get(self, mosque_id: str, date: str) -> Optional[dict]:
+        doc = self._by_day.get((mosque_id, date))
+        return dict(doc) if doc else None
+
+    async def range(self, mosque_ids: List[str], start: str, end: str) -> List[dict]:
+        first, last = date_cls.fromisoformat(start), date_cls.fromisoformat(end)
+        days = [(first + timedelta(days=offset)).isoformat() for offset in range((last - first).days + 1)]
+        docs = []
+        for mosque_id in mosque_ids:
+            for day in days:
+                doc = self._by_day.get((mosque_id, day))
+                if doc:
+                    docs.append(dict(doc))
+        return docs
+
+    async def manual_since(self, after: str) -> List[dict]:
+        return [dict(doc) for doc in self._manual.values() if doc['created_at'] >= after]
+
+    async def insert(self, doc: dict):
+        key = (doc['mosque_id'], doc['date'])
+        existing = self._by_day.get(key)
+        if existing is None or doc.get('is_manual') or not existing.get('is_manual'):
+            self._set(key, doc)
+
+    async def insert_missing(self, docs: List[dict], deferred: bool = False) -> int:
+        inserted = 0
+        for doc in docs:
+            key = (doc['mosque_id'], doc['date'])
+            if key not in self._by_day:
+                self._set(key, doc)
+                inserted += 1
+        return inserted
+
+    async def replace(self, doc: dict):
+        self._set((doc['mosque_id'], doc['date']), doc)
+
+    async def all(self) -> AsyncIterator[dict]:
+        for doc in list(self._by_day.values()):
+            yield dict(doc)
+
+
+class MemoryPostRepository:
+    """Posts indexed by mosque, by status and by both, newest first.
+
+    The approved indexes double as the latest-approved feeds, so nothing
+    needs materializing.
+    """
+
+    def __init__(self, feed_size: int = DEFAULT_FEED_SIZE):
+        self.feed_size = feed_size
+        self._by_id: Dict[str, dict] = {}
+        self._indexes: Dict[Tuple[Optional[str], Optional[str]], _SortedIndex] = {}
+
+    def _index_keys(self, doc: dict):
+        mosque_id, status = doc['mosque_id'], doc['status']
+        return ((None, None), (mosque_id, None), (None, status), (mosque_id, status))
+
+    def _add_to_indexes(self, doc: dict):
+        for key in self._index_keys(doc):
+            self._indexes.setdefault(key, _SortedIndex()).add(doc)
+
+    def _remove_from_indexes(self, doc: dict):
+        for key in self._index_keys(doc):
+            self._indexes[key].discard(doc)
+
+    async def insert(self, doc: dict):
+        doc = dict(doc)
+        self._by_id[doc['id']] = doc
+        self._add_to_indexes(doc)
+
+    async def list(self, mosque_id: Optional[str] = None, status: Optional[str] = None, limit: int = 1000) -> List[dict]:
+        index = self._indexes.get((mosque_id or None, status or None))
+        if index is None:
+            return []
+        return [dict(self._by_id[post_id]) for post_id in index.newest(limit)]
+
+    async def latest_approved(self, mosque_id: Optional[str] = None, limit: Optional[int] = None) -> List[dict]:
+        return await self.list(mosque_id, "approved", min(limit or self.feed_size, self.feed_size))
+
+    async def set_status(self, post_id: str, status: str) -> Optional[dict]:
+        doc = self._by_id.get(post_id)
+        if doc is None:
+            return None
+        previous = dict(doc)
+        self._remove_from_indexes(doc)
+        doc['status'] = status
+        self._add_to_indexes(doc)
+        return previous
+
+    async def moderate_pending(self, post_ids: List[str], status: str) -> Tuple[int, List[dict]]:
+        moved = []
+        for post_id in dict.fromkeys(post_ids):
+            doc = self._by_id.get(post_id)
+            if doc and doc['status'] == "pending":
+                await self.set_status(post_id, status)
+                moved.append(dict(doc))
+        return len(moved), moved if status == "approved" else []
+
+    async def pending(self, limit: int = 1000, after: PageAfter = None) -> List[dict]:
+        index = self._indexes.get((None, "pending"))
+        if index is None:
+            return []
+        return [dict(self._by_id[post_id]) for post_id in index.newest(limit, after)]
+
+    async def count_pending(self) -> int:
+        index = self._indexes.get((None, "pending"))
+        return len(index) if index else 0
+
+    async def rebuild_feeds(self) -> int:
+        # Feeds are the approved indexes; report how many there are
+        return sum(1 for (mosque_id, status), index in self._indexes.items()
+                   if status == "approved" and len(index))
+
+    async def all(self) -> AsyncIterator[dict]:
+        for doc in list(self._by_id.values()):
+            yield dict(doc)
+
+
+class MemoryImageRepository:
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+
+    async def get(self, image_id: str) -> Optional[dict]:
+        return self._by_id.get(image_id)
+
+    async def insert_if_absent(self, doc: dict):
+        self._by_id.setdefault(doc['id'], doc)
+
+    async def all(self) -> AsyncIterator[dict]:
+        for doc in list(self._by_id.values()):
+            yield doc
+
+
+class MemoryUploadRepository:
+    def __init__(self):
+        self._chunks: Dict[str, Dict[int, bytes]] = {}
+
+    async def write_chunk(self, upload_id: str, n: int, data: bytes):
+        self._chunks.setdefault(upload_id, {})[n] = bytes(data)
+
+    async def chunks(self, upload_id: str) -> AsyncIterator[bytes]:
+        by_n = self._chunks.get(upload_id, {})
+        for n in sorted(by_n):
+            yield by_n[n]
+
+    async def delete(self, upload_id: str):
+        self._chunks.pop(upload_id, None)
+
+    async def all(self) -> AsyncIterator[dict]:
+        for upload_id, by_n in list(self._chunks.items()):
+            for n, data in list(by_n.items()):
+                yield {"upload_id": upload_id, "n": n, "data": data}
+
+
+class MemoryReminderClaimRepository:
+    def __init__(self):
+        self._claimed = set()
+
+    async def claim(self, mosque_id: str, prayer: str, day: str) -> bool:
+        key = (mosque_id, prayer, day)
+        if key in self._claimed:
+            return False
+        self._claimed.add(key)
+        return True
+
+
+class MemoryRevocationRepository:
+    def __init__(self):
+        self._revoked: Dict[str, float] = {}
+
+    async def revoke(self, user_id: str, revoked_at: float, expires_at: float):
+        self._revoked[user_id] = max(revoked_at, self._revoked.get(user_id, 0))
+
+    async def since(self, revoked_after: float) -> List[Tuple[str, float]]:
+        return [(user_id, at) for user_id, at in self._revoked.items() if at > revoked_after]
+
+
+class MemoryJobRepository:
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+
+    async def insert(self, doc: dict):
+        self._by_id[doc['id']] = dict(doc)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = self._by_id.get(job_id)
+        return dict(job) if job else None
+
+    async def claim(self, worker: str, now: str, lease_until: str, tries: int = 5) -> Optional[dict]:
+        # `tries` bounds Mongo's retries on a lost race; there are none here
+        due = [job for job in self._by_id.values()
+               if (job['status'] == "queued" and job['run_after'] <= now)
+               or (job['status'] == "running" and job['lease_until'] < now)]
+        if not due:
+            return None
+        job = min(due, key=lambda job: (-job['priority'], job['run_after']))
+        job.update(status="running", worker=worker, lease_until=lease_until, started_at=now,
+                   attempts=job['attempts'] + 1)
+        return dict(job)
+
+    async def renew(self, job_id: str, worker: str, lease_until: str) -> bool:
+        job = self._by_id.get(job_id)
+        if job is None or job['worker'] != worker:
+            return False
+        job['lease_until'] = lease_until
+        return True
+
+    async def progress(self, job_id: str, progress: dict):
+        if job_id in self._by_id:
+            self._by_id[job_id]['progress'] = progress
+
+    async def finish(self, job_id: str, worker: str, changes: dict) -> bool:
+        job = self._by_id.get(job_id)
+        if job is None or job['worker'] != worker or job['status'] != "running":
+            return False
+        job.update(changes)
+        return True
+
+    async def release(self, job_id: str, worker: str):
+        if await self.finish(job_id, worker, {"status": "queued", "worker": None, "lease_until": None}):
+            self._by_id[job_id]['attempts'] -= 1
+
+
+class MemoryStorage:
+    """All data in process memory, with the indexes the routes query by.
+
+    Used for in-process tests and for read-only edge nodes, which fill it
+    from another storage at startup with `load_from`.
+    """
+
+    def __init__(self, feed_size: int = DEFAULT_FEED_SIZE):
+        self.mosques = MemoryMosqueRepository()
+        self.users = MemoryUserRepository()
+        self.prayer_times = MemoryPrayerTimeRepository()
+        self.posts = MemoryPostRepository(feed_size)
+        self.images = MemoryImageRepository()
+        self.uploads = MemoryUploadRepository()
+        self.jobs = MemoryJobRepository()
+        self.reminders = MemoryReminderClaimRepository()
+        self.revocations = MemoryRevocationRepository()
+
+    async def ensure_indexes(self):
+        pass
+
+    async def seed_pending_counts(self):
+        pass
+
+    async def rebuild_pending_counts(self) -> Dict[str, int]:
+        return await self.pending_counts()
+
+    async def pending_counts(self) -> Dict[str, int]:
+        return {
+            PENDING_ADMINS: await self.users.count_pending_admins(),
+            PENDING_POSTS: await self.posts.count_pending(),
+        }
+
+    async def load_from(self, source) -> Dict[str, int]:
+        """Copy every document from another storage; returns counts per repository."""
+        counts = {}
+        for name in ("mosques", "users", "prayer_times", "posts", "images", "uploads"):
+            repository = getattr(self, name)
+            count = 0
+            async for doc in getattr(source, name).all():
+                if name == "images":
+                    await repository.insert_if_absent(doc)
+                elif name == "uploads":
+                    await repository.write_chunk(doc['upload_id'], doc['n'], doc['data'])
+                else:
+                    await repository.insert(doc)
+                count += 1
+            counts[name] = count
+        return counts
@@ -1,24 +1,35 @@
+import argparse
 import asyncio
+import math
 import os
+import random
+import time
 from motor.motor_asyncio import AsyncIOMotorClient
 from passlib.context import CryptContext
-from datetime import datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 import uuid
+from repositories import MongoStorage
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-async def seed_database():
-    # MongoDB connection
+def connect():
     mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
     client = AsyncIOMotorClient(mongo_url)
-    db = client[os.environ.get('DB_NAME', 'test_database')]
+    return client, client[os.environ.get('DB_NAME', 'test_database')]
+
+async def seed_database(storage=None):
+    # MongoDB connection unless a storage (e.g. in-memory) is passed in
+    client = None
+    if storage is None:
+        client, db = connect()
+        storage = MongoStorage(db)
     
     print("Seeding database...")
     
     # Create super admin
     superadmin_email = "superadmin@salah.com"
-    existing_superadmin = await db.users.find_one({"email": superadmin_email})
+    existing_superadmin = await storage.users.get_by_email(superadmin_email)
     if not existing_superadmin:
         superadmin = {
             "id": str(uuid.uuid4()),
@@ -30,7 +41,7 @@ async def seed_database():
             "status": "approved",
             "created_at": datetime.now(timezone.utc).isoformat()
         }
-        await db.users.insert_one(superadmin)
+        await storage.users.insert(superadmin)
         print(f"✓ Super admin created: {superadmin_email} / superadmin123")
     else:
         print(f"✓ Super admin already exists: {superadmin_email}")
@@ -72,10 +83,10 @@ async def seed_database():
         }
     ]
     
+    existing_names = {mosque['name'] for mosque in await storage.mosques.list(10000)}
     for mosque_data in mosques_data:
-        existing = await db.mosques.find_one({"name": mosque_data["name"]})
-        if not existing:
-            await db.mosques.insert_one(mosque_data)
+        if mosque_data["name"] not in existing_names:
+            await storage.mosques.insert(mosque_data)
             print(f"✓ Mosque created: {mosque_data['name']}")
         else:
             print(f"✓ Mosque already exists: {mosque_data['name']}")
@@ -84,7 +95,254 @@ async def seed_database():
     print("\n📝 Credentials:")
     print("Super Admin: superadmin@salah.com / superadmin123")
     
-    client.close()
+    if client:
+        client.close()
+
+# ==================== SYNTHETIC DATA ====================
+
+# (city, state, country, latitude, longitude) centres that synthetic mosques
+# are scattered around
+CITY_CENTRES = [
+    ("New York", "New York", "USA", 40.7128, -74.0060),
+    ("Los Angeles", "California", "USA", 34.0522, -118.2437),
+    ("Chicago", "Illinois", "USA", 41.8781, -87.6298),
+    ("Houston", "Texas", "USA", 29.7604, -95.3698),
+    ("Toronto", "Ontario", "Canada", 43.6532, -79.3832),
+    ("London", "England", "UK", 51.5074, -0.1278),
+    ("Birmingham", "England", "UK", 52.4862, -1.8904),
+    ("Paris", "Ile-de-France", "France", 48.8566, 2.3522),
+    ("Berlin", "Berlin", "Germany", 52.5200, 13.4050),
+    ("Istanbul", "Istanbul", "Turkey", 41.0082, 28.9784),
+    ("Cairo", "Cairo", "Egypt", 30.0444, 31.2357),
+    ("Casablanca", "Casablanca-Settat", "Morocco", 33.5731, -7.5898),
+    ("Lagos", "Lagos", "Nigeria", 6.5244, 3.3792),
+    ("Nairobi", "Nairobi", "Kenya", -1.2921, 36.8219),
+    ("Mecca", "Makkah", "Saudi Arabia", 21.3891, 39.8579),
+    ("Riyadh", "Riyadh", "Saudi Arabia", 24.7136, 46.6753),
+    ("Dubai", "Dubai", "UAE", 25.2048, 55.2708),
+    ("Tehran", "Tehran", "Iran", 35.6892, 51.3890),
+    ("Karachi", "Sindh", "Pakistan", 24.8607, 67.0011),
+    ("Lahore", "Punjab", "Pakistan", 31.5204, 74.3587),
+    ("Delhi", "Delhi", "India", 28.7041, 77.1025),
+    ("Hyderabad", "Telangana", "India", 17.3850, 78.4867),
+    ("Mumbai", "Maharashtra", "India", 19.0760, 72.8777),
+    ("Dhaka", "Dhaka", "Bangladesh", 23.8103, 90.4125),
+    ("Kuala Lumpur", "Kuala Lumpur", "Malaysia", 3.1390, 101.6869),
+    ("Jakarta", "Jakarta", "Indonesia", -6.2088, 106.8456),
+    ("Sydney", "New South Wales", "Australia", -33.8688, 151.2093),
+    ("Johannesburg", "Gauteng", "South Africa", -26.2041, 28.0473),
+]
+MOSQUE_PREFIXES = ["Masjid", "Jamia Masjid", "Islamic Center of", "Al-Noor Mosque", "Masjid Al-Rahman", "Central Mosque"]
+POST_STATUSES = ["approved"] * 7 + ["pending"] * 2 + ["rejected"]
+PRAYERS = ("fajr", "dhuhr", "asr", "maghrib", "isha")
+
+
+class SeedProgress:
+    """Prints inserted counts and overall documents/second per collection."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counts = {}
+
+    def add(self, collection, count):
+        self.counts[collection] = self.counts.get(collection, 0) + count
+        total = sum(self.counts.values())
+        rate = total / (time.perf_counter() - self.start)
+        print(f"\r  {collection}: {self.counts[collection]:>9,}  total {total:>10,}  ({rate:,.0f} docs/s)", end="", flush=True)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        total = sum(self.counts.values())
+        print(f"\n✓ Inserted {total:,} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+        for collection, count in self.counts.items():
+            print(f"  {collection}: {count:,}")
+
+
+def seeded_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def clock_time(hours):
+    """HH:MM for a time in hours, rounded to the minute and wrapped past midnight."""
+    hour, minute = divmod(round(hours * 60) % 1440, 60)
+    return f"{hour:02d}:{minute:02d}"
+
+
+def approximate_prayer_times(latitude, longitude, day):
+    """Rough solar-angle prayer times, good enough for realistic test data."""
+    day_of_year = day.timetuple().tm_yday
+    declination = math.radians(23.44) * math.sin(2 * math.pi * (284 + day_of_year) / 365)
+    lat = math.radians(max(-60.0, min(60.0, latitude)))
+
+    def hour_angle(altitude_deg):
+        cos_h = (math.sin(math.radians(altitude_deg)) - math.sin(lat) * math.sin(declination)) / (math.cos(lat) * math.cos(declination))
+        return math.degrees(math.acos(max(-1.0, min(1.0, cos_h)))) / 15
+
+    # Solar noon in local mean time of the nearest 15-degree zone
+    noon = 12 + (round(longitude / 15) * 15 - longitude) / 15
+    asr_altitude = math.degrees(math.atan(1 / (1 + math.tan(abs(lat - declination)))))
+    hours = {
+        "fajr": noon - hour_angle(-15),
+        "dhuhr": noon + 0.05,
+        "asr": noon + hour_angle(asr_altitude),
+        "maghrib": noon + hour_angle(-0.833),
+        "isha": noon + hour_angle(-15),
+    }
+    return {name: clock_time(h) for name, h in hours.items()}
+
+
+def generate_mosques(rng, count, created_at):
+    for i in range(count):
+        city, state, country, lat, lng = rng.choice(CITY_CENTRES)
+        yield {
+            "id": seeded_uuid(rng),
+            "name": f"{rng.choice(MOSQUE_PREFIXES)} {city} {i + 1}",
+            "phone": f"+1{rng.randrange(10**9, 10**10)}",
+            "alternate_phone": None,
+            "address": f"{rng.randrange(1, 9999)} Synthetic Street",
+            "district": f"District {rng.randrange(1, 40)}",
+            "city": city,
+            "state": state,
+            "country": country,
+            "latitude": round(lat + rng.gauss(0, 0.15), 6),
+            "longitude": round(lng + rng.gauss(0, 0.15), 6),
+            "donation_qr_code": None,
+            "created_at": created_at,
+        }
+
+
+def generate_users(rng, count, mosque_ids, password_hash, created_at):
+    for i in range(count):
+        yield {
+            "id": seeded_uuid(rng),
+            "email": f"synthetic_user_{i}@salah.test",
+            "password_hash": password_hash,
+            "role": "user",
+            "mosque_id": None,
+            "id_proof": None,
+            "favorite_mosques": rng.sample(mosque_ids, min(len(mosque_ids), rng.randrange(0, 6))),
+            "status": "approved",
+            "created_at": created_at,
+        }
+
+
+def generate_posts(rng, count, mosque_ids, admin_id, start):
+    for i in range(count):
+        created = start + timedelta(seconds=rng.randrange(365 * 86400))
+        yield {
+            "id": seeded_uuid(rng),
+            "mosque_id": rng.choice(mosque_ids),
+            "admin_id": admin_id,
+            "title": f"Community announcement {i + 1}",
+            "content": "Synthetic post body for scale testing. " * rng.randrange(1, 6),
+            "status": rng.choice(POST_STATUSES),
+            "created_at": created.isoformat(),
+        }
+
+
+def generate_prayer_times(rng, mosques, start, days, created_at):
+    for mosque in mosques:
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            yield {
+                "id": seeded_uuid(rng),
+                "mosque_id": mosque["id"],
+                "date": day.isoformat(),
+                **approximate_prayer_times(mosque["latitude"], mosque["longitude"], day),
+                "is_manual": False,
+                "created_at": created_at,
+            }
+
+
+async def insert_batched(collection, docs, batch_size, progress, dry_run=False, parallel=4):
+    """insert_many in fixed-size unordered batches, keeping a few in flight."""
+    in_flight = set()
+
+    async def flush(batch):
+        if not dry_run:
+            await collection.insert_many(batch, ordered=False)
+        progress.add(collection.name, len(batch))
+
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            in_flight.add(asyncio.ensure_future(flush(batch)))
+            batch = []
+            if len(in_flight) >= parallel:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+    if batch:
+        in_flight.add(asyncio.ensure_future(flush(batch)))
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def seed_synthetic(db, mosques=1000, users=10000, posts=10000, days=365,
+                         seed=42, batch_size=5000, dry_run=False):
+    """Bulk-generate a deterministic dataset for scale testing.
+
+    The same seed always produces the same ids, coordinates and content.
+    Every synthetic user shares one password hash (password "testpass123")
+    so generation is not bound by bcrypt.
+    """
+    rng = random.Random(seed)
+    created_at = datetime(2025, 1, 1, tzinfo=timezone.utc).isoformat()
+    start_day = date(2025, 1, 1)
+    progress = SeedProgress()
+
+    print(f"Generating synthetic data (seed={seed}): {mosques:,} mosques, {users:,} users, "
+          f"{posts:,} posts, {days} days of prayer times")
+
+    mosque_docs = list(generate_mosques(rng, mosques, created_at))
+    mosque_ids = [m["id"] for m in mosque_docs]
+    await insert_batched(db.mosques, mosque_docs, batch_size, progress, dry_run)
+
+    password_hash = pwd_context.hash("testpass123")
+    await insert_batched(db.users, generate_users(rng, users, mosque_ids, password_hash, created_at),
+                         batch_size, progress, dry_run)
+
+    admin_id = seeded_uuid(rng)
+    await insert_batched(db.posts, generate_posts(rng, posts, mosque_ids, admin_id,
+                                                  datetime(2025, 1, 1, tzinfo=timezone.utc)),
+                         batch_size, progress, dry_run)
+
+    await insert_batched(db.prayer_times, generate_prayer_times(rng, mosque_docs, start_day, days, created_at),
+                         batch_size, progress, dry_run)
+    progress.finish()
+
+    if not dry_run:
+        # Raw inserts bypass the repositories, so the pending counters are stale
+        counts = await MongoStorage(db).rebuild_pending_counts()
+        print(f"Rebuilt moderation counters: {counts}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the Salah Reminder database")
+    parser.add_argument("--synthetic", action="store_true", help="Generate a large synthetic dataset")
+    parser.add_argument("--mosques", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=365, help="Days of prayer times per mosque")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--dry-run", action="store_true", help="Generate documents without inserting them")
+    args = parser.parse_args()
+
+    if not args.synthetic:
+        asyncio.run(seed_database())
+        return
+
+    async def run():
+        client, db = connect()
+        try:
+            await seed_synthetic(db, args.mosques, args.users, args.posts, args.days,
+                                 args.seed, args.batch_size, args.dry_run)
+        finally:
+            client.close()
+
+    asyncio.run(run())
 
 if __name__ == "__main__":
-    asyncio.run(seed_database())
+    main()
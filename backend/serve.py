@@ -0,0 +1,302 @@
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from shared_state import SharedGridTimetables, SharedMosqueZones, WarmState, load_warm_state
+
+# Production launcher: N uvicorn workers accepting on one listening socket.
+#
+#   python serve.py --workers 4 --port 8001          preload, then fork
+#   python serve.py --workers 4 --port 8001 --naive  independent workers
+#   python serve.py --compare --workers 4            startup time and memory of both
+#
+# By default server.py is imported once and the immutable warm state (cached
+# cell timetables, mosque zones, the timezone boundary index) is loaded into
+# shared mappings before the heap is frozen and the workers are forked, so
+# they start warm and share one copy. --naive starts every worker as a fresh
+# interpreter that imports and loads everything itself, as
+# `uvicorn --workers N` does. Connections (MongoDB, HTTP) are never shared:
+# each worker opens its own after the fork.
+
+logger = logging.getLogger("serve")
+
+# Days of cell timetables preloaded, from yesterday (zones behind UTC)
+PRELOAD_DAYS = int(os.environ.get('PRELOAD_DAYS', 31))
+
+Worker = Tuple[int, Callable[[], Optional[int]]]  # pid, poll() -> exit code or None
+
+
+def memory_usage(pid: int) -> Dict[str, float]:
+    """RSS and PSS in MB. PSS splits each shared page between the processes
+    mapping it, so summed over the workers it is the memory really used."""
+    usage = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, value = line.split(":", 1)
+                if name in ("Rss", "Pss"):
+                    usage[name.lower()] = int(value.split()[0]) / 1024
+    except OSError:
+        pass
+    return usage
+
+
+def synthetic_warm_state(mosques: int, grid_degrees: float, start, days: int, resolve_zone,
+                         seed: int = 42) -> WarmState:
+    """seed_data's synthetic mosques, with computed timetables for their cells and zones."""
+    import random
+
+    from aladhan import grid_key
+    from seed_data import approximate_prayer_times, generate_mosques
+
+    state = WarmState(start, days)
+    for mosque in generate_mosques(random.Random(seed), mosques, ""):
+        zone = state.zones[mosque['id']] = resolve_zone(mosque['latitude'], mosque['longitude'])
+        grid = grid_key(mosque['latitude'], mosque['longitude'], zone, grid_degrees)
+        if grid not in state.timetables:
+            state.timetables[grid] = {
+                (start + timedelta(days=offset)).isoformat(): approximate_prayer_times(*grid[0], start + timedelta(days=offset))
+                for offset in range(days)
+            }
+    return state
+
+
+async def load_state(server, args) -> WarmState:
+    start = datetime.now(timezone.utc).date() - timedelta(days=1)
+    if args.synthetic_mosques:
+        return synthetic_warm_state(args.synthetic_mosques, server.ALADHAN_GRID_DEGREES, start,
+                                    args.preload_days, server.timezone_resolver.lookup)
+    return await load_warm_state(server.services.storage, server.ALADHAN_GRID_DEGREES, start,
+                                 args.preload_days, server.timezone_resolver.lookup)
+
+
+async def preload(server, args) -> WarmState:
+    state = await load_state(server, args)
+    await asyncio.to_thread(server.timezone_resolver.load)
+    if server.TIMETABLE_STORE_PATH:
+        # Built (if stale) once here instead of by every worker; each worker
+        # maps the same file
+        await server.open_timetable_store()
+    # Connections must not cross the fork: close them and drop everything
+    # built on them, so each worker opens its own
+    await server.services.close()
+    server.services.override()
+    return state
+
+
+def report_ready(server, ready_fd: int):
+    """Tell the launcher once this worker's warm-up has finished."""
+    @server.warm_up.step("launcher")
+    async def announce():
+        os.write(ready_fd, f"{os.getpid()}\n".encode())
+
+
+def serve_worker(server, sock: socket.socket, log_level: str):
+    import uvicorn
+
+    uvicorn.Server(uvicorn.Config(server.app, log_level=log_level)).run(sockets=[sock])
+
+
+def run_naive_worker(args):
+    import server
+
+    @server.warm_up.step("warm_state")
+    async def load_own_state():
+        state = await load_state(server, args)
+        for grid, by_date in state.timetables.items():
+            server.grid_cache.put_many(grid, by_date)
+        server.mosque_timezones.update(state.zones)
+
+    report_ready(server, args.ready_fd)
+    serve_worker(server, socket.socket(fileno=args.worker_fd), args.log_level)
+
+
+def bind(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def build_report(mode: str, seconds: float, pids) -> dict:
+    processes = [{"pid": os.getpid(), "role": "launcher", **memory_usage(os.getpid())}]
+    processes += [{"pid": pid, "role": "worker", **memory_usage(pid)} for pid in sorted(pids)]
+    return {"mode": mode, "workers": len(pids), "startup_seconds": round(seconds, 3), "processes": processes}
+
+
+def print_report(report: dict):
+    print(f"{report['mode']}: {report['workers']} workers ready in {report['startup_seconds']:.2f}s")
+    print(f"  {'pid':>8}  {'role':<9}{'RSS MB':>9}{'PSS MB':>9}")
+    for process in report['processes']:
+        print(f"  {process['pid']:>8}  {process['role']:<9}{process.get('rss', 0):>9.1f}{process.get('pss', 0):>9.1f}")
+    print(f"  {'total':>8}  {'':<9}{sum(p.get('rss', 0) for p in report['processes']):>9.1f}"
+          f"{sum(p.get('pss', 0) for p in report['processes']):>9.1f}", flush=True)
+
+
+def supervise(mode: str, start_worker: Callable[[], Worker], count: int, ready_fd: int, started: float,
+              exit_when_ready: bool) -> Optional[dict]:
+    """Run `count` workers until SIGTERM/SIGINT, replacing any that die."""
+    workers = dict(start_worker() for _ in range(count))
+    ready, pending, report, stopping = set(), b"", None, False
+
+    def stop(signum=None, frame=None):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while workers:
+        if select.select([ready_fd], [], [], 0.2)[0]:
+            pending += os.read(ready_fd, 4096)
+            *lines, pending = pending.split(b"\n")
+            ready.update(int(line) for line in lines if line)
+        if report is None and set(workers) <= ready:
+            report = build_report(mode, time.perf_counter() - started, list(workers))
+            print_report(report)
+            if exit_when_ready:
+                stop()
+        for pid, poll in list(workers.items()):
+            code = poll()
+            if code is None:
+                continue
+            del workers[pid]
+            if stopping:
+                continue
+            if pid not in ready:
+                # Dying before warm-up finished is a bug or bad settings, not bad luck
+                logger.error(f"Worker {pid} exited with {code} while starting; stopping")
+                stop()
+                continue
+            logger.warning(f"Worker {pid} exited with {code}; starting another")
+            new_pid, new_poll = start_worker()
+            workers[new_pid] = new_poll
+    return report
+
+
+def launch(args) -> Optional[dict]:
+    started = time.perf_counter()
+    sock = bind(args.host, args.port)
+    ready_read, ready_write = os.pipe()
+
+    if args.naive:
+        passthrough = ["--preload-days", str(args.preload_days), "--log-level", args.log_level,
+                       "--synthetic-mosques", str(args.synthetic_mosques)]
+
+        def start_worker() -> Worker:
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker-fd", str(sock.fileno()),
+                 "--ready-fd", str(ready_write), *passthrough],
+                pass_fds=(sock.fileno(), ready_write)
+            )
+            return process.pid, process.poll
+    else:
+        import server
+
+        state = asyncio.run(preload(server, args))
+        server.shared_timetables = SharedGridTimetables(server.ALADHAN_GRID_DEGREES, state.start, state.days,
+                                                        state.timetables)
+        server.shared_zones = SharedMosqueZones(state.zones)
+        logger.info(f"Preloaded {len(state.timetables):,} cell timetables and {len(state.zones):,} mosque zones "
+                    f"({(server.shared_timetables.nbytes + server.shared_zones.nbytes) / 1e6:.1f}MB shared)")
+        del state
+        report_ready(server, ready_write)
+        # Objects already on the heap are never collected again, so the
+        # collector does not touch (and copy) their pages in the workers
+        gc.collect()
+        gc.freeze()
+
+        def start_worker() -> Worker:
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                os.close(ready_read)
+                code = 0
+                try:
+                    serve_worker(server, sock, args.log_level)
+                except BaseException:
+                    traceback.print_exc()
+                    code = 1
+                os._exit(code)
+
+            def poll() -> Optional[int]:
+                done, status = os.waitpid(pid, os.WNOHANG)
+                return os.waitstatus_to_exitcode(status) if done else None
+            return pid, poll
+
+    mode = "naive" if args.naive else "preload"
+    report = supervise(mode, start_worker, args.workers, ready_read, started, args.exit_when_ready)
+    if args.report and report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def compare(args):
+    """Start both modes on the same data and compare startup time and memory."""
+    env = {**os.environ, "STORAGE_BACKEND": os.environ.get('STORAGE_BACKEND', 'memory')}
+    reports = []
+    for mode_args in (["--naive"], []):
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), *mode_args, "--exit-when-ready", "--report", output.name,
+                 "--port", "0", "--workers", str(args.workers), "--preload-days", str(args.preload_days),
+                 "--synthetic-mosques", str(args.synthetic_mosques), "--log-level", "warning"],
+                env=env, check=True
+            )
+            reports.append(json.load(open(output.name)))
+
+    print(f"\n{args.workers} workers, {args.synthetic_mosques:,} synthetic mosques, {args.preload_days} days")
+    print(f"  {'mode':<9}{'startup':>9}{'RSS/worker':>12}{'PSS/worker':>12}{'total PSS':>11}")
+    for report in reports:
+        workers = [p for p in report['processes'] if p['role'] == "worker"]
+        print(f"  {report['mode']:<9}{report['startup_seconds']:>8.2f}s"
+              f"{sum(p.get('rss', 0) for p in workers) / len(workers):>10.1f}MB"
+              f"{sum(p.get('pss', 0) for p in workers) / len(workers):>10.1f}MB"
+              f"{sum(p.get('pss', 0) for p in report['processes']):>9.1f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run server.py in several worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--naive", action="store_true", help="Start workers as fresh interpreters, nothing shared")
+    parser.add_argument("--preload-days", type=int, default=PRELOAD_DAYS)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--compare", action="store_true", help="Benchmark both modes instead of serving")
+    parser.add_argument("--synthetic-mosques", type=int, default=0,
+                        help="Preload computed timetables for this many synthetic mosques instead of the database's")
+    parser.add_argument("--exit-when-ready", action="store_true", help="Report startup and memory, then stop")
+    parser.add_argument("--report", help="Write the startup report here as JSON")
+    parser.add_argument("--worker-fd", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--ready-fd", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.compare:
+        args.synthetic_mosques = args.synthetic_mosques or 10_000
+        compare(args)
+    elif args.worker_fd is not None:
+        run_naive_worker(args)
+    else:
+        launch(args)
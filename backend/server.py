@@ -1,34 +1,296 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Form, Response, Request, WebSocket, Header, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Any, List, Optional
 import uuid
-from datetime import datetime, timezone
 import base64
-import requests
-from passlib.context import CryptContext
+import asyncio
+import random
+import secrets
+import time
+from datetime import date as date_cls, datetime, timedelta, timezone
+from uploads import read_upload, json_with_base64, StorageSink, RequestSizeLimitMiddleware, IMAGE_TYPES, ID_PROOF_TYPES
+from images import store_normalized_image, shutdown_executor
+from feed_hub import FeedHub
+from reminders import ReminderDispatcher, load_schedule, make_sink
+from timezones import TimezoneResolver, utc_instants
+from snapshots import build_snapshot
+from timetable_store import TimetableStore, apply_overrides, build_store
+from write_behind import WriteBehindQueue
+from jobs import JobRunner
+import ical
+from prayer_calc import calculate_prayer_times
+import aladhan
+from upstream import CircuitBreaker, CircuitOpenError, SingleFlight, wait_briefly
+import metrics
+from profiling import SamplingProfiler, ProfilingMiddleware
+from auth_tokens import TokenManager
+from rate_limit import Rate, RateLimiter, MemoryRateLimitBackend, MongoRateLimitBackend, AdmissionController, client_ip, parse_trusted_proxies
+from services import Services, WarmUp
+from repositories import MongoStorage, MemoryStorage, PENDING_ADMINS, PENDING_POSTS, allow_secondary_reads, primary_reads
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# Process-wide dependencies: the MongoDB client and database (MONGO_URL,
+# DB_NAME), the HTTP client and the password hasher are built on first use,
+# so importing this module needs neither a database nor those settings.
+# Tests and tools swap them with services.override(db=...).
+services = Services()
+warm_up = WarmUp()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Handlers go through services.storage: MongoDB by default, or
+# STORAGE_BACKEND=memory to keep everything in process. With
+# MEMORY_STORAGE_SOURCE=mongo the memory storage is filled from MongoDB
+# during warm-up and, with READ_ONLY=true, serves as a read-only edge node.
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+MEMORY_STORAGE_SOURCE = os.environ.get('MEMORY_STORAGE_SOURCE')
+READ_ONLY = os.environ.get('READ_ONLY', 'false').lower() == 'true'
+# With MONGO_SECONDARY_READS=true on a replica set, the public read-only
+# routes (mosques, approved posts, prayer times, snapshots, calendars) read
+# from secondaries lagging at most MONGO_MAX_STALENESS_SECONDS (services.py);
+# writes and anything an admin just changed stay on the primary.
+MONGO_SECONDARY_READS = os.environ.get('MONGO_SECONDARY_READS', 'false').lower() == 'true'
+
+# Prayer times upstream. Misses fetch the whole month's calendar for the
+# mosque's grid cell, in the mosque's zone, and store it for every mosque in
+# that cell and zone.
+ALADHAN_BASE_URL = os.environ.get('ALADHAN_BASE_URL', 'http://api.aladhan.com')
+ALADHAN_GRID_DEGREES = float(os.environ.get('ALADHAN_GRID_DEGREES', aladhan.DEFAULT_GRID_DEGREES))
+# Fetched timetables by (cell, zone, date, method), so a mosque without its
+# own row yet is served from its cell before going upstream
+grid_cache = aladhan.GridTimetableCache(int(os.environ.get('GRID_CACHE_DAYS', 200_000)))
+
+# Upstream resilience. A miss waits at most UPSTREAM_WAIT_SECONDS for
+# Aladhan, then gets a stand-in (the mosque's times for an adjacent day, a
+# nearby mosque's, or a local calculation) while the fetch finishes in the
+# background. After ALADHAN_FAILURE_THRESHOLD straight failures the circuit
+# opens and misses get the stand-in at once, without waiting; one probe
+# goes through every ALADHAN_RESET_SECONDS, in the background, until
+# Aladhan answers again.
+aladhan_breaker = CircuitBreaker(
+    "aladhan",
+    failure_threshold=int(os.environ.get('ALADHAN_FAILURE_THRESHOLD', 5)),
+    reset_timeout=float(os.environ.get('ALADHAN_RESET_SECONDS', 30))
+)
+upstream_fetches = SingleFlight()
+UPSTREAM_WAIT_SECONDS = float(os.environ.get('UPSTREAM_WAIT_SECONDS', 2))
+NEARBY_MOSQUE_KM = 25
+
+# Offline coordinate -> IANA zone lookup, and a per-worker memo of each
+# mosque's zone so cached prayer times never need the mosque document
+timezone_resolver = TimezoneResolver()
+mosque_timezones = {}
+MAX_MEMOIZED_MOSQUE_TIMEZONES = 100_000
+
+# Set by the serve.py launcher: (cell, zone) timetables and mosque zones
+# loaded once into shared memory (see shared_state.py) before the workers
+# are forked. Each worker then reads them in place instead of filling its
+# own caches.
+shared_timetables = None
+shared_zones = None
+
+# Offline snapshot bundles (mosque metadata plus up to a year of prayer
+# times), kept per worker for a few minutes since regions are costly to build
+SNAPSHOT_CACHE_SECONDS = int(os.environ.get('SNAPSHOT_CACHE_SECONDS', 300))
+MAX_SNAPSHOT_MOSQUES = 10_000
+MAX_CACHED_SNAPSHOTS = 64
+snapshot_cache = {}
+
+# iCalendar feeds: rendered per (mosque, month) and assembled per request
+calendar_cache = ical.CalendarCache(ttl=int(os.environ.get('CALENDAR_CACHE_SECONDS', 3600)))
+
+# Optional read-side copy of prayer_times in front of the database on the
+# prayer-times route: a memory-mapped file of u16 minutes per mosque and day
+# (timetable_store.py) at TIMETABLE_STORE_PATH, covering TIMETABLE_STORE_DAYS
+# from yesterday and rebuilt every TIMETABLE_STORE_REBUILD_SECONDS. Workers
+# on one host share the file. Unset, every lookup goes to the database.
+# Manual times set on other hosts, or while the store was being built, are
+# patched in every TIMETABLE_STORE_SYNC_SECONDS (an indexed query for manual
+# rows newer than the last applied), and when a store is opened.
+TIMETABLE_STORE_PATH = os.environ.get('TIMETABLE_STORE_PATH')
+TIMETABLE_STORE_DAYS = int(os.environ.get('TIMETABLE_STORE_DAYS', 366))
+TIMETABLE_STORE_REBUILD_SECONDS = int(os.environ.get('TIMETABLE_STORE_REBUILD_SECONDS', 24 * 3600))
+TIMETABLE_STORE_SYNC_SECONDS = float(os.environ.get('TIMETABLE_STORE_SYNC_SECONDS', 5))
+timetable_store = None
+
+# Longest range a snapshot or calendar request may cover
+MAX_RANGE_DAYS = 366
+
+# Upload limits: per file, and per request body (registration carries two
+# files and form fields); larger bodies are refused before they are read
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', 5 * 1024 * 1024))
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', 2 * MAX_UPLOAD_BYTES + 64 * 1024))
+
+# Live feed of approved posts. With POSTS_CHANGE_STREAM enabled every worker
+# follows the posts change stream instead of publishing its own approvals.
+feed_hub = FeedHub()
+use_posts_change_stream = os.environ.get('POSTS_CHANGE_STREAM', 'false').lower() == 'true'
+FEED_HEARTBEAT_SECONDS = 15
+
+# Optional write-behind for small hot writes on MongoDB: favourite changes
+# and cached upstream times for mosques other than the one asked about are
+# queued, coalesced per document and flushed as bulk_writes every
+# WRITE_BEHIND_WINDOW_SECONDS (sooner once WRITE_BEHIND_MAX_BATCH are
+# waiting). They become readable up to one window late. At most
+# WRITE_BEHIND_MAX_PENDING wait at once; shutdown flushes the rest, so only
+# a crash can lose writes, at most one window's. While MongoDB is
+# unreachable a write is tried WRITE_BEHIND_MAX_ATTEMPTS times, and once the
+# queue is full favourites are written directly (and fail) while cached
+# times are skipped.
+WRITE_BEHIND = os.environ.get('WRITE_BEHIND', 'false').lower() == 'true'
+write_behind = WriteBehindQueue(
+    window=float(os.environ.get('WRITE_BEHIND_WINDOW_SECONDS', 0.2)),
+    max_batch=int(os.environ.get('WRITE_BEHIND_MAX_BATCH', 500)),
+    max_pending=int(os.environ.get('WRITE_BEHIND_MAX_PENDING', 10_000)),
+    max_attempts=int(os.environ.get('WRITE_BEHIND_MAX_ATTEMPTS', 3))
+) if WRITE_BEHIND else None
+
+# Background jobs for admin work too slow for a request (feed rebuilds,
+# index builds, prayer-time precomputation): the route queues a job in the
+# jobs collection and answers 202 with its id, GET /api/jobs/{id} reports
+# progress to the admin who queued it. JOB_CONCURRENCY jobs run at once in
+# each worker process; with 0 (and always on read-only nodes) this process
+# only queues them.
+JOB_CONCURRENCY = int(os.environ.get('JOB_CONCURRENCY', 2))
+job_runner = JobRunner(
+    lambda: services.storage.jobs,
+    concurrency=JOB_CONCURRENCY,
+    lease_seconds=float(os.environ.get('JOB_LEASE_SECONDS', 60)),
+    retry_seconds=float(os.environ.get('JOB_RETRY_SECONDS', 5))
+)
+
+# Materialized per-mosque and global "latest approved posts" feeds
+FEED_SIZE = int(os.environ.get('FEED_SIZE', 50))
+services.provide("storage", lambda s: (
+    MemoryStorage(FEED_SIZE) if STORAGE_BACKEND == 'memory'
+    else MongoStorage(s.db, FEED_SIZE, s.replica_db if MONGO_SECONDARY_READS else None, write_behind)
+))
+
+# Server-side prayer reminders for favourite mosques
+reminders_enabled = os.environ.get('REMINDERS_ENABLED', 'false').lower() == 'true'
+# Every worker runs a dispatcher; each reminder is claimed in storage so
+# only one of them sends it. A slow sink is abandoned after the timeout.
+reminder_dispatcher = ReminderDispatcher(
+    [make_sink(kind.strip(), os.environ.get('REMINDER_WEBHOOK_URL'), lambda: services.http)
+     for kind in os.environ.get('REMINDER_SINKS', 'log').split(',')],
+    claim=lambda mosque_id, prayer, day: services.storage.reminders.claim(mosque_id, prayer, day),
+    sink_timeout=float(os.environ.get('REMINDER_SINK_TIMEOUT_SECONDS', 10)),
+) if reminders_enabled else None
+# Also how long an unsubscribe made on another worker can take to apply
+REMINDER_RELOAD_SECONDS = int(os.environ.get('REMINDER_RELOAD_SECONDS', 900))
+
+# Request profiling: sample a fraction of requests, or any request sent with
+# an "X-Profile: <PROFILING_TOKEN>" header. The token only marks requests to
+# profile; reading and clearing the profiles takes a superadmin login.
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+profiler = SamplingProfiler()
+
+# Fraction of requests timed for http_request_duration_seconds and given a
+# Server-Timing header. Timing every request costs ~5% of a trivial route;
+# at 0.05 it stays around 1% ('backend_load_test.py --benchmark metrics'
+# measures it).
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.05))
+
+# Rate limiting (token buckets per client IP and per user) and admission
+# control (in-flight caps per route class). RATE_LIMIT_BACKEND=mongo shares
+# the buckets between workers.
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+# Load balancers / ingress addresses (IPs or CIDRs). X-Forwarded-For is
+# ignored unless the connection comes from one of these.
+TRUSTED_PROXIES = parse_trusted_proxies(os.environ.get('TRUSTED_PROXIES', ''))
+services.provide("rate_limiter", lambda s: RateLimiter(
+    MongoRateLimitBackend(s.db.rate_limits) if RATE_LIMIT_BACKEND == 'mongo' else MemoryRateLimitBackend()
+))
+admission = AdmissionController({
+    "auth": int(os.environ.get('AUTH_CONCURRENCY', 4)),
+    "upstream": int(os.environ.get('UPSTREAM_CONCURRENCY', 16)),
+    "listing": int(os.environ.get('LISTING_CONCURRENCY', 32)),
+})
+AUTH_IP_RATE = Rate.per_minute(int(os.environ.get('AUTH_IP_RATE_PER_MINUTE', 20)))
+AUTH_USER_RATE = Rate.per_minute(int(os.environ.get('AUTH_USER_RATE_PER_MINUTE', 5)))
+PRAYER_TIMES_RATE = Rate.per_minute(int(os.environ.get('PRAYER_TIMES_RATE_PER_MINUTE', 120)))
+LISTING_RATE = Rate.per_minute(int(os.environ.get('LISTING_RATE_PER_MINUTE', 120)))
+
+# Signed access/refresh tokens. JWT_SECRET is required: every worker, and
+# the same workers after a restart, must sign with one key or they refuse
+# each other's tokens. For local development and tests only,
+# INSECURE_RANDOM_JWT_SECRET=true signs with a random key per process.
+# Admin and moderator routes always need a bearer token.
+# REQUIRE_AUTH_TOKENS=true extends that to the per-user routes
+# (favourites); otherwise tokens there are checked only when sent, so
+# existing clients keep working.
+JWT_SECRET = os.environ.get('JWT_SECRET')
+if not JWT_SECRET:
+    if os.environ.get('INSECURE_RANDOM_JWT_SECRET', 'false').lower() != 'true':
+        raise RuntimeError("JWT_SECRET is not set; set it to the same secret for every worker "
+                           "(INSECURE_RANDOM_JWT_SECRET=true allows a random one for local development)")
+    logging.getLogger(__name__).warning(
+        "JWT_SECRET is not set: signing tokens with a random per-process key. Tokens will not "
+        "work across workers or restarts; do not run like this in production")
+    JWT_SECRET = secrets.token_urlsafe(32)
+token_manager = TokenManager(
+    JWT_SECRET,
+    access_ttl=int(os.environ.get('ACCESS_TOKEN_TTL_SECONDS', 900)),
+    refresh_ttl=int(os.environ.get('REFRESH_TOKEN_TTL_SECONDS', 14 * 86400))
+)
+REQUIRE_AUTH_TOKENS = os.environ.get('REQUIRE_AUTH_TOKENS', 'false').lower() == 'true'
+# How often each worker picks up revocations made by the others
+REVOCATION_SYNC_SECONDS = float(os.environ.get('REVOCATION_SYNC_SECONDS', 5))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global use_posts_change_stream
+    app.state.background_tasks = []
+    if use_posts_change_stream and not isinstance(services.storage, MongoStorage):
+        # Only MongoDB has a change stream; without it approvals must be
+        # published by the worker that makes them
+        logger.warning("POSTS_CHANGE_STREAM needs MongoDB storage; publishing approvals locally")
+        use_posts_change_stream = False
+    if use_posts_change_stream:
+        app.state.background_tasks.append(asyncio.create_task(feed_hub.watch_change_stream(services.storage.posts.collection)))
+    if reminder_dispatcher:
+        app.state.background_tasks += [
+            asyncio.create_task(reload_reminders()),
+            asyncio.create_task(reminder_dispatcher.run())
+        ]
+    if TIMETABLE_STORE_PATH:
+        app.state.background_tasks += [
+            asyncio.create_task(refresh_timetable_store()),
+            asyncio.create_task(sync_timetable_overrides())
+        ]
+    app.state.background_tasks.append(asyncio.create_task(sync_revocations()))
+    app.state.background_tasks.append(asyncio.create_task(warm_up.run(logger)))
+    if JOB_CONCURRENCY and not READ_ONLY:
+        job_runner.start()
+    try:
+        yield
+    finally:
+        for task in app.state.background_tasks:
+            task.cancel()
+        await job_runner.close()
+        shutdown_executor()
+        if write_behind:
+            await write_behind.close()
+        await services.close()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+def reject_writes(request: Request):
+    if request.method not in ("GET", "HEAD", "OPTIONS"):
+        raise HTTPException(status_code=405, detail="This server is read-only")
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", dependencies=[Depends(reject_writes)] if READ_ONLY else [])
 
 # ==================== MODELS ====================
 
@@ -46,6 +308,9 @@ class Mosque(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     donation_qr_code: Optional[str] = None  # base64 encoded image
+    donation_qr_sha256: Optional[str] = None
+    donation_qr_image_id: Optional[str] = None  # key into the images collection
+    timezone: Optional[str] = None  # IANA zone, resolved from the coordinates
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MosqueCreate(BaseModel):
@@ -67,7 +332,10 @@ class User(BaseModel):
     password_hash: str
     role: str  # 'user', 'admin', 'superadmin'
     mosque_id: Optional[str] = None
-    id_proof: Optional[str] = None  # base64 encoded for admins
+    id_proof: Optional[str] = None  # base64 encoded, for admins registered before uploads were chunked
+    id_proof_upload_id: Optional[str] = None  # key into the uploads repository
+    id_proof_content_type: Optional[str] = None
+    id_proof_sha256: Optional[str] = None
     favorite_mosques: List[str] = Field(default_factory=list)  # list of mosque IDs
     status: str = "pending"  # 'pending', 'approved', 'rejected'
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -90,6 +358,15 @@ class UserResponse(BaseModel):
     status: str
     created_at: datetime
 
+class LoginResponse(UserResponse):
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
 class PrayerTime(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -129,16 +406,147 @@ class PostCreate(BaseModel):
 class PostUpdate(BaseModel):
     status: str
 
+class ModerationBatch(BaseModel):
+    ids: List[str]
+    status: str
+
+class PendingAdminPage(BaseModel):
+    items: List[UserResponse]
+    next_cursor: Optional[str] = None
+    total: int
+
+class PendingPostPage(BaseModel):
+    items: List[Post]
+    next_cursor: Optional[str] = None
+    total: int
+
+class JobProgress(BaseModel):
+    done: int
+    total: Optional[int] = None
+    message: Optional[str] = None
+
+class Job(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str
+    kind: str
+    params: dict
+    status: str  # 'queued', 'running', 'succeeded', 'failed'
+    priority: int
+    attempts: int
+    max_attempts: int
+    progress: Optional[JobProgress] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None  # the last attempt's, kept while it retries
+    created_by: Optional[str] = None  # id of the admin who queued it
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
 # ==================== HELPER FUNCTIONS ====================
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    return services.hasher.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return services.hasher.verify(plain_password, hashed_password)
 
 async def get_user_by_email(email: str):
-    return await db.users.find_one({"email": email}, {"_id": 0})
+    return await services.storage.users.get_by_email(email)
+
+def to_user_response(user: dict) -> UserResponse:
+    return UserResponse(
+        id=user['id'],
+        email=user['email'],
+        role=user['role'],
+        mosque_id=user.get('mosque_id'),
+        status=user['status'],
+        created_at=datetime.fromisoformat(user['created_at']) if isinstance(user['created_at'], str) else user['created_at']
+    )
+
+def parse_cursor(cursor: Optional[str]):
+    # Cursors are "<created_at>|<id>" of the last item on the previous page
+    if not cursor:
+        return None
+    created_at, _, item_id = cursor.rpartition("|")
+    if not created_at:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return created_at, item_id
+
+async def fetch_page(fetch, limit: int, cursor: Optional[str]):
+    docs = await fetch(limit + 1, parse_cursor(cursor))
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = f"{docs[-1]['created_at']}|{docs[-1]['id']}"
+    return docs, next_cursor
+
+def authorize(*roles: str):
+    """Route dependency returning the caller's token claims.
+
+    With `roles` (admin and moderator routes) a token carrying one of them
+    is required. Without, anonymous callers get None unless
+    REQUIRE_AUTH_TOKENS is set. A token that is sent is always verified.
+    """
+    async def dependency(authorization: Optional[str] = Header(None)):
+        if not authorization or not authorization.lower().startswith("bearer "):
+            if roles or REQUIRE_AUTH_TOKENS:
+                raise HTTPException(status_code=401, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+            return None
+        claims = token_manager.verify(authorization[7:].strip())
+        if roles and claims['role'] not in roles:
+            raise HTTPException(status_code=403, detail="Not allowed")
+        return claims
+    return Depends(dependency)
+
+def revocation_store():
+    # Memory storage filled from MongoDB still shares revocations through it
+    if MEMORY_STORAGE_SOURCE == 'mongo' and isinstance(services.storage, MemoryStorage):
+        return MongoStorage(services.db).revocations
+    return services.storage.revocations
+
+async def revoke_tokens(user_id: str):
+    revoked_at = token_manager.revoke(user_id)
+    await revocation_store().revoke(user_id, revoked_at, revoked_at + token_manager.refresh_ttl)
+
+async def sync_revocations():
+    """Apply revocations made on other workers, every REVOCATION_SYNC_SECONDS."""
+    # Starts with everything that can still matter; later rounds overlap a
+    # little so a worker whose clock runs behind is not missed
+    seen = time.time() - token_manager.refresh_ttl
+    while True:
+        try:
+            revocations = await revocation_store().since(seen - 60)
+            token_manager.apply(revocations)
+            seen = max([seen] + [revoked_at for _, revoked_at in revocations])
+        except Exception as e:
+            logger.error(f"Error syncing token revocations: {e}")
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+
+def check_mosque_admin(claims: Optional[dict], mosque_id: str):
+    if claims and claims['role'] == "admin" and claims.get('mosque_id') != mosque_id:
+        raise HTTPException(status_code=403, detail="Not an admin of this mosque")
+
+def check_same_user(claims: Optional[dict], user_id: str):
+    if claims and claims['role'] != "superadmin" and claims['sub'] != user_id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+
+def rate_limited(route_class: str, rate: Rate, admit: bool = True):
+    """Route dependency: per-IP token bucket, then an admission slot."""
+    async def dependency(request: Request):
+        await services.rate_limiter.check(f"{route_class}:ip:{client_ip(request, TRUSTED_PROXIES)}", rate)
+        if not admit:
+            yield
+            return
+        async with admission.slot(route_class):
+            yield
+    return Depends(dependency)
+
+async def normalize_donation_qr(upload):
+    try:
+        return await store_normalized_image(services.storage.images, upload.data, upload.sha256)
+    except Exception as e:
+        logger.warning(f"Could not normalize donation QR: {e}")
+        raise HTTPException(status_code=400, detail="Invalid image")
 
 # ==================== ROUTES ====================
 
@@ -146,11 +554,19 @@ async def get_user_by_email(email: str):
 async def root():
     return {"message": "Salah Reminder API"}
 
+@api_router.get("/ready")
+async def readiness():
+    status = warm_up.status()
+    # Reported, not gating: with the circuit open requests still get stand-ins
+    status["upstreams"] = {"aladhan": aladhan_breaker.status()}
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 # ========== MOSQUE ROUTES ==========
 
-@api_router.get("/mosques", response_model=List[Mosque])
+@api_router.get("/mosques", response_model=List[Mosque], dependencies=[rate_limited("listing", LISTING_RATE)])
 async def get_mosques():
-    mosques = await db.mosques.find({}, {"_id": 0}).to_list(1000)
+    allow_secondary_reads()
+    mosques = await services.storage.mosques.list(1000)
     for mosque in mosques:
         if isinstance(mosque['created_at'], str):
             mosque['created_at'] = datetime.fromisoformat(mosque['created_at'])
@@ -158,7 +574,8 @@ async def get_mosques():
 
 @api_router.get("/mosques/{mosque_id}", response_model=Mosque)
 async def get_mosque(mosque_id: str):
-    mosque = await db.mosques.find_one({"id": mosque_id}, {"_id": 0})
+    allow_secondary_reads()
+    mosque = await services.storage.mosques.get(mosque_id)
     if not mosque:
         raise HTTPException(status_code=404, detail="Mosque not found")
     if isinstance(mosque['created_at'], str):
@@ -167,30 +584,45 @@ async def get_mosque(mosque_id: str):
 
 @api_router.post("/mosques", response_model=Mosque)
 async def create_mosque(mosque: MosqueCreate):
-    mosque_obj = Mosque(**mosque.model_dump())
+    mosque_obj = Mosque(**mosque.model_dump(), timezone=timezone_resolver.lookup(mosque.latitude, mosque.longitude))
     doc = mosque_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.mosques.insert_one(doc)
+    await services.storage.mosques.insert(doc)
     return mosque_obj
 
 @api_router.post("/mosques/{mosque_id}/donation-qr")
-async def upload_donation_qr(mosque_id: str, file: UploadFile = File(...)):
-    contents = await file.read()
-    base64_encoded = base64.b64encode(contents).decode('utf-8')
+async def upload_donation_qr(mosque_id: str, file: UploadFile = File(...), claims: Optional[dict] = authorize("admin", "superadmin")):
+    check_mosque_admin(claims, mosque_id)
+    upload = await read_upload(file, MAX_UPLOAD_BYTES, IMAGE_TYPES)
+    image = await normalize_donation_qr(upload)
     
-    result = await db.mosques.update_one(
-        {"id": mosque_id},
-        {"$set": {"donation_qr_code": base64_encoded}}
-    )
+    updated = await services.storage.mosques.update(mosque_id, {
+        "donation_qr_code": image['variants']['full'],
+        "donation_qr_sha256": upload.sha256,
+        "donation_qr_image_id": image['id']
+    })
     
-    if result.matched_count == 0:
+    if not updated:
         raise HTTPException(status_code=404, detail="Mosque not found")
     
     return {"message": "QR code uploaded successfully"}
 
+@api_router.get("/images/{image_id}")
+async def get_image(image_id: str, variant: str = "full"):
+    image = await services.storage.images.get(image_id)
+    if not image or variant not in image['variants']:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Content-addressed, so the bytes behind an id never change
+    return Response(
+        content=base64.b64decode(image['variants'][variant]),
+        media_type=image.get('content_type') or "application/octet-stream",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
 # ========== USER/AUTH ROUTES ==========
 
-@api_router.post("/auth/register")
+@api_router.post("/auth/register", dependencies=[rate_limited("auth", AUTH_IP_RATE)])
 async def register_user(
     email: EmailStr = Form(...), 
     password: str = Form(...), 
@@ -214,8 +646,10 @@ async def register_user(
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    # Hash password
-    password_hash = hash_password(password)
+    await services.rate_limiter.check(f"auth:user:{email}", AUTH_USER_RATE)
+    
+    # Hash password (bcrypt is CPU bound, keep it off the event loop)
+    password_hash = await run_in_threadpool(hash_password, password)
     
     mosque_id = None
     
@@ -229,14 +663,20 @@ async def register_user(
         if not id_proof:
             raise HTTPException(status_code=400, detail="ID proof is required for admin registration")
         
-        id_proof_contents = await id_proof.read()
-        id_proof_base64 = base64.b64encode(id_proof_contents).decode('utf-8')
+        # Written to storage chunk by chunk as it is read
+        id_proof_upload = await read_upload(id_proof, MAX_UPLOAD_BYTES, ID_PROOF_TYPES,
+                                            StorageSink(services.storage.uploads))
         
         # Handle donation QR
-        donation_qr_base64 = None
+        donation_qr_upload = None
+        donation_qr_image = None
         if donation_qr:
-            qr_contents = await donation_qr.read()
-            donation_qr_base64 = base64.b64encode(qr_contents).decode('utf-8')
+            try:
+                donation_qr_upload = await read_upload(donation_qr, MAX_UPLOAD_BYTES, IMAGE_TYPES)
+                donation_qr_image = await normalize_donation_qr(donation_qr_upload)
+            except HTTPException:
+                await services.storage.uploads.delete(id_proof_upload.upload_id)
+                raise
         
         # Create mosque
         mosque_obj = Mosque(
@@ -250,12 +690,15 @@ async def register_user(
             country=mosque_country,
             latitude=mosque_latitude,
             longitude=mosque_longitude,
-            donation_qr_code=donation_qr_base64
+            timezone=timezone_resolver.lookup(mosque_latitude, mosque_longitude),
+            donation_qr_code=donation_qr_image['variants']['full'] if donation_qr_image else None,
+            donation_qr_sha256=donation_qr_upload.sha256 if donation_qr_upload else None,
+            donation_qr_image_id=donation_qr_image['id'] if donation_qr_image else None
         )
         
         mosque_doc = mosque_obj.model_dump()
         mosque_doc['created_at'] = mosque_doc['created_at'].isoformat()
-        await db.mosques.insert_one(mosque_doc)
+        await services.storage.mosques.insert(mosque_doc)
         mosque_id = mosque_obj.id
         
         # Create admin user
@@ -264,7 +707,9 @@ async def register_user(
             password_hash=password_hash,
             role=role,
             mosque_id=mosque_id,
-            id_proof=id_proof_base64,
+            id_proof_upload_id=id_proof_upload.upload_id,
+            id_proof_content_type=id_proof_upload.content_type,
+            id_proof_sha256=id_proof_upload.sha256,
             status="pending"
         )
     else:
@@ -278,7 +723,7 @@ async def register_user(
     
     doc = user_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.users.insert_one(doc)
+    await services.storage.users.insert(doc)
     
     return UserResponse(
         id=user_obj.id,
@@ -289,97 +734,98 @@ async def register_user(
         created_at=user_obj.created_at
     )
 
-@api_router.post("/auth/login")
+@api_router.post("/auth/login", response_model=LoginResponse, dependencies=[rate_limited("auth", AUTH_IP_RATE)])
 async def login_user(credentials: UserLogin):
+    await services.rate_limiter.check(f"auth:user:{credentials.email}", AUTH_USER_RATE)
     user = await get_user_by_email(credentials.email)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    if not verify_password(credentials.password, user['password_hash']):
+    if not await run_in_threadpool(verify_password, credentials.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     if user['role'] == 'admin' and user['status'] != 'approved':
         raise HTTPException(status_code=403, detail="Admin account pending approval")
     
-    return UserResponse(
-        id=user['id'],
-        email=user['email'],
-        role=user['role'],
-        mosque_id=user.get('mosque_id'),
-        status=user['status'],
-        created_at=datetime.fromisoformat(user['created_at']) if isinstance(user['created_at'], str) else user['created_at']
-    )
+    return LoginResponse(**to_user_response(user).model_dump(), **token_manager.issue(user))
+
+@api_router.post("/auth/refresh")
+async def refresh_tokens(request: RefreshRequest):
+    claims = token_manager.verify(request.refresh_token, token_type="refresh")
+    # Refresh is the one token path that reads the user, so role and status
+    # changes made since the last refresh take effect here
+    user = await services.storage.users.get(claims['sub'], summary=True)
+    if not user or user['status'] == 'rejected':
+        raise HTTPException(status_code=401, detail="Invalid token", headers={"WWW-Authenticate": "Bearer"})
+    if user['role'] == 'admin' and user['status'] != 'approved':
+        raise HTTPException(status_code=403, detail="Admin account pending approval")
+    return token_manager.issue(user)
 
-@api_router.get("/users/pending", response_model=List[UserResponse])
+@api_router.get("/users/pending", response_model=List[UserResponse], dependencies=[authorize("superadmin"), rate_limited("listing", LISTING_RATE)])
 async def get_pending_admins():
-    users = await db.users.find({"role": "admin", "status": "pending"}, {"_id": 0}).to_list(1000)
-    result = []
-    for user in users:
-        result.append(UserResponse(
-            id=user['id'],
-            email=user['email'],
-            role=user['role'],
-            mosque_id=user.get('mosque_id'),
-            status=user['status'],
-            created_at=datetime.fromisoformat(user['created_at']) if isinstance(user['created_at'], str) else user['created_at']
-        ))
-    return result
-
-@api_router.get("/users/{user_id}/id-proof")
+    users = await services.storage.users.pending_admins(1000)
+    return [to_user_response(user) for user in users]
+
+@api_router.get("/users/{user_id}/id-proof", dependencies=[authorize("superadmin")])
 async def get_user_id_proof(user_id: str):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await services.storage.users.get(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return {"id_proof": user.get('id_proof')}
+    if not user.get('id_proof_upload_id'):
+        return {"id_proof": user.get('id_proof')}
+    # Encoded chunk by chunk on the way out, like it was stored
+    return StreamingResponse(
+        json_with_base64({"content_type": user.get('id_proof_content_type')}, "id_proof",
+                         services.storage.uploads.chunks(user['id_proof_upload_id'])),
+        media_type="application/json"
+    )
 
-@api_router.patch("/users/{user_id}/status")
+@api_router.patch("/users/{user_id}/status", dependencies=[authorize("superadmin")])
 async def update_user_status(user_id: str, status: str):
     if status not in ["approved", "rejected"]:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    result = await db.users.update_one(
-        {"id": user_id},
-        {"$set": {"status": status}}
-    )
+    previous = await services.storage.users.set_status(user_id, status)
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="User not found")
     
+    if status == "rejected":
+        await revoke_tokens(user_id)
+    
     return {"message": "Status updated successfully"}
 
 @api_router.post("/users/{user_id}/favorites/{mosque_id}")
-async def add_favorite_mosque(user_id: str, mosque_id: str):
+async def add_favorite_mosque(user_id: str, mosque_id: str, claims: Optional[dict] = authorize()):
+    check_same_user(claims, user_id)
     # Check if mosque exists
-    mosque = await db.mosques.find_one({"id": mosque_id})
+    mosque = await services.storage.mosques.get(mosque_id)
     if not mosque:
         raise HTTPException(status_code=404, detail="Mosque not found")
     
     # Add to favorites
-    result = await db.users.update_one(
-        {"id": user_id},
-        {"$addToSet": {"favorite_mosques": mosque_id}}
-    )
-    
-    if result.matched_count == 0:
+    if not await services.storage.users.add_favorite(user_id, mosque_id):
         raise HTTPException(status_code=404, detail="User not found")
     
+    if reminder_dispatcher:
+        reminder_dispatcher.subscribe(mosque_id, user_id)
+    
     return {"message": "Mosque added to favorites"}
 
 @api_router.delete("/users/{user_id}/favorites/{mosque_id}")
-async def remove_favorite_mosque(user_id: str, mosque_id: str):
-    result = await db.users.update_one(
-        {"id": user_id},
-        {"$pull": {"favorite_mosques": mosque_id}}
-    )
-    
-    if result.matched_count == 0:
+async def remove_favorite_mosque(user_id: str, mosque_id: str, claims: Optional[dict] = authorize()):
+    check_same_user(claims, user_id)
+    if not await services.storage.users.remove_favorite(user_id, mosque_id):
         raise HTTPException(status_code=404, detail="User not found")
     
+    if reminder_dispatcher:
+        reminder_dispatcher.unsubscribe(mosque_id, user_id)
+    
     return {"message": "Mosque removed from favorites"}
 
-@api_router.get("/users/{user_id}/favorites", response_model=List[Mosque])
+@api_router.get("/users/{user_id}/favorites", response_model=List[Mosque], dependencies=[rate_limited("listing", LISTING_RATE)])
 async def get_favorite_mosques(user_id: str):
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await services.storage.users.get(user_id, summary=True)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -387,7 +833,7 @@ async def get_favorite_mosques(user_id: str):
     if not favorite_ids:
         return []
     
-    mosques = await db.mosques.find({"id": {"$in": favorite_ids}}, {"_id": 0}).to_list(1000)
+    mosques = await services.storage.mosques.get_many(favorite_ids[:1000])
     for mosque in mosques:
         if isinstance(mosque['created_at'], str):
             mosque['created_at'] = datetime.fromisoformat(mosque['created_at'])
@@ -396,90 +842,394 @@ async def get_favorite_mosques(user_id: str):
 
 # ========== PRAYER TIMES ROUTES ==========
 
-@api_router.get("/prayer-times/{mosque_id}")
+async def get_mosque_timezone(mosque_id: str) -> str:
+    zone = mosque_timezones.get(mosque_id) or (shared_zones.get(mosque_id) if shared_zones else None)
+    if zone:
+        return zone
+    mosque = await services.storage.mosques.get(mosque_id)
+    if not mosque:
+        raise HTTPException(status_code=404, detail="Mosque not found")
+    zone = mosque.get('timezone')
+    if not zone:
+        # Mosques created before zones were stored get theirs backfilled
+        zone = timezone_resolver.lookup(mosque.get('latitude'), mosque.get('longitude'))
+        await services.storage.mosques.update(mosque_id, {"timezone": zone})
+    if len(mosque_timezones) >= MAX_MEMOIZED_MOSQUE_TIMEZONES:
+        mosque_timezones.clear()
+    mosque_timezones[mosque_id] = zone
+    return zone
+
+@api_router.get("/prayer-times/{mosque_id}", dependencies=[rate_limited("prayer_times", PRAYER_TIMES_RATE, admit=False)])
 async def get_prayer_times(mosque_id: str, date: str):
-    # First check if manual times exist
-    manual_times = await db.prayer_times.find_one(
-        {"mosque_id": mosque_id, "date": date, "is_manual": True},
-        {"_id": 0}
-    )
-    
-    if manual_times:
-        if isinstance(manual_times.get('created_at'), str):
-            manual_times['created_at'] = datetime.fromisoformat(manual_times['created_at'])
-        return manual_times
+    """Local prayer times plus the mosque's zone and each prayer as a UTC instant.
+
+    When Aladhan could not answer in time the times are a stand-in, marked
+    with "stale": true and a "source" saying where they came from.
+    """
+    try:
+        date_cls.fromisoformat(date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date, expected YYYY-MM-DD")
+    allow_secondary_reads()
+    return await zoned_prayer_times(mosque_id, date)
+
+async def zoned_prayer_times(mosque_id: str, date: str) -> dict:
+    """find_prayer_times with the zone and UTC instants added.
+
+    Reads from wherever the caller's context allows: routes opt in to
+    secondaries, everything else reads the primary.
+    """
+    times = await find_prayer_times(mosque_id, date)
+    if not isinstance(times, dict):
+        times = times.model_dump()
+    zone = await get_mosque_timezone(mosque_id)
+    times['timezone'] = zone
+    times['utc'] = utc_instants(date, times, zone)
+    return times
+
+async def find_prayer_times(mosque_id: str, date: str):
+    if timetable_store:
+        stored = timetable_store.get(mosque_id, date)
+        metrics.record_cache("timetable_store", stored is not None)
+        if stored:
+            return stored
     
-    # Try to get from database (API cache)
-    cached_times = await db.prayer_times.find_one(
-        {"mosque_id": mosque_id, "date": date},
-        {"_id": 0}
-    )
+    # Manual times if an admin set them, otherwise the cached API times
+    cached_times = await services.storage.prayer_times.get(mosque_id, date)
     
     if cached_times:
+        metrics.record_cache("prayer_times", True)
         if isinstance(cached_times.get('created_at'), str):
             cached_times['created_at'] = datetime.fromisoformat(cached_times['created_at'])
         return cached_times
     
-    # Fetch from Aladhan API
-    mosque = await db.mosques.find_one({"id": mosque_id}, {"_id": 0})
+    metrics.record_cache("prayer_times", False)
+    mosque = await services.storage.mosques.get(mosque_id)
     if not mosque:
         raise HTTPException(status_code=404, detail="Mosque not found")
     
-    try:
-        # Parse date
-        date_parts = date.split('-')
-        response = requests.get(
-            f"http://api.aladhan.com/v1/timings/{date}",
-            params={
-                "latitude": mosque.get('latitude', 0),
-                "longitude": mosque.get('longitude', 0),
-                "method": 2  # ISNA method
-            },
-            timeout=10
-        )
-        response.raise_for_status()
-        data = response.json()
-        
-        timings = data['data']['timings']
-        prayer_time_obj = PrayerTime(
-            mosque_id=mosque_id,
-            date=date,
-            fajr=timings['Fajr'],
-            dhuhr=timings['Dhuhr'],
-            asr=timings['Asr'],
-            maghrib=timings['Maghrib'],
-            isha=timings['Isha'],
-            is_manual=False
+    day = date_cls.fromisoformat(date)
+    zone = await get_mosque_timezone(mosque_id)
+    grid = aladhan.grid_key(mosque.get('latitude'), mosque.get('longitude'), zone, ALADHAN_GRID_DEGREES)
+    if grid:
+        shared = shared_timetables.get(grid, date) if shared_timetables else None
+        shared = shared or grid_cache.get(grid, date)
+        metrics.record_cache("prayer_times_grid", shared is not None)
+        if shared:
+            doc = {"id": str(uuid.uuid4()), "mosque_id": mosque_id, "date": date, **shared,
+                   "is_manual": False, "created_at": datetime.now(timezone.utc).isoformat()}
+            # Served from memory now, so the row can be written behind
+            await services.storage.prayer_times.insert_missing([doc], deferred=True)
+            remember_prayer_times([doc])
+            return {**doc, "created_at": datetime.fromisoformat(doc['created_at'])}
+    
+    # One calendar fetch per grid cell, zone and month however many requests miss
+    # at once; it keeps going, and stores its answer, after this request
+    # stops waiting. Both it and the re-read go to the primary, where the
+    # fetched rows land first.
+    breaker_tripped = aladhan_breaker.tripped
+    with primary_reads():
+        fetch = upstream_fetches.run(
+            (grid or mosque_id, day.year, day.month),
+            lambda: fetch_prayer_calendar(mosque, day.year, day.month)
         )
-        
-        # Cache in database
-        doc = prayer_time_obj.model_dump()
-        doc['created_at'] = doc['created_at'].isoformat()
-        await db.prayer_times.insert_one(doc)
-        
-        return prayer_time_obj
+    if breaker_tripped:
+        # Aladhan is down: nothing to wait for. The fetch fails at once, or
+        # is the probe and stores its answer for later requests.
+        return await fallback_prayer_times(mosque, date)
+    try:
+        await wait_briefly(fetch, UPSTREAM_WAIT_SECONDS)
+        with primary_reads():
+            fetched = await services.storage.prayer_times.get(mosque_id, date)
+        if fetched:
+            if isinstance(fetched.get('created_at'), str):
+                fetched['created_at'] = datetime.fromisoformat(fetched['created_at'])
+            return fetched
+    except CircuitOpenError:
+        pass
+    except asyncio.TimeoutError:
+        logger.warning(f"Aladhan slower than {UPSTREAM_WAIT_SECONDS}s for {mosque_id} {date}; serving a stand-in")
     except Exception as e:
         logger.error(f"Error fetching prayer times: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch prayer times")
+    return await fallback_prayer_times(mosque, date)
 
-@api_router.post("/prayer-times", response_model=PrayerTime)
-async def set_manual_prayer_times(prayer_time: PrayerTimeCreate):
-    # Delete existing entry for this date
-    await db.prayer_times.delete_many(
-        {"mosque_id": prayer_time.mosque_id, "date": prayer_time.date}
-    )
+def mosque_zone(mosque: dict) -> str:
+    return mosque.get('timezone') or timezone_resolver.lookup(mosque.get('latitude'), mosque.get('longitude'))
+
+async def fetch_prayer_calendar(mosque: dict, year: int, month: Optional[int] = None) -> int:
+    """Store Aladhan's calendar for a month (or a whole year) for the mosque
+    and every mosque in its grid cell and zone; returns the number of rows
+    written."""
+    zone = await get_mosque_timezone(mosque['id'])
+    grid = aladhan.grid_key(mosque.get('latitude'), mosque.get('longitude'), zone, ALADHAN_GRID_DEGREES)
+    latitude, longitude = grid[0] if grid else (mosque.get('latitude', 0), mosque.get('longitude', 0))
+    # Bound concurrent upstream fetches; excess misses fall back
+    async with admission.slot("upstream"):
+        upstream_start = time.perf_counter()
+        try:
+            async with aladhan_breaker.guard():
+                response = await services.http.get(
+                    f"{ALADHAN_BASE_URL}{aladhan.calendar_path(year, month)}",
+                    # Times in the mosque's zone, not the one Aladhan guesses
+                    # for the cell centre across a border
+                    params={"latitude": latitude, "longitude": longitude, "method": aladhan.METHOD,
+                            "timezonestring": zone}
+                )
+                response.raise_for_status()
+                calendar = aladhan.parse_calendar(response.json())
+        except CircuitOpenError:
+            raise
+        except Exception:
+            metrics.upstream_request_errors.inc("aladhan")
+            raise
+        upstream_elapsed = time.perf_counter() - upstream_start
+        metrics.upstream_request_duration.observe(upstream_elapsed, "aladhan")
+        metrics.record_timing("aladhan", upstream_elapsed)
+    
+    mosque_ids = [mosque['id']]
+    if grid:
+        grid_cache.put_many(grid, calendar)
+        neighbours = await services.storage.mosques.near(*grid[0], aladhan.cell_radius_km(ALADHAN_GRID_DEGREES), limit=1000)
+        mosque_ids += [m['id'] for m in neighbours if m['id'] != mosque['id']
+                       and aladhan.grid_key(m['latitude'], m['longitude'], mosque_zone(m), ALADHAN_GRID_DEGREES) == grid]
+    
+    created_at = datetime.now(timezone.utc).isoformat()
+    docs = [
+        {"id": str(uuid.uuid4()), "mosque_id": mosque_id, "date": day, **times, "is_manual": False, "created_at": created_at}
+        for mosque_id in mosque_ids
+        for day, times in calendar.items()
+    ]
+    # Days that already have times (manual or cached) are left alone. The
+    # requesting mosque's rows are read back at once; its neighbours' can
+    # be written behind.
+    own = [doc for doc in docs if doc['mosque_id'] == mosque['id']]
+    written = await services.storage.prayer_times.insert_missing(own)
+    written += await services.storage.prayer_times.insert_missing(
+        [doc for doc in docs if doc['mosque_id'] != mosque['id']], deferred=True)
+    remember_prayer_times(docs)
+    return written
+
+def remember_prayer_times(docs: List[dict]):
+    """Copy newly stored days into the timetable store, if there is one."""
+    if timetable_store:
+        for doc in docs:
+            timetable_store.put(doc['mosque_id'], doc['date'], doc, doc['is_manual'], doc['created_at'])
+
+async def open_timetable_store():
+    """Open the store at TIMETABLE_STORE_PATH, rebuilding it first if it is
+    missing, does not cover today or is older than the rebuild interval
+    (another worker may have rebuilt it already)."""
+    global timetable_store
+    today = datetime.now(timezone.utc).date()
+    try:
+        store = TimetableStore(TIMETABLE_STORE_PATH)
+    except (OSError, ValueError):
+        store = None
+    if store is None or not store.fresh(today, TIMETABLE_STORE_REBUILD_SECONDS):
+        start = time.perf_counter()
+        count = await build_store(services.storage, TIMETABLE_STORE_PATH, today - timedelta(days=1), TIMETABLE_STORE_DAYS)
+        store = TimetableStore(TIMETABLE_STORE_PATH)
+        logger.info(f"Built timetable store for {count} mosques in {time.perf_counter() - start:.1f}s "
+                    f"({store.nbytes / 1e6:.1f}MB)")
+    # Overrides made since the build, here or on another host
+    await apply_overrides(store, services.storage)
+    timetable_store = store
+
+async def refresh_timetable_store():
+    while True:
+        # Jittered so the workers sharing the file do not all rebuild it;
+        # the first one due rebuilds and the rest find it fresh
+        await asyncio.sleep(TIMETABLE_STORE_REBUILD_SECONDS * random.uniform(1, 1.1))
+        try:
+            await open_timetable_store()
+        except Exception as e:
+            logger.error(f"Error rebuilding the timetable store: {e}")
+
+async def sync_timetable_overrides():
+    """Patch manual times set on other hosts into the store, every TIMETABLE_STORE_SYNC_SECONDS."""
+    while True:
+        await asyncio.sleep(TIMETABLE_STORE_SYNC_SECONDS)
+        try:
+            if timetable_store:
+                await apply_overrides(timetable_store, services.storage)
+        except Exception as e:
+            logger.error(f"Error syncing manual times into the timetable store: {e}")
+
+async def fallback_prayer_times(mosque: dict, date: str) -> dict:
+    """Best stand-in for a day Aladhan has not answered for; never cached."""
+    day = date_cls.fromisoformat(date)
+    source, times = None, None
     
+    # Prayer times move a minute or two a day, so an adjacent day is close
+    for offset, name in ((-1, "previous_day"), (1, "next_day")):
+        times = await services.storage.prayer_times.get(mosque['id'], (day + timedelta(days=offset)).isoformat())
+        if times:
+            source = name
+            break
+    
+    latitude, longitude = mosque.get('latitude'), mosque.get('longitude')
+    if not times and latitude is not None and longitude is not None:
+        for neighbour in await services.storage.mosques.near(latitude, longitude, NEARBY_MOSQUE_KM, limit=5):
+            if neighbour['id'] == mosque['id']:
+                continue
+            times = await services.storage.prayer_times.get(neighbour['id'], date)
+            # Another mosque's manual times are its own congregation times
+            if times and not times.get('is_manual'):
+                source = "nearby_mosque"
+                break
+            times = None
+    
+    if not times:
+        source = "calculated"
+        zone = await get_mosque_timezone(mosque['id'])
+        times = calculate_prayer_times(latitude or 0, longitude or 0, day, zone)
+    
+    metrics.fallback_responses.inc(source)
+    return {
+        **{prayer: times[prayer] for prayer in ("fajr", "dhuhr", "asr", "maghrib", "isha")},
+        "id": str(uuid.uuid4()),
+        "mosque_id": mosque['id'],
+        "date": date,
+        "is_manual": False,
+        "created_at": datetime.now(timezone.utc),
+        "stale": True,
+        "source": source,
+    }
+
+@api_router.post("/prayer-times", response_model=PrayerTime)
+async def set_manual_prayer_times(prayer_time: PrayerTimeCreate, claims: Optional[dict] = authorize("admin", "superadmin")):
+    check_mosque_admin(claims, prayer_time.mosque_id)
     prayer_time_obj = PrayerTime(**prayer_time.model_dump(), is_manual=True)
     doc = prayer_time_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.prayer_times.insert_one(doc)
+    # Replaces any existing entry for this date
+    await services.storage.prayer_times.replace(doc)
+    remember_prayer_times([doc])
+    snapshot_cache.clear()
+    calendar_cache.invalidate(prayer_time.mosque_id, prayer_time.date)
     
     return prayer_time_obj
 
+# ========== CALENDAR ROUTES ==========
+# Stored prayer times as an iCalendar feed that phone calendars subscribe
+# to. Days without stored times are left out rather than fetched upstream.
+
+async def get_calendar_month(mosque: dict, key: tuple) -> ical.MonthBlock:
+    block = calendar_cache.get(key)
+    metrics.record_cache("calendar", block is not None)
+    if block is None:
+        first, last = ical.month_bounds(key[1], key[2])
+        docs = await services.storage.prayer_times.range([mosque['id']], first, last)
+        block = ical.MonthBlock.build(mosque, docs)
+        calendar_cache.put(key, block)
+    return block
+
+@api_router.get("/mosques/{mosque_id}/prayer-times.ics", dependencies=[rate_limited("listing", LISTING_RATE)])
+async def get_prayer_times_calendar(request: Request, mosque_id: str, start: Optional[str] = None, days: int = 30):
+    first, days = parse_day_range(start, days)
+    last = first + timedelta(days=days - 1)
+    allow_secondary_reads()
+    mosque = await services.storage.mosques.get(mosque_id)
+    if not mosque:
+        raise HTTPException(status_code=404, detail="Mosque not found")
+    mosque['timezone'] = await get_mosque_timezone(mosque_id)
+    
+    # Months not cached yet are rendered up front, as the ETag covers them all
+    header = ical.calendar_header(mosque)
+    blocks = [await get_calendar_month(mosque, key) for key in ical.month_keys(mosque_id, first, last)]
+    first_iso, last_iso = first.isoformat(), last.isoformat()
+    etag = ical.feed_etag(header, first_iso, last_iso, blocks)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=3600"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    
+    async def body():
+        yield header
+        for block in blocks:
+            yield block.between(first_iso, last_iso)
+        yield ical.CALENDAR_FOOTER
+    
+    return StreamingResponse(body(), media_type="text/calendar; charset=utf-8", headers=headers)
+
+# ========== SNAPSHOT ROUTES ==========
+# Read-only bundles for offline clients: a gzip-compressed, versioned binary
+# (see snapshots.py) whose content hash is the ETag. Clients holding an older
+# bundle pass ?since=<its as_of> to get only the days changed since as JSON.
+
+def parse_day_range(start: Optional[str], days: int):
+    try:
+        first = date_cls.fromisoformat(start) if start else datetime.now(timezone.utc).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid start date")
+    if not 1 <= days <= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {MAX_RANGE_DAYS}")
+    return first, days
+
+async def cached_snapshot(key: tuple, load_mosques, start, days: int):
+    entry = snapshot_cache.get(key)
+    now = time.monotonic()
+    if entry and entry[0] > now:
+        metrics.record_cache("snapshots", True)
+        return entry[1]
+    metrics.record_cache("snapshots", False)
+    snapshot = await build_snapshot(services.storage, await load_mosques(), start, days)
+    # Compressing a large region takes a while; keep it off the event loop
+    await run_in_threadpool(snapshot.encode)
+    if len(snapshot_cache) >= MAX_CACHED_SNAPSHOTS:
+        snapshot_cache.clear()
+    snapshot_cache[key] = (now + SNAPSHOT_CACHE_SECONDS, snapshot)
+    return snapshot
+
+def snapshot_response(request: Request, snapshot, since: Optional[str]):
+    if since:
+        return JSONResponse(snapshot.delta(since), headers={"Cache-Control": "no-cache"})
+    etag = f'"{snapshot.hash}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={SNAPSHOT_CACHE_SECONDS}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.encode(), media_type="application/octet-stream", headers=headers)
+
+@api_router.get("/mosques/{mosque_id}/snapshot", dependencies=[rate_limited("listing", LISTING_RATE)])
+async def get_mosque_snapshot(request: Request, mosque_id: str, start: Optional[str] = None,
+                              days: int = 365, since: Optional[str] = None):
+    first, days = parse_day_range(start, days)
+    allow_secondary_reads()
+
+    async def load_mosques():
+        mosque = await services.storage.mosques.get(mosque_id)
+        if not mosque:
+            raise HTTPException(status_code=404, detail="Mosque not found")
+        mosque['timezone'] = await get_mosque_timezone(mosque_id)
+        return [mosque]
+
+    snapshot = await cached_snapshot(("mosque", mosque_id, first, days), load_mosques, first, days)
+    return snapshot_response(request, snapshot, since)
+
+@api_router.get("/snapshots", dependencies=[rate_limited("listing", LISTING_RATE)])
+async def get_region_snapshot(request: Request, country: str, state: Optional[str] = None, city: Optional[str] = None,
+                              start: Optional[str] = None, days: int = 365, since: Optional[str] = None):
+    first, days = parse_day_range(start, days)
+    allow_secondary_reads()
+
+    async def load_mosques():
+        mosques = await services.storage.mosques.in_region(country, state, city, MAX_SNAPSHOT_MOSQUES)
+        if not mosques:
+            raise HTTPException(status_code=404, detail="No mosques in this region")
+        for mosque in mosques:
+            mosque['timezone'] = mosque.get('timezone') or timezone_resolver.lookup(mosque.get('latitude'), mosque.get('longitude'))
+        return mosques
+
+    snapshot = await cached_snapshot(("region", country, state, city, first, days), load_mosques, first, days)
+    return snapshot_response(request, snapshot, since)
+
 # ========== POSTS/FEED ROUTES ==========
 
 @api_router.post("/posts", response_model=Post)
-async def create_post(post: PostCreate, admin_id: str, mosque_id: str):
+async def create_post(post: PostCreate, admin_id: str, mosque_id: str, claims: Optional[dict] = authorize("admin")):
+    # Admins post as themselves, whatever the query string says
+    if claims['sub'] != admin_id:
+        raise HTTPException(status_code=403, detail="Not allowed")
+    check_mosque_admin(claims, mosque_id)
     post_obj = Post(
         mosque_id=mosque_id,
         admin_id=admin_id,
@@ -489,50 +1239,189 @@ async def create_post(post: PostCreate, admin_id: str, mosque_id: str):
     
     doc = post_obj.model_dump()
     doc['created_at'] = doc['created_at'].isoformat()
-    await db.posts.insert_one(doc)
+    await services.storage.posts.insert(doc)
     
     return post_obj
 
-@api_router.get("/posts", response_model=List[Post])
-async def get_posts(mosque_id: Optional[str] = None, status: Optional[str] = None):
-    query = {}
-    if mosque_id:
-        query['mosque_id'] = mosque_id
-    if status:
-        query['status'] = status
+@api_router.get("/posts", response_model=List[Post], dependencies=[rate_limited("listing", LISTING_RATE)])
+async def get_posts(mosque_id: Optional[str] = None, status: Optional[str] = None, limit: Optional[int] = Query(None, ge=1, le=1000)):
+    # Approved posts may come from a secondary (see repositories.py)
+    allow_secondary_reads()
+    # The latest approved posts are served from the materialized feed
+    if status == "approved" and limit and limit <= FEED_SIZE:
+        return await get_feed(mosque_id, limit)
     
-    posts = await db.posts.find(query, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    posts = await services.storage.posts.list(mosque_id, status, limit or 1000)
     for post in posts:
         if isinstance(post['created_at'], str):
             post['created_at'] = datetime.fromisoformat(post['created_at'])
     return posts
 
-@api_router.get("/posts/pending", response_model=List[Post])
+@api_router.get("/posts/feed", response_model=List[Post], dependencies=[rate_limited("listing", LISTING_RATE)])
+async def get_feed(mosque_id: Optional[str] = None, limit: int = Query(FEED_SIZE, ge=1, le=FEED_SIZE)):
+    allow_secondary_reads()
+    posts = await services.storage.posts.latest_approved(mosque_id, limit)
+    for post in posts:
+        if isinstance(post['created_at'], str):
+            post['created_at'] = datetime.fromisoformat(post['created_at'])
+    return posts
+
+@api_router.get("/posts/stream")
+async def stream_posts(request: Request, mosque_id: Optional[str] = None):
+    async def event_stream():
+        with feed_hub.subscribe(mosque_id) as queue:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(queue.get(), FEED_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: post\ndata: {payload}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@api_router.websocket("/posts/ws")
+async def posts_websocket(websocket: WebSocket, mosque_id: Optional[str] = None):
+    await websocket.accept()
+    await feed_hub.serve_websocket(websocket, mosque_id)
+
+@api_router.get("/posts/pending", response_model=List[Post], dependencies=[authorize("superadmin"), rate_limited("listing", LISTING_RATE)])
 async def get_pending_posts():
-    posts = await db.posts.find({"status": "pending"}, {"_id": 0}).sort("created_at", -1).to_list(1000)
+    posts = await services.storage.posts.pending(1000)
     for post in posts:
         if isinstance(post['created_at'], str):
             post['created_at'] = datetime.fromisoformat(post['created_at'])
     return posts
 
-@api_router.patch("/posts/{post_id}/status")
+@api_router.patch("/posts/{post_id}/status", dependencies=[authorize("superadmin")])
 async def update_post_status(post_id: str, update: PostUpdate):
     if update.status not in ["approved", "rejected"]:
         raise HTTPException(status_code=400, detail="Invalid status")
     
-    result = await db.posts.update_one(
-        {"id": post_id},
-        {"$set": {"status": update.status}}
-    )
+    # Also keeps the pending counter and latest-approved feeds in step
+    previous = await services.storage.posts.set_status(post_id, update.status)
     
-    if result.matched_count == 0:
+    if previous is None:
         raise HTTPException(status_code=404, detail="Post not found")
     
+    if update.status == "approved" and not use_posts_change_stream:
+        feed_hub.publish({**previous, "status": update.status})
+    
     return {"message": "Post status updated successfully"}
 
+# ========== MODERATION ROUTES ==========
+
+@api_router.get("/moderation/counts", dependencies=[authorize("superadmin")])
+async def get_moderation_counts():
+    return await services.storage.pending_counts()
+
+@api_router.post("/moderation/counts/rebuild", dependencies=[authorize("superadmin")])
+async def rebuild_moderation_counts():
+    return await services.storage.rebuild_pending_counts()
+
+@api_router.post("/moderation/feeds/rebuild", status_code=202, response_model=Job)
+async def rebuild_feeds(response: Response, claims: Optional[dict] = authorize("superadmin")):
+    return await accept_job(response, claims, "rebuild_feeds")
+
+@api_router.get("/moderation/admins", response_model=PendingAdminPage, dependencies=[authorize("superadmin"), rate_limited("listing", LISTING_RATE)])
+async def get_admin_queue(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    users, next_cursor = await fetch_page(services.storage.users.pending_admins, limit, cursor)
+    counts = await services.storage.pending_counts()
+    return PendingAdminPage(
+        items=[to_user_response(user) for user in users],
+        next_cursor=next_cursor,
+        total=counts[PENDING_ADMINS]
+    )
+
+@api_router.get("/moderation/posts", response_model=PendingPostPage, dependencies=[authorize("superadmin"), rate_limited("listing", LISTING_RATE)])
+async def get_post_queue(limit: int = Query(50, ge=1, le=200), cursor: Optional[str] = None):
+    posts, next_cursor = await fetch_page(services.storage.posts.pending, limit, cursor)
+    counts = await services.storage.pending_counts()
+    return PendingPostPage(items=posts, next_cursor=next_cursor, total=counts[PENDING_POSTS])
+
+@api_router.post("/moderation/admins/batch", dependencies=[authorize("superadmin")])
+async def moderate_admins(batch: ModerationBatch):
+    if batch.status not in ["approved", "rejected"]:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    # Only pending admins move; repeated, unknown or moderated ids are skipped
+    moved = await services.storage.users.moderate_pending_admins(batch.ids, batch.status)
+    if batch.status == "rejected":
+        for user_id in moved:
+            await revoke_tokens(user_id)
+    
+    return {"updated": len(moved), "skipped": len(set(batch.ids)) - len(moved)}
+
+@api_router.post("/moderation/posts/batch", dependencies=[authorize("superadmin")])
+async def moderate_posts(batch: ModerationBatch):
+    if batch.status not in ["approved", "rejected"]:
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    updated, approved = await services.storage.posts.moderate_pending(batch.ids, batch.status)
+    
+    if not use_posts_change_stream:
+        for post in approved:
+            feed_hub.publish(post)
+    
+    return {"updated": updated, "skipped": len(set(batch.ids)) - updated}
+
+# ========== JOB ROUTES ==========
+
+async def accept_job(response: Response, claims: dict, kind: str, params: Optional[dict] = None,
+                     priority: int = 0) -> dict:
+    job = await job_runner.submit(kind, params, priority, created_by=claims['sub'])
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return job
+
+@api_router.get("/jobs/{job_id}", response_model=Job)
+async def get_job(job_id: str, claims: Optional[dict] = authorize("admin", "superadmin")):
+    job = await job_runner.get(job_id)
+    # Only the admin who queued a job sees it; to anyone else it does not exist
+    if not job or job.get('created_by') != claims['sub']:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/admin/indexes", status_code=202, response_model=Job)
+async def build_indexes(response: Response, claims: Optional[dict] = authorize("superadmin")):
+    return await accept_job(response, claims, "ensure_indexes", priority=10)
+
+@api_router.post("/admin/prayer-times/precompute", status_code=202, response_model=Job)
+async def precompute_prayer_times(response: Response, year: int = Query(..., ge=2000, le=2100),
+                                  mosque_id: Optional[List[str]] = Query(None),
+                                  claims: Optional[dict] = authorize("superadmin")):
+    return await accept_job(response, claims, "precompute_prayer_times", {"year": year, "mosque_ids": mosque_id})
+
+# ========== PROFILING ROUTES ==========
+
+@api_router.get("/admin/profiles", dependencies=[authorize("superadmin")])
+async def get_profiles():
+    return profiler.summary()
+
+@api_router.get("/admin/profiles/collapsed", dependencies=[authorize("superadmin")])
+async def get_collapsed_profiles(route: Optional[str] = None):
+    return PlainTextResponse(profiler.collapsed(route))
+
+@api_router.delete("/admin/profiles", dependencies=[authorize("superadmin")])
+async def reset_profiles():
+    profiler.reset()
+    return {"message": "Profiles cleared"}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(metrics.registry.expose(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+app.add_middleware(ProfilingMiddleware, profiler=profiler, sample_rate=PROFILING_SAMPLE_RATE, token=PROFILING_TOKEN)
+app.add_middleware(metrics.MetricsMiddleware, sample_rate=METRICS_SAMPLE_RATE)
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=MAX_REQUEST_BYTES)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -548,6 +1437,109 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def resolve_reminder_times(mosque_id: str, date: str):
+    # From the primary: an admin's edit should move the reminder on the next
+    # reload, not once a lagging secondary catches up
+    try:
+        with primary_reads():
+            times = await zoned_prayer_times(mosque_id, date)
+    except HTTPException:
+        return None
+    # Stand-ins are left for the next reload rather than scheduled
+    if times.get('stale'):
+        return None
+    return times
+
+async def reload_reminders():
+    while True:
+        try:
+            await load_schedule(reminder_dispatcher, services.storage.users, resolve_reminder_times)
+        except Exception as e:
+            logger.error(f"Error loading reminder schedule: {e}")
+        await asyncio.sleep(REMINDER_RELOAD_SECONDS)
+
+# ==================== WARM-UP ====================
+# Runs in the background after startup; GET /api/ready reports 503 until done
+
+@warm_up.step("storage")
+async def prepare_storage():
+    if MEMORY_STORAGE_SOURCE == 'mongo' and isinstance(services.storage, MemoryStorage):
+        counts = await services.storage.load_from(MongoStorage(services.db, FEED_SIZE))
+        logger.info(f"Loaded memory storage from MongoDB: {counts}")
+
+@warm_up.step("indexes")
+async def create_indexes():
+    await services.storage.ensure_indexes()
+    if isinstance(services.rate_limiter.backend, MongoRateLimitBackend):
+        await services.rate_limiter.backend.ensure_indexes()
+
+@warm_up.step("moderation_counters")
+async def seed_moderation_counters():
+    # Counters only move once they exist; see MongoCounters
+    if not READ_ONLY:
+        await services.storage.seed_pending_counts()
+
+@warm_up.step("timetable_store")
+async def prepare_timetable_store():
+    if TIMETABLE_STORE_PATH and timetable_store is None:
+        await open_timetable_store()
+
+@warm_up.step("password_hasher")
+async def load_password_hasher():
+    # The first hash loads the bcrypt backend; keep that off a login request
+    await run_in_threadpool(hash_password, uuid.uuid4().hex)
+
+@warm_up.step("timezones")
+async def prefill_timezones():
+    await asyncio.to_thread(timezone_resolver.load)
+    if shared_zones is not None:
+        return
+    async for mosque_id, zone in services.storage.mosques.timezones():
+        if len(mosque_timezones) >= MAX_MEMOIZED_MOSQUE_TIMEZONES:
+            break
+        mosque_timezones[mosque_id] = zone
+
+# ==================== JOB HANDLERS ====================
+
+@job_runner.handler("rebuild_feeds")
+async def run_rebuild_feeds(job):
+    return {"feeds": await services.storage.posts.rebuild_feeds()}
+
+@job_runner.handler("ensure_indexes")
+async def run_ensure_indexes(job):
+    await create_indexes()
+
+@job_runner.handler("precompute_prayer_times")
+async def run_precompute_prayer_times(job):
+    """Store a year of Aladhan times for every mosque (or the given ones),
+    with one calendar request per grid cell and zone."""
+    year, mosque_ids = job.params['year'], job.params.get('mosque_ids')
+    if mosque_ids:
+        mosques = await services.storage.mosques.get_many(mosque_ids)
+    else:
+        mosques = [mosque async for mosque in services.storage.mosques.all()]
+    # fetch_prayer_calendar stores the answer for every mosque in the cell and zone
+    by_cell, skipped = {}, 0
+    for mosque in mosques:
+        grid = aladhan.grid_key(mosque.get('latitude'), mosque.get('longitude'), mosque_zone(mosque), ALADHAN_GRID_DEGREES)
+        if grid:
+            by_cell.setdefault(grid, mosque)
+        elif mosque.get('latitude') is not None and mosque.get('longitude') is not None:
+            by_cell[mosque['id']] = mosque
+        else:
+            skipped += 1
+    rows, failed = 0, []
+    for done, mosque in enumerate(by_cell.values()):
+        await job.progress(done, len(by_cell))
+        try:
+            rows += await fetch_prayer_calendar(mosque, year)
+        except CircuitOpenError:
+            # Aladhan is down: retry the whole job later; stored days are skipped
+            raise
+        except Exception as e:
+            logger.error(f"Error precomputing {year} prayer times for {mosque['id']}: {e}")
+            failed.append(mosque['id'])
+    await job.progress(len(by_cell), len(by_cell))
+    if by_cell and len(failed) == len(by_cell):
+        raise RuntimeError(f"Every calendar request failed ({len(failed)})")
+    return {"requests": len(by_cell), "rows": rows, "failed": failed, "skipped": skipped}
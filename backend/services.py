@@ -0,0 +1,171 @@
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+HTTP_TIMEOUT_SECONDS = 10
+
+# MongoDB driver settings read from the environment; unset ones keep the
+# driver defaults (or whatever MONGO_URL specifies)
+MONGO_CLIENT_SETTINGS = (
+    ("MONGO_MAX_POOL_SIZE", "maxPoolSize", int),
+    ("MONGO_MIN_POOL_SIZE", "minPoolSize", int),
+    ("MONGO_MAX_CONNECTING", "maxConnecting", int),
+    ("MONGO_MAX_IDLE_TIME_MS", "maxIdleTimeMS", int),
+    ("MONGO_WAIT_QUEUE_TIMEOUT_MS", "waitQueueTimeoutMS", int),
+    ("MONGO_CONNECT_TIMEOUT_MS", "connectTimeoutMS", int),
+    ("MONGO_SOCKET_TIMEOUT_MS", "socketTimeoutMS", int),
+    ("MONGO_SERVER_SELECTION_TIMEOUT_MS", "serverSelectionTimeoutMS", int),
+    ("MONGO_COMPRESSORS", "compressors", str),  # e.g. "zstd,snappy,zlib"
+    ("MONGO_ZLIB_COMPRESSION_LEVEL", "zlibCompressionLevel", int),
+)
+
+# Secondaries more than this far behind the primary are never read from;
+# the driver's minimum is 90
+DEFAULT_MAX_STALENESS_SECONDS = 90
+
+
+def mongo_client_options(environ=os.environ) -> dict:
+    return {option: cast(environ[name]) for name, option, cast in MONGO_CLIENT_SETTINGS if environ.get(name)}
+
+
+def build_mongo_client(services: "Services"):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(
+        os.environ['MONGO_URL'],
+        event_listeners=[metrics.mongo_command_listener(), metrics.mongo_pool_listener()],
+        **mongo_client_options()
+    )
+
+
+def build_db(services: "Services"):
+    return services.mongo_client[os.environ['DB_NAME']]
+
+
+def build_replica_db(services: "Services"):
+    """The database for reads that may be served by a secondary."""
+    from pymongo.read_preferences import SecondaryPreferred
+
+    max_staleness = int(os.environ.get('MONGO_MAX_STALENESS_SECONDS', DEFAULT_MAX_STALENESS_SECONDS))
+    return services.mongo_client.get_database(
+        os.environ['DB_NAME'], read_preference=SecondaryPreferred(max_staleness=max_staleness)
+    )
+
+
+def build_http(services: "Services"):
+    import httpx
+
+    return httpx.AsyncClient(timeout=HTTP_TIMEOUT_SECONDS)
+
+
+def build_hasher(services: "Services"):
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class Services:
+    """Process-wide dependencies, each constructed on first use.
+
+    Importing the app builds nothing: the Mongo client and its database
+    handles, HTTP client and password hasher (and their imports) are created
+    the first time a request or the warm-up touches them. `provide`
+    registers a factory, and `override` swaps in ready-made instances, e.g.
+    an in-memory database for tests. Overriding drops every other instance
+    built so far, so anything derived from the old ones is rebuilt against
+    the new.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[["Services"], object]] = {}
+        self._instances: Dict[str, object] = {}
+        self._overridden = set()
+        self.provide("mongo_client", build_mongo_client)
+        self.provide("db", build_db)
+        self.provide("replica_db", build_replica_db)
+        self.provide("http", build_http)
+        self.provide("hasher", build_hasher)
+
+    def provide(self, name: str, factory: Callable[["Services"], object]):
+        self._factories[name] = factory
+        if name not in self._overridden:
+            self._instances.pop(name, None)
+
+    def override(self, **instances):
+        for name in list(self._instances):
+            if name not in self._overridden and name not in instances:
+                del self._instances[name]
+        self._instances.update(instances)
+        self._overridden.update(instances)
+
+    def built(self, name: str) -> bool:
+        return name in self._instances
+
+    def __getattr__(self, name: str):
+        try:
+            factory = self._factories[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        instance = self._instances.get(name)
+        if instance is None:
+            instance = self._instances[name] = factory(self)
+        return instance
+
+    async def close(self):
+        http = self._instances.pop("http", None)
+        if http is not None:
+            await http.aclose()
+        mongo_client = self._instances.pop("mongo_client", None)
+        if mongo_client is not None:
+            mongo_client.close()
+
+
+class WarmUp:
+    """Runs the startup steps in the background and records their progress.
+
+    The app accepts connections straight away; the readiness endpoint
+    reports 503 until every step has finished, so a load balancer only sends
+    traffic to workers with indexes in place and caches filled.
+    """
+
+    def __init__(self):
+        self.steps: List[Tuple[str, Callable[[], Awaitable[object]]]] = []
+        self.completed: Dict[str, float] = {}
+        self.failed: Dict[str, str] = {}
+        self.ready = False
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def step(self, name: str):
+        def register(fn: Callable[[], Awaitable[object]]):
+            self.steps.append((name, fn))
+            return fn
+        return register
+
+    async def run(self, logger=None):
+        self.started_at = time.time()
+        for name, fn in self.steps:
+            start = time.perf_counter()
+            try:
+                await fn()
+            except Exception as e:
+                # A failed step leaves the worker not ready rather than dead
+                self.failed[name] = str(e)
+                if logger:
+                    logger.error(f"Warm-up step {name} failed: {e}")
+                continue
+            self.completed[name] = round(time.perf_counter() - start, 4)
+        self.finished_at = time.time()
+        self.ready = not self.failed
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "completed": self.completed,
+            "failed": self.failed,
+            "pending": [name for name, _ in self.steps if name not in self.completed and name not in self.failed],
+            "warm_up_seconds": round(self.finished_at - self.started_at, 4) if self.finished_at else None,
+        }
+
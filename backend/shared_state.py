@@ -0,0 +1,178 @@
+import bisect
+import hashlib
+import mmap
+import struct
+from array import array
+from dataclasses import dataclass, field
+from datetime import date as date_cls, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from timezones import PRAYERS
+
+Cell = Tuple[float, float]
+GridKey = Tuple[Cell, str]
+MISSING = 0xFFFF
+
+# Read-only tables built once by the launcher (serve.py) before it forks the
+# workers. Their contents live in anonymous shared mappings rather than in
+# Python objects: forked workers map the very same pages, and since nothing
+# ever writes to them (not even a reference count) no worker ends up with a
+# copy. Lookups binary-search fixed-width keys in place.
+
+
+def shared_buffer(data: bytes) -> mmap.mmap:
+    """`data` copied into an anonymous MAP_SHARED mapping."""
+    buffer = mmap.mmap(-1, max(len(data), 1))
+    buffer.write(data)
+    return buffer
+
+
+class SortedKeys:
+    """Sorted fixed-width byte keys in a shared buffer."""
+
+    def __init__(self, keys: Iterable[bytes], width: int):
+        keys = sorted(keys)
+        self.width = width
+        self.count = len(keys)
+        self.buffer = shared_buffer(b"".join(keys))
+        self._view = memoryview(self.buffer)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        return self._view[index * self.width:(index + 1) * self.width].tobytes()
+
+    def index(self, key: bytes) -> Optional[int]:
+        position = bisect.bisect_left(self, key)
+        if position < self.count and self[position] == key:
+            return position
+        return None
+
+
+def cell_key(cell: Cell, grid_degrees: float) -> bytes:
+    # Big-endian offsets sort the same as bytes and as numbers
+    return struct.pack(">II", round(cell[0] / grid_degrees) + 2 ** 31, round(cell[1] / grid_degrees) + 2 ** 31)
+
+
+def id_key(mosque_id: str) -> bytes:
+    """A fixed-width key for any mosque id."""
+    return hashlib.blake2b(mosque_id.encode(), digest_size=16).digest()
+
+
+def _minutes(value: Optional[str]) -> int:
+    if not value:
+        return MISSING
+    hour, minute = value.split(" ")[0].split(":")[:2]
+    return int(hour) * 60 + int(minute)
+
+
+class SharedGridTimetables:
+    """Upstream timetables by (grid cell, zone) for `days` days from `start`.
+
+    What Aladhan returns for a cell and date in a zone never changes, so the
+    table is built once and only read. Each row holds every day's prayers as
+    minutes after local midnight (u16, MISSING where unknown). A cell on a
+    zone border has a row per zone; keys are the cell followed by the
+    zone's index in `zones`.
+    """
+
+    def __init__(self, grid_degrees: float, start: date_cls, days: int,
+                 timetables: Dict[GridKey, Dict[str, Dict[str, str]]]):
+        self.grid_degrees = grid_degrees
+        self.start = start
+        self.days = days
+        self.zones = sorted({zone for _, zone in timetables})
+        self._zone_index = {zone: i for i, zone in enumerate(self.zones)}
+        rows = {self._key(grid): by_date for grid, by_date in timetables.items()}
+        self.keys = SortedKeys(rows, 10)
+        width = len(PRAYERS)
+        times = array("H", [MISSING]) * (len(rows) * days * width)
+        for row, key in enumerate(sorted(rows)):
+            for day, values in rows[key].items():
+                offset = (date_cls.fromisoformat(day) - start).days
+                if 0 <= offset < days:
+                    base = (row * days + offset) * width
+                    times[base:base + width] = array("H", [_minutes(values.get(p)) for p in PRAYERS])
+        self.buffer = shared_buffer(times.tobytes())
+        self._times = memoryview(self.buffer).cast("H")
+
+    def _key(self, grid: GridKey) -> bytes:
+        cell, zone = grid
+        return cell_key(cell, self.grid_degrees) + struct.pack(">H", self._zone_index[zone])
+
+    def get(self, grid: GridKey, day: str) -> Optional[Dict[str, str]]:
+        offset = (date_cls.fromisoformat(day) - self.start).days
+        if not 0 <= offset < self.days or grid[1] not in self._zone_index:
+            return None
+        row = self.keys.index(self._key(grid))
+        if row is None:
+            return None
+        base = (row * self.days + offset) * len(PRAYERS)
+        values = self._times[base:base + len(PRAYERS)]
+        if MISSING in values:
+            return None
+        return {prayer: f"{minutes // 60:02d}:{minutes % 60:02d}" for prayer, minutes in zip(PRAYERS, values)}
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer) + len(self.keys.buffer)
+
+
+class SharedMosqueZones:
+    """Each mosque's IANA zone name, by mosque id."""
+
+    def __init__(self, zones: Dict[str, str]):
+        keyed = sorted((id_key(mosque_id), zone) for mosque_id, zone in zones.items())
+        # A few hundred distinct names at most; the list is the only Python object
+        self.names = sorted({zone for _, zone in keyed})
+        index = {name: i for i, name in enumerate(self.names)}
+        self.keys = SortedKeys((key for key, _ in keyed), 16)
+        self.buffer = shared_buffer(array("H", [index[zone] for _, zone in keyed]).tobytes())
+        self._zones = memoryview(self.buffer).cast("H")
+
+    def get(self, mosque_id: str) -> Optional[str]:
+        row = self.keys.index(id_key(mosque_id))
+        return None if row is None else self.names[self._zones[row]]
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer) + len(self.keys.buffer)
+
+
+@dataclass
+class WarmState:
+    """Data every worker would otherwise load for itself during warm-up."""
+
+    start: date_cls
+    days: int
+    timetables: Dict[GridKey, Dict[str, Dict[str, str]]] = field(default_factory=dict)
+    zones: Dict[str, str] = field(default_factory=dict)
+
+
+async def load_warm_state(storage, grid_degrees: float, start: date_cls, days: int, resolve_zone,
+                          batch_size: int = 500) -> WarmState:
+    """Cached upstream timetables by (grid cell, zone), and every mosque's zone.
+
+    Manual times are left out: they belong to one mosque, not its cell, and
+    an admin may change them at any time.
+    """
+    from aladhan import grid_key
+
+    state = WarmState(start, days)
+    cells: Dict[str, GridKey] = {}
+    async for mosque in storage.mosques.all():
+        zone = mosque.get('timezone') or resolve_zone(mosque.get('latitude'), mosque.get('longitude'))
+        state.zones[mosque['id']] = zone
+        grid = grid_key(mosque.get('latitude'), mosque.get('longitude'), zone, grid_degrees)
+        if grid:
+            cells[mosque['id']] = grid
+    first, last = start.isoformat(), (start + timedelta(days=days - 1)).isoformat()
+    mosque_ids = list(cells)
+    for i in range(0, len(mosque_ids), batch_size):
+        for doc in await storage.prayer_times.range(mosque_ids[i:i + batch_size], first, last):
+            if doc.get('is_manual'):
+                continue
+            by_date = state.timetables.setdefault(cells[doc['mosque_id']], {})
+            by_date.setdefault(doc['date'], {prayer: doc.get(prayer) for prayer in PRAYERS})
+    return state
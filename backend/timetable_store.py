@@ -0,0 +1,225 @@
+import json
+import mmap
+import os
+import struct
+import time
+import uuid
+from array import array
+from datetime import date as date_cls, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from snapshots import MISSING, to_minutes
+from timezones import PRAYERS
+
+MAGIC = b"SRTT"
+STORE_FORMAT = 1
+# u16 columns per day: the five prayers as minutes after local midnight
+# (MISSING until known), flags, then created_at as u32 epoch seconds split
+# into high and low halves
+COLUMNS = len(PRAYERS) + 3
+FLAGS = len(PRAYERS)
+FLAG_MANUAL = 1
+HEADER = struct.Struct("=4sHHiIqI")  # magic, format, columns, start ordinal, days, built_at, ids length
+ALIGN = 16
+# Manual times set up to this long before the last one applied are fetched
+# again, so a host whose clock runs behind is not missed; re-applying is a no-op
+OVERRIDE_OVERLAP_SECONDS = 60
+MINUTE_STRINGS = tuple(f"{minutes // 60:02d}:{minutes % 60:02d}" for minutes in range(24 * 60))
+
+# File layout, in native byte order (the file is a per-host cache, not an
+# exchange format): header | mosque ids as a JSON array | padding to ALIGN |
+# one row per mosque in id order, each `days` days of COLUMNS u16 values.
+
+
+def _aligned(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def encode_row(docs: Iterable[dict], offsets: Dict[str, int], days: int) -> array:
+    row = ([MISSING] * len(PRAYERS) + [0, 0, 0]) * days
+    unreadable = set()
+    for doc in docs:
+        offset = offsets.get(doc['date'])
+        if offset is None or offset in unreadable:
+            continue
+        base = offset * COLUMNS
+        # Manual times win over cached API times for the same day
+        if row[base] != MISSING and row[base + FLAGS] & FLAG_MANUAL and not doc.get('is_manual'):
+            continue
+        try:
+            row[base:base + COLUMNS] = _day_list(doc, doc.get('is_manual', False), doc.get('created_at'))
+        except ValueError:
+            # Times the store cannot hold are left to the database
+            row[base] = MISSING
+            unreadable.add(offset)
+    return array("H", row)
+
+
+@lru_cache(maxsize=4096)  # rows written together share a created_at
+def _epoch_seconds(created_at: str) -> int:
+    return int(datetime.fromisoformat(created_at).timestamp())
+
+
+@lru_cache(maxsize=4096)
+def _from_epoch_seconds(stamp: int) -> datetime:
+    return datetime.fromtimestamp(stamp, timezone.utc)
+
+
+@lru_cache(maxsize=65536)
+def _day_id(mosque_id: str, day: str) -> str:
+    # Stored rows' ids are not kept; this one is stable for the day
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{mosque_id}/{day}"))
+
+
+def _day_list(times: dict, manual: bool, created_at) -> List[int]:
+    if isinstance(created_at, str):
+        stamp = _epoch_seconds(created_at)
+    else:
+        stamp = int(created_at.timestamp()) if created_at else 0
+    values = [to_minutes(times.get(prayer)) for prayer in PRAYERS]
+    values += (FLAG_MANUAL if manual else 0, stamp >> 16, stamp & 0xFFFF)
+    return values
+
+
+class StoreWriter:
+    """Writes a store row by row, one per mosque id in order, then replaces
+    any file at `path` atomically, so open stores are never half-written."""
+
+    def __init__(self, path: str, start: date_cls, days: int, mosque_ids: List[str]):
+        self.path = path
+        self.expected = len(mosque_ids)
+        self.written = 0
+        self._temporary = f"{path}.{os.getpid()}.tmp"
+        self._file = open(self._temporary, "wb")
+        ids = json.dumps(mosque_ids).encode()
+        self._file.write(HEADER.pack(MAGIC, STORE_FORMAT, COLUMNS, start.toordinal(), days, int(time.time()), len(ids)))
+        self._file.write(ids)
+        self._file.write(b"\0" * (_aligned(HEADER.size + len(ids)) - HEADER.size - len(ids)))
+
+    def append(self, row: array):
+        row.tofile(self._file)
+        self.written += 1
+
+    def __enter__(self) -> "StoreWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None and self.written == self.expected:
+            os.replace(self._temporary, self.path)
+            return
+        os.unlink(self._temporary)
+        if exc_type is None:
+            raise ValueError(f"{self.written} rows for {self.expected} mosques")
+
+
+class TimetableStore:
+    """A read-side copy of prayer_times in a memory-mapped file.
+
+    Each mosque's row holds `days` days from `start` as fixed-width u16
+    values, so a lookup is a dict probe for the row and a zero-copy slice of
+    the mapping, with no database round trip. Setting or fetching times
+    patches the day in place; the mapping is shared, so every worker with
+    the file open sees the change. Manual times set elsewhere (another host,
+    or during a rebuild) arrive through `apply_overrides`. Mosques added
+    after the build are not in the store and are looked up in the database
+    until the next rebuild.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "r+b") as f:
+            self._buffer = mmap.mmap(f.fileno(), 0)
+        if len(self._buffer) < HEADER.size:
+            raise ValueError(f"{path} is truncated")
+        magic, store_format, columns, start, self.days, self.built_at, ids_length = HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or store_format != STORE_FORMAT or columns != COLUMNS:
+            raise ValueError(f"{path} is not a format {STORE_FORMAT} timetable store")
+        self.start = date_cls.fromordinal(start)
+        # Manual times set since then may be missing (see apply_overrides)
+        self.synced_at = float(self.built_at)
+        mosque_ids = json.loads(self._buffer[HEADER.size:HEADER.size + ids_length])
+        self.index: Dict[str, int] = {mosque_id: row for row, mosque_id in enumerate(mosque_ids)}
+        self.offsets: Dict[str, int] = {(self.start + timedelta(days=offset)).isoformat(): offset
+                                        for offset in range(self.days)}
+        data = _aligned(HEADER.size + ids_length)
+        self._data = memoryview(self._buffer)[data:data + len(mosque_ids) * self.days * COLUMNS * 2].cast("H")
+
+    def _base(self, mosque_id: str, day: str) -> Optional[int]:
+        row = self.index.get(mosque_id)
+        offset = self.offsets.get(day)
+        if row is None or offset is None:
+            return None
+        return (row * self.days + offset) * COLUMNS
+
+    def minutes(self, mosque_id: str, day: str) -> Optional[memoryview]:
+        """The day's COLUMNS u16 values, a view into the mapping, or None if unknown."""
+        base = self._base(mosque_id, day)
+        if base is None or self._data[base] == MISSING:
+            return None
+        return self._data[base:base + COLUMNS]
+
+    def get(self, mosque_id: str, day: str) -> Optional[dict]:
+        """The day as a prayer_times document, or None if the store does not know it."""
+        values = self.minutes(mosque_id, day)
+        if values is None:
+            return None
+        *minutes, flags, stamp_high, stamp_low = values.tolist()
+        doc = {prayer: MINUTE_STRINGS[m] if m < len(MINUTE_STRINGS) else None for prayer, m in zip(PRAYERS, minutes)}
+        doc['id'] = _day_id(mosque_id, day)
+        doc['mosque_id'] = mosque_id
+        doc['date'] = day
+        doc['is_manual'] = bool(flags & FLAG_MANUAL)
+        doc['created_at'] = _from_epoch_seconds(stamp_high << 16 | stamp_low)
+        return doc
+
+    def put(self, mosque_id: str, day: str, times: dict, manual: bool, created_at) -> bool:
+        """Patch one day in place; cached API times never replace manual ones."""
+        base = self._base(mosque_id, day)
+        if base is None:
+            return False
+        if not manual and self._data[base] != MISSING and self._data[base + FLAGS] & FLAG_MANUAL:
+            return False
+        try:
+            values = array("H", _day_list(times, manual, created_at))
+        except ValueError:
+            # Times the store cannot hold are left to the database
+            self._data[base] = MISSING
+            return False
+        self._data[base:base + COLUMNS] = values
+        return True
+
+    def fresh(self, today: date_cls, max_age: float) -> bool:
+        return today.isoformat() in self.offsets and time.time() - self.built_at < max_age
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._buffer)
+
+
+async def build_store(storage, path: str, start: date_cls, days: int, batch_size: int = 500) -> int:
+    """Write a store of every mosque's stored times; returns the number of mosques."""
+    mosque_ids = [mosque['id'] async for mosque in storage.mosques.all()]
+    offsets = {(start + timedelta(days=offset)).isoformat(): offset for offset in range(days)}
+    first, last = start.isoformat(), (start + timedelta(days=days - 1)).isoformat()
+    with StoreWriter(path, start, days, mosque_ids) as writer:
+        for i in range(0, len(mosque_ids), batch_size):
+            batch = mosque_ids[i:i + batch_size]
+            by_mosque = {mosque_id: [] for mosque_id in batch}
+            for doc in await storage.prayer_times.range(batch, first, last):
+                by_mosque[doc['mosque_id']].append(doc)
+            for mosque_id in batch:
+                writer.append(encode_row(by_mosque[mosque_id], offsets, days))
+    return len(mosque_ids)
+
+
+async def apply_overrides(store: TimetableStore, storage) -> int:
+    """Patch manual times set since the store was built, or last synced,
+    into it; returns the number of days patched."""
+    after = datetime.fromtimestamp(store.synced_at - OVERRIDE_OVERLAP_SECONDS, timezone.utc).isoformat()
+    patched = 0
+    for doc in await storage.prayer_times.manual_since(after):
+        patched += store.put(doc['mosque_id'], doc['date'], doc, True, doc['created_at'])
+        store.synced_at = max(store.synced_at, _epoch_seconds(doc['created_at']))
+    return patched
@@ -0,0 +1,123 @@
+import importlib.util
+import threading
+import zoneinfo
+from datetime import date as date_cls, datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# timezonefinder is optional; without it lookups fall back to the nearest
+# zone1970.tab city. Imported on first lookup, as it pulls in numpy.
+HAVE_TIMEZONEFINDER = importlib.util.find_spec("timezonefinder") is not None
+
+DEFAULT_TIMEZONE = "UTC"
+PRAYERS = ("fajr", "dhuhr", "asr", "maghrib", "isha")
+
+# Lookups are memoized on coordinates rounded to ~11m, well inside any zone
+COORDINATE_PRECISION = 4
+
+
+def _parse_tab_coordinate(value: str, degree_digits: int) -> float:
+    sign = -1 if value[0] == "-" else 1
+    digits = value[1:]
+    degrees = int(digits[:degree_digits])
+    minutes = int(digits[degree_digits:degree_digits + 2])
+    seconds = int(digits[degree_digits + 2:] or 0)
+    return sign * (degrees + minutes / 60 + seconds / 3600)
+
+
+def _load_reference_points() -> List[Tuple[float, float, str]]:
+    for root in zoneinfo.TZPATH:
+        path = Path(root) / "zone1970.tab"
+        if path.exists():
+            break
+    else:
+        return []
+
+    points = []
+    for line in path.read_text().splitlines():
+        if line.startswith("#"):
+            continue
+        fields = line.split("\t")
+        coordinates = fields[1]
+        split = max(coordinates.rfind("+"), coordinates.rfind("-"))
+        lat = _parse_tab_coordinate(coordinates[:split], 2)
+        lng = _parse_tab_coordinate(coordinates[split:], 3)
+        points.append((lat, lng, fields[2]))
+    return points
+
+
+class TimezoneResolver:
+    """Maps coordinates to IANA zone names without any network calls.
+
+    Uses timezonefinder's bundled boundary polygons and H3 index when it is
+    installed. Without it, picks the zone of the nearest zone1970.tab
+    reference city, which is right away from borders but can be wrong close
+    to one. The dataset loads on the first lookup; after that a lookup is a
+    few microseconds, and repeated coordinates hit an LRU cache.
+    """
+
+    def __init__(self, cache_size: int = 65536):
+        self._finder = None
+        self._points: Optional[List[Tuple[float, float, str]]] = None
+        self._lock = threading.Lock()
+        self._lookup = lru_cache(maxsize=cache_size)(self._resolve)
+
+    def load(self):
+        with self._lock:
+            if self._finder is not None or self._points is not None:
+                return
+            if HAVE_TIMEZONEFINDER:
+                from timezonefinder import TimezoneFinder
+                self._finder = TimezoneFinder(in_memory=True)
+            else:
+                self._points = _load_reference_points()
+
+    def _resolve(self, lat: float, lng: float) -> str:
+        if self._finder is None and self._points is None:
+            self.load()
+        if self._finder is not None:
+            return self._finder.timezone_at(lat=lat, lng=lng) or DEFAULT_TIMEZONE
+        best, best_distance = DEFAULT_TIMEZONE, float("inf")
+        for point_lat, point_lng, zone in self._points:
+            d_lng = abs(lng - point_lng)
+            d_lng = min(d_lng, 360 - d_lng)
+            distance = (lat - point_lat) ** 2 + d_lng ** 2
+            if distance < best_distance:
+                best, best_distance = zone, distance
+        return best
+
+    def lookup(self, lat: Optional[float], lng: Optional[float]) -> str:
+        if lat is None or lng is None:
+            return DEFAULT_TIMEZONE
+        return self._lookup(round(lat, COORDINATE_PRECISION), round(lng, COORDINATE_PRECISION))
+
+    def cache_info(self):
+        return self._lookup.cache_info()
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def local_to_utc(day: str, value: str, zone: ZoneInfo) -> datetime:
+    """Convert a local "HH:MM" (optionally with a suffix like " (EST)") to UTC."""
+    base = date_cls.fromisoformat(day)
+    hour, minute = (int(part) for part in value.split(" ")[0].split(":")[:2])
+    return datetime(base.year, base.month, base.day, hour, minute, tzinfo=zone).astimezone(timezone.utc)
+
+
+def utc_instants(day: str, times: dict, zone_name: Optional[str]) -> Dict[str, str]:
+    """UTC ISO timestamps for each prayer in a day's local timetable."""
+    zone = get_zone(zone_name)
+    return {
+        prayer: local_to_utc(day, times[prayer], zone).isoformat()
+        for prayer in PRAYERS
+        if times.get(prayer)
+    }
+
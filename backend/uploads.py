@@ -0,0 +1,195 @@
+import base64
+import hashlib
+import json
+import uuid
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterable, Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.responses import JSONResponse
+
+# Read size per iteration, and the size of each stored chunk. A multiple of
+# 3 keeps base64 output free of padding between chunks, so encoded pieces
+# can simply be concatenated.
+CHUNK_SIZE = 3 * 64 * 1024
+
+# Magic-number prefixes for the formats we accept
+FILE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+]
+
+IMAGE_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+ID_PROOF_TYPES = IMAGE_TYPES | {"application/pdf"}
+
+
+@dataclass
+class StoredUpload:
+    content_type: str
+    size: int
+    sha256: str
+    upload_id: Optional[str] = None  # set when written to the uploads repository
+    data: Optional[bytes] = None  # set when buffered in memory
+
+
+class BufferSink:
+    """Collects the upload in memory, for files that are decoded whole
+    (images go to Pillow). Holds the raw bytes once, never base64."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    async def write(self, chunk: bytes):
+        self.buffer += chunk
+
+    async def abort(self):
+        self.buffer = bytearray()
+
+    def finish(self, upload: StoredUpload):
+        upload.data = bytes(self.buffer)
+
+
+class StorageSink:
+    """Writes each chunk to the uploads repository as soon as it is read, so
+    memory use stays at one chunk whatever the file size."""
+
+    def __init__(self, uploads):
+        self.uploads = uploads
+        self.upload_id = str(uuid.uuid4())
+        self.count = 0
+
+    async def write(self, chunk: bytes):
+        await self.uploads.write_chunk(self.upload_id, self.count, chunk)
+        self.count += 1
+
+    async def abort(self):
+        await self.uploads.delete(self.upload_id)
+
+    def finish(self, upload: StoredUpload):
+        upload.upload_id = self.upload_id
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    for signature, content_type in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def read_upload(
+    file: UploadFile,
+    max_bytes: int,
+    allowed_types: Iterable[str] = IMAGE_TYPES,
+    sink=None,
+) -> StoredUpload:
+    """Read an upload chunk by chunk into `sink` (a BufferSink by default).
+
+    Each chunk is hashed and handed on as it arrives; the upload is rejected
+    as soon as it is known to be too large or of the wrong type, and
+    whatever the sink already stored is removed.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+
+    sink = sink or BufferSink()
+    digest = hashlib.sha256()
+    size = 0
+    content_type = None
+    try:
+        while True:
+            chunk = await file.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            if content_type is None:
+                content_type = sniff_content_type(chunk)
+                if content_type not in allowed_types:
+                    raise HTTPException(status_code=415, detail="Unsupported file type")
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"File exceeds {max_bytes} bytes")
+
+            digest.update(chunk)
+            await sink.write(chunk)
+
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    except BaseException:
+        await sink.abort()
+        raise
+
+    upload = StoredUpload(content_type=content_type, size=size, sha256=digest.hexdigest())
+    sink.finish(upload)
+    return upload
+
+
+async def base64_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Base64 of a stream of byte chunks, encoded piece by piece."""
+    pending = b""
+    async for chunk in chunks:
+        # Only encode whole 3-byte groups; carry the remainder to the next chunk
+        pending += chunk
+        usable = len(pending) - len(pending) % 3
+        if usable:
+            yield base64.b64encode(pending[:usable]).decode('ascii')
+        pending = pending[usable:]
+    if pending:
+        yield base64.b64encode(pending).decode('ascii')
+
+
+async def json_with_base64(fields: dict, name: str, chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """A JSON object of `fields` plus `name` holding the chunks as base64,
+    streamed without building the string."""
+    head = json.dumps({**fields, name: ""})
+    yield head[:-2].encode()  # up to the opening quote of the empty value
+    async for piece in base64_chunks(chunks):
+        yield piece.encode()
+    yield b'"}'
+
+
+class RequestSizeLimitMiddleware:
+    """Rejects request bodies over `max_bytes` with 413 before they are read.
+
+    Starlette spools a multipart body to disk before any handler runs, so
+    the per-file limits in read_upload only apply once the whole upload has
+    arrived. A declared Content-Length over the limit is refused without
+    reading; a body sent without one is cut off once it passes the limit.
+    """
+
+    def __init__(self, app, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Routes turn this into a 413 response
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {self.max_bytes} bytes")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse({"detail": f"Request body exceeds {self.max_bytes} bytes"}, status_code=413,
+                                headers={"Connection": "close"})
+        await response(scope, receive, send)
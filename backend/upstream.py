@@ -0,0 +1,113 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+import metrics
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream the breaker has given up on."""
+
+
+class CircuitBreaker:
+    """Stops calling an upstream after repeated failures.
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail immediately with CircuitOpenError. Once `reset_timeout`
+    seconds have passed one probe call is let through (half-open): success
+    closes the circuit, failure opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            metrics.circuit_transitions.inc(self.name, state)
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    @property
+    def tripped(self) -> bool:
+        """Open or probing: callers should not wait on the upstream."""
+        return self.state != CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        self._probing = False
+        self._transition(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(OPEN)
+
+    @asynccontextmanager
+    async def guard(self):
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            yield
+        except BaseException:
+            # Includes cancellation, so an abandoned probe never wedges half-open
+            self.record_failure()
+            raise
+        self.record_success()
+
+    def status(self) -> dict:
+        return {"state": self.state, "failures": self.failures}
+
+
+class SingleFlight:
+    """Runs at most one task per key; later callers share the running one.
+
+    Tasks outlive the request that started them, so a caller that stops
+    waiting still lets the result land (e.g. in a cache) for the next.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def run(self, key: Hashable, start: Callable[[], Awaitable[object]]) -> asyncio.Task:
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.create_task(start())
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Retrieve the exception so an unawaited failure is not logged as lost
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+
+async def wait_briefly(task: asyncio.Task, timeout: Optional[float]):
+    """The task's result if it finishes within `timeout`, without cancelling it otherwise."""
+    return await asyncio.wait_for(asyncio.shield(task), timeout)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindFull(Exception):
+    """Raised instead of queueing a write while the queue is full and the
+    database is not taking writes."""
+
+
+class WriteBehindQueue:
+    """Coalesces small MongoDB writes per key and applies them with bulk_write.
+
+    A write for a key that is already pending replaces it (the last write
+    wins), so a burst of writes to one document costs one operation. Pending
+    writes go out every `window` seconds, or as soon as `max_batch` of them
+    are waiting, one unordered bulk_write per collection. Flushes run one at
+    a time, so writes to a key are applied in the order they were made.
+
+    Durability: at most `max_pending` writes wait at once; past that a
+    writer flushes before queueing (backpressure, not unbounded memory).
+    `close()` flushes everything left, so a clean shutdown loses nothing and
+    a crash loses at most one window. Writes in a batch that fails on a
+    connection error are queued again, unless a newer write for the key
+    arrived, and dropped after `max_attempts` tries. While the database is
+    failing a full queue does not flush on every write: `put` raises
+    WriteBehindFull and the caller writes directly or sheds the write.
+    """
+
+    def __init__(self, window: float = 0.2, max_batch: int = 500, max_pending: int = 10_000,
+                 max_attempts: int = 3):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        # key -> (collection, operation, failed attempts)
+        self._pending: Dict[Hashable, Tuple[object, object, int]] = {}
+        self._failing = False
+        self._flush_lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def put(self, collection, key: Hashable, operation):
+        """Queue a pymongo write model (UpdateOne, InsertOne, ...) for `key`."""
+        if self._closed:
+            await collection.bulk_write([operation])
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        if len(self._pending) >= self.max_pending and key not in self._pending:
+            metrics.write_behind_backpressure.inc()
+            # The flush loop retries a failing database every window; a
+            # writer waiting on it too would only pile up behind it
+            if not self._failing:
+                await self.flush()
+            if len(self._pending) >= self.max_pending and key not in self._pending:
+                metrics.write_behind_failures.inc(collection.name, "shed")
+                raise WriteBehindFull(f"{len(self._pending)} writes pending and the last flush failed")
+        if key in self._pending:
+            metrics.write_behind_coalesced.inc(collection.name)
+        self._pending[key] = (collection, operation, 0)
+        metrics.write_behind_pending.set(len(self._pending))
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.window)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            metrics.write_behind_pending.set(0)
+            by_collection: Dict[str, List[Tuple[Hashable, object, int]]] = {}
+            collections = {}
+            for key, (collection, operation, attempts) in batch.items():
+                by_collection.setdefault(collection.name, []).append((key, operation, attempts))
+                collections[collection.name] = collection
+            for name, writes in by_collection.items():
+                for i in range(0, len(writes), self.max_batch):
+                    await self._write(collections[name], writes[i:i + self.max_batch])
+
+    async def _write(self, collection, writes: List[Tuple[Hashable, object, int]]):
+        from pymongo.errors import BulkWriteError, ConnectionFailure
+
+        started = time.perf_counter()
+        try:
+            await collection.bulk_write([operation for _, operation, _ in writes], ordered=False)
+            self._failing = False
+        except BulkWriteError as e:
+            self._failing = False
+            # Rejected writes (e.g. validation) would fail again; the rest applied
+            metrics.write_behind_failures.inc(collection.name, "rejected", amount=len(e.details.get('writeErrors', [])))
+            logger.error(f"Write-behind batch to {collection.name} had rejected writes: {e.details.get('writeErrors', [])[:3]}")
+        except ConnectionFailure as e:
+            self._failing = True
+            metrics.write_behind_failures.inc(collection.name, "connection", amount=len(writes))
+            if self._closed:
+                logger.error(f"Write-behind dropped {len(writes)} writes to {collection.name} at shutdown: {e}")
+                return
+            dropped = 0
+            for key, operation, attempts in writes:
+                if attempts + 1 >= self.max_attempts:
+                    dropped += 1
+                else:
+                    self._pending.setdefault(key, (collection, operation, attempts + 1))
+            metrics.write_behind_pending.set(len(self._pending))
+            if dropped:
+                metrics.write_behind_failures.inc(collection.name, "dropped", amount=dropped)
+                logger.error(f"Write-behind dropped {dropped} writes to {collection.name} "
+                             f"after {self.max_attempts} attempts: {e}")
+            if dropped < len(writes):
+                logger.warning(f"Write-behind batch to {collection.name} failed, retrying next window: {e}")
+        finally:
+            metrics.write_behind_batch_size.observe(len(writes), collection.name)
+            metrics.write_behind_flush_duration.observe(time.perf_counter() - started, collection.name)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def close(self):
+        """Stop the flush loop and apply every pending write."""
+        self._closed = True
+        if self._task is not None:
+            # Not cancelled: a flush in progress must finish, not drop its batch
+            self._full.set()
+            await self._task
+            self._task = None
+        await self.flush()
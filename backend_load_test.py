@@ -0,0 +1,746 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+from backend_test import SUPERADMIN_CREDENTIALS
+
+ROOT_DIR = Path(__file__).parent
+BACKEND_DIR = ROOT_DIR / 'backend'
+RESULTS_FILE = ROOT_DIR / 'backend_load_test_results.json'
+
+
+# ==================== STUB ALADHAN ====================
+
+STUB_TIMINGS = {"Fajr": "05:12", "Dhuhr": "12:20", "Asr": "15:45", "Maghrib": "18:05", "Isha": "19:30"}
+
+
+class StubAladhanHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    failure_rate = 0.0
+    requests_served = 0
+
+    def do_GET(self):
+        type(self).requests_served += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            self.send_error(503, "Injected failure")
+            return
+        body = json.dumps({"data": self.calendar() if self.path.startswith("/v1/calendar/") else {"timings": STUB_TIMINGS}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def calendar(self):
+        # /v1/calendar/{year}/{month} is a list of days; /v1/calendar/{year} maps month -> days
+        parts = self.path.split("?")[0].split("/")[3:]
+        year = int(parts[0])
+        months = [int(parts[1])] if len(parts) > 1 else range(1, 13)
+        calendar = {}
+        for month in months:
+            day, days = date(year, month, 1), []
+            while day.month == month:
+                days.append({"timings": {name: f"{value} (UTC)" for name, value in STUB_TIMINGS.items()},
+                             "date": {"gregorian": {"date": day.strftime("%d-%m-%Y")}}})
+                day += timedelta(days=1)
+            calendar[str(month)] = days
+        return calendar[parts[1]] if len(parts) > 1 else calendar
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_aladhan(latency: float = 0.0, failure_rate: float = 0.0):
+    StubAladhanHandler.latency = latency
+    StubAladhanHandler.failure_rate = failure_rate
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubAladhanHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# ==================== LOCAL APP ====================
+
+def use_backend_modules():
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+
+
+async def build_local_app(aladhan_url: str, storage: str = "mongomock"):
+    """Import server.py against in-process storage and seed it.
+
+    "mongomock" runs the MongoDB repositories against an in-memory Mongo
+    stand-in; "memory" uses the in-memory repositories directly.
+    """
+    from mongomock_motor import AsyncMongoMockClient
+
+    os.environ.setdefault('DB_NAME', 'load_test')
+    os.environ.setdefault('INSECURE_RANDOM_JWT_SECRET', 'true')
+    os.environ['ALADHAN_BASE_URL'] = aladhan_url
+    # Measure raw capacity: rate limits and admission caps would otherwise
+    # turn the benchmark into a test of the limiter. Override to test shedding.
+    for name in ('AUTH_IP_RATE_PER_MINUTE', 'AUTH_USER_RATE_PER_MINUTE',
+                 'PRAYER_TIMES_RATE_PER_MINUTE', 'LISTING_RATE_PER_MINUTE'):
+        os.environ.setdefault(name, '1000000')
+    for name in ('AUTH_CONCURRENCY', 'UPSTREAM_CONCURRENCY', 'LISTING_CONCURRENCY'):
+        os.environ.setdefault(name, '1000')
+    use_backend_modules()
+
+    import server
+    from seed_data import seed_database
+
+    if storage == "memory":
+        server.services.override(storage=server.MemoryStorage(server.FEED_SIZE))
+    else:
+        server.services.override(db=AsyncMongoMockClient()[os.environ['DB_NAME']])
+    await seed_database(server.services.storage)
+    return server.app
+
+
+# ==================== SCENARIOS ====================
+# Each scenario mirrors a flow from SalahReminderAPITester and issues one
+# request per call so latencies are comparable across scenarios.
+
+class LoadContext:
+    def __init__(self):
+        self.mosque_ids = []
+        self.user_ids = []
+        self.start_date = datetime.now().date()
+
+    def mosque(self):
+        return random.choice(self.mosque_ids)
+
+    def date(self, spread_days: int = 30):
+        return (self.start_date + timedelta(days=random.randrange(spread_days))).isoformat()
+
+
+async def scenario_login(client, ctx):
+    return await client.post("/api/auth/login", json=SUPERADMIN_CREDENTIALS)
+
+
+async def scenario_prayer_times(client, ctx):
+    return await client.get(f"/api/prayer-times/{ctx.mosque()}", params={"date": ctx.date()})
+
+
+async def scenario_posts(client, ctx):
+    return await client.get("/api/posts", params={"mosque_id": ctx.mosque(), "status": "approved"})
+
+
+async def scenario_favorites(client, ctx):
+    user_id = random.choice(ctx.user_ids)
+    response = await client.post(f"/api/users/{user_id}/favorites/{ctx.mosque()}")
+    if response.status_code != 200:
+        return response
+    return await client.get(f"/api/users/{user_id}/favorites")
+
+
+async def scenario_mosques(client, ctx):
+    return await client.get("/api/mosques")
+
+
+SCENARIOS = {
+    "login": scenario_login,
+    "prayer_times": scenario_prayer_times,
+    "posts": scenario_posts,
+    "favorites": scenario_favorites,
+    "mosques": scenario_mosques,
+}
+
+
+async def prepare(client, ctx, users: int = 20):
+    response = await client.get("/api/mosques")
+    response.raise_for_status()
+    ctx.mosque_ids = [mosque['id'] for mosque in response.json()]
+    if not ctx.mosque_ids:
+        raise RuntimeError("No mosques available; seed the database first")
+
+    run_id = datetime.now().strftime('%H%M%S')
+    for i in range(users):
+        response = await client.post("/api/auth/register", data={
+            'email': f"loaduser_{run_id}_{i}@test.com",
+            'password': 'testpass123',
+            'role': 'user'
+        })
+        response.raise_for_status()
+        ctx.user_ids.append(response.json()['id'])
+
+
+# ==================== RUNNER ====================
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(client, ctx, name: str, total: int, concurrency: int) -> dict:
+    scenario = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await scenario(client, ctx)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run_load_test(args) -> dict:
+    stub = None
+    if args.base_url:
+        transport = None
+        base_url = args.base_url
+        target = args.base_url
+    else:
+        stub, aladhan_url = start_stub_aladhan(args.upstream_latency, args.upstream_failure_rate)
+        app = await build_local_app(aladhan_url, args.storage)
+        transport = httpx.ASGITransport(app=app)
+        base_url = "http://testserver"
+        target = f"in-process ({args.storage})"
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(transport=transport, base_url=base_url, limits=limits, timeout=30) as client:
+        ctx = LoadContext()
+        await prepare(client, ctx)
+
+        results = {}
+        for name in args.scenarios:
+            total = args.login_requests if name == "login" else args.requests
+            results[name] = await run_scenario(client, ctx, name, total, args.concurrency)
+            r = results[name]
+            print(f"{name:<14} {r['throughput_rps']:>9.1f} req/s  p50 {r['p50_ms']:>8.2f}ms  "
+                  f"p95 {r['p95_ms']:>8.2f}ms  p99 {r['p99_ms']:>8.2f}ms  errors {r['errors']}")
+
+    fallbacks = cache_hit_ratios = None
+    if stub:
+        stub.shutdown()
+        import metrics
+        fallbacks = {labels[0]: count for labels, count in metrics.fallback_responses._values.items()}
+        if fallbacks:
+            print(f"stand-in prayer times served: {fallbacks}")
+        lookups = {}
+        for (cache, result), count in metrics.cache_requests._values.items():
+            lookups.setdefault(cache, {"hit": 0, "miss": 0})[result] += count
+        cache_hit_ratios = {cache: round(c["hit"] / (c["hit"] + c["miss"]), 4) for cache, c in lookups.items()}
+        for cache, ratio in cache_hit_ratios.items():
+            print(f"cache {cache:<18} hit ratio {ratio:.1%}")
+
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "target": target,
+        "concurrency": args.concurrency,
+        "upstream_requests": StubAladhanHandler.requests_served if stub else None,
+        "upstream_fallbacks": fallbacks,
+        "cache_hit_ratios": cache_hit_ratios,
+        "scenarios": results,
+    }
+
+
+# ==================== MICRO-BENCHMARKS ====================
+# In-process timings of the data structures behind the heavier routes, on
+# deterministic synthetic data. `--benchmark NAME` runs one instead of the
+# HTTP load test.
+
+SYNTHETIC_START = date(2025, 1, 1)
+SYNTHETIC_CREATED_AT = "2025-01-01T00:00:00+00:00"
+
+
+def synthetic_mosques(count: int, seed: int = 42):
+    """The seeded RNG (for further draws) and `count` seed_data mosques."""
+    use_backend_modules()
+    from seed_data import generate_mosques
+
+    rng = random.Random(seed)
+    return rng, list(generate_mosques(rng, count, SYNTHETIC_CREATED_AT))
+
+
+def synthetic_rows(latitude: float, longitude: float, days: int, start: date = SYNTHETIC_START) -> list:
+    """One API-style prayer-time row per day, from seed_data's approximation."""
+    use_backend_modules()
+    from seed_data import approximate_prayer_times
+
+    return [{"date": (start + timedelta(days=offset)).isoformat(), "created_at": SYNTHETIC_CREATED_AT,
+             "is_manual": False, **approximate_prayer_times(latitude, longitude, start + timedelta(days=offset))}
+            for offset in range(days)]
+
+
+def benchmark_snapshots(args):
+    """Build, encode and delta a synthetic region bundle (see snapshots.py)."""
+    from snapshots import MosqueTimetable, Snapshot
+
+    mosques, days = args.mosques, args.days
+    _, mosque_docs = synthetic_mosques(mosques, args.seed)
+
+    # Synthetic rows are computed per mosque outside the timed section
+    build_seconds = 0.0
+    snapshot = Snapshot(SYNTHETIC_START, days)
+    for mosque in mosque_docs:
+        docs = synthetic_rows(mosque['latitude'], mosque['longitude'], days)
+        build_start = time.perf_counter()
+        snapshot.timetables.append(MosqueTimetable.from_docs(mosque, docs, SYNTHETIC_START, days))
+        build_seconds += time.perf_counter() - build_start
+
+    encode_start = time.perf_counter()
+    raw_size = len(snapshot.payload())
+    bundle = snapshot.encode()
+    encode_seconds = time.perf_counter() - encode_start
+
+    # One manual override somewhere, then the delta a synced client downloads
+    as_of = snapshot.as_of
+    override = snapshot.timetables[len(snapshot.timetables) // 2]
+    override.times[10] += 5
+    override.changed_at[10] = "2025-06-01T00:00:00+00:00"
+    snapshot._encoded = None
+    delta = json.dumps(snapshot.delta(as_of), separators=(",", ":")).encode()
+
+    print(f"{mosques:,} mosques x {days} days")
+    print(f"  timetables built   {build_seconds:8.2f}s")
+    print(f"  encode + gzip      {encode_seconds:8.2f}s")
+    print(f"  raw payload        {raw_size / 1e6:8.2f}MB")
+    print(f"  gzip bundle        {len(bundle) / 1e6:8.2f}MB  ({len(bundle) / mosques:,.0f} bytes/mosque)")
+    print(f"  one-day delta      {len(delta):8,d} bytes")
+
+
+def benchmark_ical(args, runs: int = 200):
+    """Render a year of one mosque's feed cold, then assemble it from the cache (see ical.py)."""
+    from ical import CALENDAR_FOOTER, CalendarCache, MonthBlock, calendar_header, feed_etag, month_bounds, month_keys
+
+    days = args.days
+    mosque = {"id": "benchmark", "name": "Masjid Al-Noor", "address": "1 Main St", "city": "Toronto",
+              "country": "Canada", "latitude": 43.65, "longitude": -79.38, "timezone": "America/Toronto"}
+    start, end = SYNTHETIC_START, SYNTHETIC_START + timedelta(days=days - 1)
+    docs = synthetic_rows(mosque['latitude'], mosque['longitude'], days)
+    cache = CalendarCache()
+    first, last = start.isoformat(), end.isoformat()
+
+    def render() -> bytes:
+        header = calendar_header(mosque)
+        blocks = []
+        for key in month_keys(mosque['id'], start, end):
+            block = cache.get(key)
+            if block is None:
+                month_first, month_last = month_bounds(key[1], key[2])
+                block = MonthBlock.build(mosque, (doc for doc in docs if month_first <= doc['date'] <= month_last))
+                cache.put(key, block)
+            blocks.append(block)
+        feed_etag(header, first, last, blocks)
+        return header + b"".join(block.between(first, last) for block in blocks) + CALENDAR_FOOTER
+
+    cold_start = time.perf_counter()
+    body = render()
+    cold = time.perf_counter() - cold_start
+    warm_start = time.perf_counter()
+    for _ in range(runs):
+        render()
+    warm = (time.perf_counter() - warm_start) / runs
+
+    print(f"{days} days, {body.count(b'BEGIN:VEVENT'):,} events, {len(body) / 1e3:.0f}kB")
+    print(f"  cold render        {cold * 1000:8.2f}ms")
+    print(f"  cached render      {warm * 1000:8.2f}ms")
+
+
+def benchmark_timetable_store(args):
+    """Build a store for synthetic mosques and time lookups and manual overrides (see timetable_store.py)."""
+    import tempfile
+
+    from timetable_store import StoreWriter, TimetableStore, encode_row
+    from timezones import PRAYERS
+
+    mosques, days, lookups = args.mosques, args.days, args.lookups
+    rng, mosque_docs = synthetic_mosques(mosques, args.seed)
+    offsets = {(SYNTHETIC_START + timedelta(days=offset)).isoformat(): offset for offset in range(days)}
+    # Neighbouring mosques share times closely enough for a lookup benchmark
+    by_city = {}
+    for mosque in mosque_docs:
+        if mosque['city'] not in by_city:
+            by_city[mosque['city']] = synthetic_rows(mosque['latitude'], mosque['longitude'], days)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "timetables.bin")
+        build_start = time.perf_counter()
+        with StoreWriter(path, SYNTHETIC_START, days, [mosque['id'] for mosque in mosque_docs]) as writer:
+            for mosque in mosque_docs:
+                writer.append(encode_row(by_city[mosque['city']], offsets, days))
+        build_seconds = time.perf_counter() - build_start
+        store = TimetableStore(path)
+
+        keys = [(rng.choice(mosque_docs)['id'], rng.choice(list(offsets))) for _ in range(10_000)]
+        plan = [keys[i % len(keys)] for i in range(lookups)]
+        results = []
+        for name, lookup in (("minutes (zero-copy view)", store.minutes), ("get (document)", store.get)):
+            started = time.perf_counter()
+            for mosque_id, day in plan:
+                lookup(mosque_id, day)
+            results.append((name, lookups / (time.perf_counter() - started)))
+        manual = {prayer: "05:00" for prayer in PRAYERS}
+        started = time.perf_counter()
+        for mosque_id, day in keys:
+            store.put(mosque_id, day, manual, True, SYNTHETIC_CREATED_AT)
+        put_rate = len(keys) / (time.perf_counter() - started)
+
+        print(f"{mosques:,} mosques x {days} days")
+        print(f"  build + write      {build_seconds:8.2f}s  ({store.nbytes / 1e6:.1f}MB file)")
+        for name, rate in results:
+            print(f"  {name:<26} {rate / 1e6:6.2f}M lookups/s")
+        print(f"  {'put (manual override)':<26} {put_rate / 1e6:6.2f}M writes/s")
+        del store
+
+
+def benchmark_reminders(args):
+    """Subscribe synthetic users and run one simulated day of reminders (see reminders.py)."""
+    import tracemalloc
+
+    from reminders import PRAYERS, ReminderDispatcher, SimulatedClock
+
+    class CountingSink:
+        def __init__(self):
+            self.batches = 0
+            self.reminders = 0
+
+        async def deliver(self, batch):
+            self.batches += 1
+            self.reminders += len(batch.subscribers)
+
+    async def run():
+        subscriptions, mosques = args.subscriptions, args.mosques
+        clock = SimulatedClock(datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp())
+        sink = CountingSink()
+        dispatcher = ReminderDispatcher([sink], clock=clock)
+
+        tracemalloc.start()
+        for i in range(subscriptions):
+            dispatcher.subscribe(f"m{i % mosques}", f"u{i}")
+        for m in range(mosques):
+            offset = m % 120  # spread mosques over two hours of longitude
+            times = {p: f"{(5 + 4 * n + offset // 60) % 24:02d}:{offset % 60:02d}" for n, p in enumerate(PRAYERS)}
+            dispatcher.schedule_day(f"m{m}", SYNTHETIC_START.isoformat(), times)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        runner = asyncio.create_task(dispatcher.run())
+        start = time.perf_counter()
+        for _ in range(24 * 60):
+            clock.advance(60)
+            await asyncio.sleep(0)
+        while dispatcher.pending() and dispatcher._heap[0][0] <= clock.now():
+            await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+        runner.cancel()
+
+        print(f"{dispatcher.subscription_count:,} subscriptions, {mosques:,} mosques")
+        print(f"  memory             {memory / 1e6:8.1f}MB  ({memory / subscriptions:.0f} bytes/subscription)")
+        print(f"  fired              {dispatcher.fired:8,d} mosque-prayers in {sink.batches:,} batches")
+        print(f"  delivered          {sink.reminders:8,d} reminders in {elapsed:.2f}s")
+
+    asyncio.run(run())
+
+
+def benchmark_metrics(args, requests_count: int = 20000, rounds: int = 10, sample_rate: float = 0.05):
+    """Time MetricsMiddleware per request against a no-op FastAPI route (see metrics.py).
+
+    End-to-end throughput varies by more than the budget between runs, so
+    the middleware is timed around an empty ASGI app, and the route once
+    on its own.
+    """
+    import gc
+
+    from fastapi import FastAPI
+
+    from metrics import MetricsMiddleware
+
+    app = FastAPI()
+
+    @app.get("/ping/{item}")
+    async def ping(item: str):
+        return {"item": item}
+
+    async def empty(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    scopes = [{"type": "http", "method": "GET", "path": f"/ping/{i}", "raw_path": b"", "root_path": "",
+               "query_string": b"", "headers": [], "app": app, "http_version": "1.1", "scheme": "http",
+               "server": ("test", 80), "client": ("test", 1)} for i in range(requests_count)]
+
+    async def seconds_per_request(target) -> float:
+        # Best of several rounds, without GC pauses, to filter scheduler noise
+        best = float("inf")
+        for _ in range(rounds):
+            gc.collect()
+            gc.disable()
+            start = time.perf_counter()
+            for scope in scopes:
+                await target(dict(scope), receive, send)
+            best = min(best, (time.perf_counter() - start) / requests_count)
+            gc.enable()
+        return best
+
+    async def run():
+        route = await seconds_per_request(app)
+        bare = await seconds_per_request(empty)
+        print(f"  no-op route          {route * 1e6:8.2f}us")
+        for rate in (1.0, sample_rate):
+            cost = await seconds_per_request(MetricsMiddleware(empty, rate)) - bare
+            print(f"  sample rate {rate:<5}  {cost * 1e6:8.2f}us  ({cost / route * 100:.1f}% of the route)")
+
+    asyncio.run(run())
+
+
+def benchmark_feeds(args, rounds: int = 200):
+    """Compare materialized feed reads with the sorted posts query they replace (see feeds.py).
+
+    Runs against mongomock, so the absolute numbers only compare the two
+    reads with each other.
+    """
+    from mongomock_motor import AsyncMongoMockClient
+
+    from feeds import FeedStore
+    from seed_data import generate_posts
+
+    rng, mosque_docs = synthetic_mosques(args.mosques, args.seed)
+    mosque_ids = [mosque['id'] for mosque in mosque_docs]
+    start = datetime(SYNTHETIC_START.year, SYNTHETIC_START.month, SYNTHETIC_START.day)
+    posts = list(generate_posts(rng, args.posts, mosque_ids, "benchmark-admin", start))
+
+    async def timed(fn, sample):
+        samples = []
+        for i in range(rounds):
+            started = time.perf_counter()
+            await fn(sample[i % len(sample)])
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        return samples[len(samples) // 2], samples[int(len(samples) * 0.95) - 1]
+
+    async def run():
+        db = AsyncMongoMockClient()["benchmark"]
+        await db.posts.insert_many(posts)
+        store = FeedStore(db.feeds, db.posts)
+        sample = list({post['mosque_id'] for post in posts if post['status'] == "approved"})[:rounds]
+        for mosque_id in sample:
+            await store.rebuild(mosque_id)
+
+        async def query(mosque_id):
+            await db.posts.find({"mosque_id": mosque_id, "status": "approved"},
+                                {"_id": 0}).sort("created_at", -1).to_list(1000)
+
+        print(f"{len(posts):,} posts over {len(mosque_ids):,} mosques, {rounds} reads")
+        for name, fn in (("sorted query", query), ("materialized feed", store.read)):
+            p50, p95 = await timed(fn, sample)
+            print(f"  {name:<18} p50 {p50:7.2f}ms  p95 {p95:7.2f}ms")
+
+    asyncio.run(run())
+
+
+def benchmark_timezones(args, lookups: int = 100_000):
+    """Time the offline coordinate-to-zone lookups, uncached and cached (see timezones.py)."""
+    from timezones import HAVE_TIMEZONEFINDER, TimezoneResolver
+
+    resolver = TimezoneResolver(cache_size=0)
+    start = time.perf_counter()
+    resolver.lookup(21.4225, 39.8262)
+    load = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(lookups)]
+    start = time.perf_counter()
+    for lat, lng in points:
+        resolver.lookup(lat, lng)
+    uncached = (time.perf_counter() - start) / lookups
+
+    cached = TimezoneResolver()
+    cached.load()
+    hot = points[:100]
+    start = time.perf_counter()
+    for i in range(lookups):
+        cached.lookup(*hot[i % len(hot)])
+    cached_seconds = (time.perf_counter() - start) / lookups
+
+    print(f"{lookups:,} lookups ({'timezonefinder' if HAVE_TIMEZONEFINDER else 'zone1970.tab'})")
+    print(f"  load + first lookup  {load * 1000:8.1f}ms")
+    print(f"  uncached lookup      {uncached * 1e6:8.2f}us")
+    print(f"  cached lookup        {cached_seconds * 1e6:8.2f}us")
+
+
+def benchmark_import(args, module: str = "server", runs: int = 5, top: int = 10):
+    """Time a cold `import <module>` in fresh interpreters (see services.py).
+
+    Reports the median wall time and the slowest top-level imports from
+    `python -X importtime`, so regressions in startup cost are visible.
+    """
+    import statistics
+    import subprocess
+
+    env = {**os.environ, "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+           "DB_NAME": os.environ.get("DB_NAME", "import_benchmark"),
+           "JWT_SECRET": os.environ.get("JWT_SECRET", "import-benchmark")}
+    totals = []
+    cumulative = {}
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+        totals.append(time.perf_counter() - start)
+        # Children are printed before their parent, so collect the direct
+        # imports seen since the last top-level entry until `module` shows up
+        children = []
+        for line in result.stderr.splitlines():
+            _, cumulative_us, name = line.split("|")
+            if not cumulative_us.strip().isdigit():
+                continue
+            depth = (len(name) - len(name.lstrip())) // 2
+            if depth == 0:
+                if name.strip() == module:
+                    for child, micros in children:
+                        cumulative.setdefault(child, []).append(micros)
+                children = []
+            elif depth == 1:
+                children.append((name.strip(), int(cumulative_us)))
+
+    print(f"python -c 'import {module}': median {statistics.median(totals) * 1000:.0f}ms over {runs} runs")
+    slowest = sorted(((statistics.median(v), k) for k, v in cumulative.items()), reverse=True)[:top]
+    for micros, name in slowest:
+        print(f"  {name:<28} {micros / 1000:7.1f}ms")
+
+
+def benchmark_aladhan(args, requests: int = 100_000):
+    """Count Aladhan requests per fetch strategy and simulate the grid cache (see aladhan.py)."""
+    from aladhan import DEFAULT_GRID_DEGREES, GridTimetableCache, grid_cell, grid_key, months_between
+
+    rng, mosque_docs = synthetic_mosques(args.mosques, args.seed)
+    first, days = SYNTHETIC_START, args.days
+    last = first + timedelta(days=days - 1)
+    months = len(months_between(first, last))
+    years = last.year - first.year + 1
+
+    def simulate(grid_degrees: float) -> dict:
+        # Random (mosque, day) lookups, filling a key's whole month on each
+        # miss as the server does
+        cache = GridTimetableCache()
+        for _ in range(requests):
+            mosque = rng.choice(mosque_docs)
+            day = first + timedelta(days=rng.randrange(days))
+            key = grid_key(mosque['latitude'], mosque['longitude'], mosque.get('timezone'), grid_degrees)
+            if cache.get(key, day.isoformat()) is None:
+                month = {}
+                current = day.replace(day=1)
+                while current.month == day.month:
+                    month[current.isoformat()] = {}
+                    current += timedelta(days=1)
+                cache.put_many(key, month)
+        return cache.stats()
+
+    print(f"{len(mosque_docs):,} synthetic mosques, {days} days from {first}")
+    for grid_degrees in (0.01, DEFAULT_GRID_DEGREES, 0.1):
+        cells = len({grid_cell(m['latitude'], m['longitude'], grid_degrees) for m in mosque_docs})
+        keys = len({grid_key(m['latitude'], m['longitude'], m.get('timezone'), grid_degrees) for m in mosque_docs})
+        print(f"\ngrid {grid_degrees} degrees: {cells:,} cells ({len(mosque_docs) / cells:.1f} mosques/cell)")
+        counts = {
+            "daily timings": len(mosque_docs) * days,
+            "monthly calendar": len(mosque_docs) * months,
+            "monthly calendar per cell": keys * months,
+            "yearly calendar per cell": keys * years,
+        }
+        baseline = counts["daily timings"]
+        for strategy, count in counts.items():
+            print(f"  {strategy:<28} {count:>12,}  ({baseline / count:,.0f}x fewer)")
+        stats = simulate(grid_degrees)
+        print(f"  grid cache, {requests:,} random lookups: hit ratio {stats['hit_ratio']:.1%} "
+              f"({stats['misses']:,} upstream calls)")
+
+
+BENCHMARKS = {
+    "snapshots": benchmark_snapshots,
+    "ical": benchmark_ical,
+    "timetable_store": benchmark_timetable_store,
+    "reminders": benchmark_reminders,
+    "metrics": benchmark_metrics,
+    "feeds": benchmark_feeds,
+    "timezones": benchmark_timezones,
+    "import": benchmark_import,
+    "aladhan": benchmark_aladhan,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Salah Reminder API")
+    parser.add_argument("--base-url", help="Run against a live server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000, help="Requests per scenario")
+    parser.add_argument("--login-requests", type=int, default=100, help="Requests for the bcrypt-bound login scenario")
+    parser.add_argument("--upstream-latency", type=float, default=0.0, help="Stub Aladhan delay in seconds")
+    parser.add_argument("--upstream-failure-rate", type=float, default=0.0,
+                        help="Fraction of stub Aladhan requests answered with 503, to test outages")
+    parser.add_argument("--storage", default="mongomock", choices=["mongomock", "memory"],
+                        help="Storage for the in-process app")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--output", default=str(RESULTS_FILE))
+    parser.add_argument("--benchmark", choices=list(BENCHMARKS),
+                        help="Run a synthetic micro-benchmark instead of the load test")
+    parser.add_argument("--mosques", type=int, default=10_000, help="Synthetic mosques for --benchmark")
+    parser.add_argument("--days", type=int, default=365, help="Days of prayer times for --benchmark")
+    parser.add_argument("--seed", type=int, default=42, help="Synthetic data seed for --benchmark")
+    parser.add_argument("--lookups", type=int, default=2_000_000, help="Lookups for --benchmark timetable_store")
+    parser.add_argument("--subscriptions", type=int, default=1_000_000,
+                        help="Favourite-mosque subscriptions for --benchmark reminders")
+    parser.add_argument("--posts", type=int, default=10_000, help="Synthetic posts for --benchmark feeds")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        use_backend_modules()
+        BENCHMARKS[args.benchmark](args)
+        return 0
+
+    print(f"🚀 Load testing {', '.join(args.scenarios)} at concurrency {args.concurrency}")
+    print("=" * 50)
+    results = asyncio.run(run_load_test(args))
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📊 Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
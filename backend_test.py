@@ -1,19 +1,33 @@
+import argparse
+import asyncio
 import requests
 import sys
 import json
 import base64
-from datetime import datetime
+import uuid
+from datetime import datetime, timedelta, timezone
 import os
 
+SUPERADMIN_CREDENTIALS = {
+    "email": "superadmin@salah.com",
+    "password": "superadmin123"
+}
+
+# 1x1 PNG used wherever a file upload is needed
+DUMMY_PNG = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg==")
+
 class SalahReminderAPITester:
-    def __init__(self, base_url="https://prayerpal-14.preview.emergentagent.com"):
+    def __init__(self, base_url="https://prayerpal-14.preview.emergentagent.com", http=None):
         self.base_url = base_url
+        # Anything with requests' get/post/patch/delete, e.g. a TestClient
+        self.http = http or requests
         self.api_url = f"{base_url}/api"
         self.tests_run = 0
         self.tests_passed = 0
         self.test_results = []
         self.superadmin_user = None
         self.admin_user = None
+        self.admin_session = None
         self.regular_user = None
         self.mosque_id = None
         self.admin_id = None
@@ -40,25 +54,27 @@ class SalahReminderAPITester:
         })
         return success
 
-    def run_test(self, name, method, endpoint, expected_status, data=None, files=None, params=None, use_form=False):
-        """Run a single API test"""
+    def run_test(self, name, method, endpoint, expected_status, data=None, files=None, params=None, use_form=False, as_user=None):
+        """Run a single API test, with `as_user`'s bearer token (a login response) if given"""
         url = f"{self.api_url}/{endpoint}"
         headers = {}
+        if as_user and as_user.get('access_token'):
+            headers['Authorization'] = f"Bearer {as_user['access_token']}"
         
         try:
             if method == 'GET':
-                response = requests.get(url, headers=headers, params=params, timeout=10)
+                response = self.http.get(url, headers=headers, params=params, timeout=10)
             elif method == 'POST':
                 if files is not None or use_form:
-                    response = requests.post(url, data=data, files=files, headers=headers, timeout=10)
+                    response = self.http.post(url, data=data, files=files, headers=headers, timeout=10)
                 else:
                     headers['Content-Type'] = 'application/json'
-                    response = requests.post(url, json=data, headers=headers, timeout=10)
+                    response = self.http.post(url, json=data, headers=headers, timeout=10)
             elif method == 'PATCH':
                 headers['Content-Type'] = 'application/json'
-                response = requests.patch(url, json=data, headers=headers, params=params, timeout=10)
+                response = self.http.patch(url, json=data, headers=headers, params=params, timeout=10)
             elif method == 'DELETE':
-                response = requests.delete(url, headers=headers, params=params, timeout=10)
+                response = self.http.delete(url, headers=headers, params=params, timeout=10)
 
             success = response.status_code == expected_status
             details = f"Status: {response.status_code}"
@@ -125,10 +141,7 @@ class SalahReminderAPITester:
             "POST",
             "auth/login",
             200,
-            data={
-                "email": "superadmin@salah.com",
-                "password": "superadmin123"
-            }
+            data=SUPERADMIN_CREDENTIALS
         )
         if success:
             self.superadmin_user = response
@@ -158,7 +171,7 @@ class SalahReminderAPITester:
     def test_admin_registration(self):
         """Test admin registration with ID proof"""
         # Create a dummy image file for ID proof
-        dummy_image = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg==")
+        dummy_image = DUMMY_PNG
         
         try:
             # Use form data for file upload
@@ -201,7 +214,8 @@ class SalahReminderAPITester:
             "Get Pending Admins",
             "GET",
             "users/pending",
-            200
+            200,
+            as_user=self.superadmin_user
         )
         return success
 
@@ -216,7 +230,8 @@ class SalahReminderAPITester:
             "PATCH",
             f"users/{self.admin_id}/status",
             200,
-            params={"status": "approved"}
+            params={"status": "approved"},
+            as_user=self.superadmin_user
         )
         return success
 
@@ -236,6 +251,8 @@ class SalahReminderAPITester:
                 "password": "testpass123"
             }
         )
+        if success:
+            self.admin_session = response
         return success
 
     def test_prayer_times_api(self):
@@ -274,25 +291,28 @@ class SalahReminderAPITester:
                 "asr": "15:30",
                 "maghrib": "18:30",
                 "isha": "20:00"
-            }
+            },
+            as_user=self.superadmin_user
         )
         return success
 
     def test_create_post(self):
         """Test creating a community post"""
-        if not self.admin_id or not self.mosque_id:
-            self.log_test("Create Post", False, "No admin ID or mosque ID available")
+        if not self.admin_session:
+            self.log_test("Create Post", False, "No logged-in admin available")
             return False
             
+        # Admins post to their own mosque
         success, response = self.run_test(
             "Create Post",
             "POST",
-            f"posts?admin_id={self.admin_id}&mosque_id={self.mosque_id}",
+            f"posts?admin_id={self.admin_id}&mosque_id={self.admin_session['mosque_id']}",
             200,
             data={
                 "title": "Test Community Post",
                 "content": "This is a test post for the community feed."
-            }
+            },
+            as_user=self.admin_session
         )
         if success:
             self.post_id = response.get('id')
@@ -304,7 +324,8 @@ class SalahReminderAPITester:
             "Get Pending Posts",
             "GET",
             "posts/pending",
-            200
+            200,
+            as_user=self.superadmin_user
         )
         return success
 
@@ -319,7 +340,8 @@ class SalahReminderAPITester:
             "PATCH",
             f"posts/{self.post_id}/status",
             200,
-            data={"status": "approved"}
+            data={"status": "approved"},
+            as_user=self.superadmin_user
         )
         return success
 
@@ -345,7 +367,7 @@ class SalahReminderAPITester:
             return False
             
         # Create a dummy QR code image
-        dummy_qr = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8/5+hHgAHggJ/PchI7wAAAABJRU5ErkJggg==")
+        dummy_qr = DUMMY_PNG
         
         try:
             files = {'file': ('qr_code.png', dummy_qr, 'image/png')}
@@ -354,7 +376,8 @@ class SalahReminderAPITester:
                 "POST",
                 f"mosques/{self.mosque_id}/donation-qr",
                 200,
-                files=files
+                files=files,
+                as_user=self.superadmin_user
             )
             return success
         except Exception as e:
@@ -577,7 +600,8 @@ class SalahReminderAPITester:
             "Get User ID Proof",
             "GET",
             f"users/{self.admin_id}/id-proof",
-            200
+            200,
+            as_user=self.superadmin_user
         )
         
         if success and response.get('id_proof'):
@@ -947,9 +971,122 @@ class SalahReminderAPITester:
         
         return self.tests_passed == self.tests_run
 
+def run_in_process():
+    """Run the scenarios against server.py in this process, on in-memory
+    storage with a stub Aladhan, so no server, MongoDB or network is needed."""
+    from fastapi.testclient import TestClient
+    from backend_load_test import start_stub_aladhan, build_local_app
+
+    stub, aladhan_url = start_stub_aladhan()
+    try:
+        app = asyncio.run(build_local_app(aladhan_url, storage="memory"))
+        with TestClient(app) as http:
+            tester = SalahReminderAPITester("http://testserver", http=http)
+            success = tester.run_all_tests()
+    finally:
+        stub.shutdown()
+    return tester, success
+
+def run_replica_standin():
+    """Check read-preference routing with MONGO_SECONDARY_READS on.
+
+    A replica set stand-in: the primary and the secondary are two separate
+    in-memory Mongo databases, and "replication" copies the primary's
+    collections over on demand. Read-only routes must answer from the
+    secondary, lag included, while writes and read-after-write go to the
+    primary.
+    """
+    from fastapi.testclient import TestClient
+    from mongomock_motor import AsyncMongoMockClient
+    from backend_load_test import start_stub_aladhan, build_local_app
+
+    stub, aladhan_url = start_stub_aladhan()
+    try:
+        app = asyncio.run(build_local_app(aladhan_url, storage="mongomock"))
+        import server
+
+        primary = server.services.db
+        secondary = AsyncMongoMockClient()["replica_standin"]
+        server.MONGO_SECONDARY_READS = True
+        server.services.override(replica_db=secondary)
+        storage = server.services.storage
+
+        async def replicate():
+            for name in await primary.list_collection_names():
+                docs = await primary[name].find({}).to_list(None)
+                await secondary[name].delete_many({})
+                if docs:
+                    await secondary[name].insert_many(docs)
+
+        asyncio.run(replicate())
+        tester = SalahReminderAPITester("http://testserver")
+        with TestClient(app) as http:
+            api = "http://testserver/api"
+            mosque = http.get(f"{api}/mosques").json()[0]
+            asyncio.run(secondary.mosques.update_one({"id": mosque['id']}, {"$set": {"name": "Secondary copy"}}))
+            listed = {m['id']: m['name'] for m in http.get(f"{api}/mosques").json()}
+            single = http.get(f"{api}/mosques/{mosque['id']}").json()
+            tester.log_test("Mosque reads served by the secondary",
+                            listed.get(mosque['id']) == "Secondary copy" and single.get('name') == "Secondary copy")
+
+            created = http.post(f"{api}/mosques", json={
+                "name": "Replica Lag Masjid", "phone": "+1-555-0100", "address": "1 Lag Lane",
+                "district": "Downtown", "city": "Toronto", "state": "Ontario", "country": "Canada",
+                "latitude": 43.7, "longitude": -79.4,
+            }).json()
+            before = http.get(f"{api}/mosques/{created['id']}").status_code
+            asyncio.run(replicate())
+            after = http.get(f"{api}/mosques/{created['id']}").status_code
+            tester.log_test("New mosque visible once replicated", (before, after) == (404, 200),
+                            f"before {before}, after {after}")
+
+            # A miss stores the fetched month on the primary and re-reads it
+            # there, so it is answered without waiting for replication
+            day = (datetime.now() + timedelta(days=40)).date().isoformat()
+            times = http.get(f"{api}/prayer-times/{created['id']}", params={"date": day}).json()
+            tester.log_test("Prayer-time miss reads its own write", bool(times.get('fajr')) and not times.get('stale'),
+                            f"source {times.get('source', 'aladhan')}")
+
+            # A feed the secondary already holds lags until replicated
+            async def approve(title):
+                post = {"id": str(uuid.uuid4()), "mosque_id": created['id'], "admin_id": "replica-standin",
+                        "title": title, "content": "Approved on the primary", "status": "pending",
+                        "created_at": datetime.now(timezone.utc).isoformat()}
+                await storage.posts.insert(post)
+                await storage.posts.set_status(post['id'], "approved")
+                return post['id']
+
+            feed = lambda: [p['id'] for p in http.get(f"{api}/posts/feed", params={"mosque_id": created['id']}).json()]
+            first = asyncio.run(approve("First post"))
+            asyncio.run(replicate())
+            second = asyncio.run(approve("Second post"))
+            lagging = feed()
+            asyncio.run(replicate())
+            replicated = feed()
+            tester.log_test("Approved feed served by the secondary",
+                            lagging == [first] and replicated == [second, first],
+                            f"{len(lagging)} posts before replication, {len(replicated)} after")
+    finally:
+        stub.shutdown()
+    print(f"\n📊 Replica stand-in: {tester.tests_passed}/{tester.tests_run} tests passed")
+    return tester, tester.tests_passed == tester.tests_run
+
 def main():
-    tester = SalahReminderAPITester()
-    success = tester.run_all_tests()
+    parser = argparse.ArgumentParser(description="Salah Reminder API scenario tests")
+    parser.add_argument("--base-url", help="Server to test (default: the preview deployment)")
+    parser.add_argument("--in-process", action="store_true", help="Test server.py in this process on in-memory storage")
+    parser.add_argument("--replica-standin", action="store_true",
+                        help="Check secondary read routing in this process against a two-database replica set stand-in")
+    parser.add_argument("--output", default="/app/backend_test_results.json")
+    args = parser.parse_args()
+
+    if args.replica_standin:
+        tester, success = run_replica_standin()
+    elif args.in_process:
+        tester, success = run_in_process()
+    else:
+        tester = SalahReminderAPITester(args.base_url) if args.base_url else SalahReminderAPITester()
+        success = tester.run_all_tests()
     
     # Save detailed results
     results = {
@@ -960,7 +1097,7 @@ def main():
         "test_details": tester.test_results
     }
     
-    with open('/app/backend_test_results.json', 'w') as f:
+    with open(args.output, 'w') as f:
         json.dump(results, f, indent=2)
     
     return 0 if success else 1
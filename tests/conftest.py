@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# server.py refuses to start without a signing secret
+os.environ.setdefault("JWT_SECRET", "test-secret")
+
+# The backend modules import each other as top-level modules
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
@@ -0,0 +1,20 @@
+from aladhan import GridTimetableCache, grid_cell, grid_key, validate_zone_border
+
+
+def test_a_cell_across_a_zone_border_keeps_one_timetable_per_zone():
+    lisbon, madrid = grid_key(39.51, -7.41, "Europe/Lisbon"), grid_key(39.49, -7.39, "Europe/Madrid")
+    assert lisbon[0] == madrid[0] == grid_cell(39.5, -7.4)
+    cache = GridTimetableCache()
+    cache.put_many(lisbon, {"2025-01-15": {"fajr": "06:20"}})
+    assert cache.get(madrid, "2025-01-15") is None
+    assert cache.get(lisbon, "2025-01-15") == {"fajr": "06:20"}
+
+
+def test_no_key_without_coordinates_or_grid():
+    assert grid_key(None, 10.0, "UTC") is None
+    assert grid_key(10.0, 10.0, "UTC", grid_degrees=0) is None
+
+
+def test_zone_border_validation(capsys):
+    assert validate_zone_border(0.05)
+    assert "Europe/Lisbon, Europe/Madrid" in capsys.readouterr().out
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from auth_tokens import TokenManager
+from repositories import MemoryRevocationRepository, MemoryUserRepository, MongoStorage
+
+SUPERADMIN = {"id": "s1", "role": "superadmin"}
+
+
+def _app_with(dependency):
+    app = FastAPI()
+
+    @app.get("/protected")
+    async def protected(claims=dependency):
+        return {"sub": claims and claims['sub']}
+
+    return app
+
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+
+
+def _import_server(**env) -> subprocess.CompletedProcess:
+    env = {**{k: v for k, v in os.environ.items() if k not in ("JWT_SECRET", "INSECURE_RANDOM_JWT_SECRET")}, **env}
+    return subprocess.run([sys.executable, "-c", "import server"], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True)
+
+
+def test_server_refuses_to_start_without_a_secret():
+    refused = _import_server()
+    assert refused.returncode != 0 and "JWT_SECRET is not set" in refused.stderr
+    allowed = _import_server(INSECURE_RANDOM_JWT_SECRET="true")
+    assert allowed.returncode == 0 and "random per-process key" in allowed.stderr
+    with pytest.raises(ValueError):
+        TokenManager("")
+
+
+def test_role_routes_refuse_anonymous_callers():
+    import server
+
+    with TestClient(_app_with(server.authorize("superadmin"))) as client:
+        token = server.token_manager.issue(SUPERADMIN)['access_token']
+        assert client.get("/protected").status_code == 401
+        assert client.get("/protected", headers={"Authorization": "Bearer nonsense"}).status_code == 401
+        response = client.get("/protected", headers={"Authorization": f"Bearer {token}"})
+        assert response.json() == {"sub": "s1"}
+
+
+def test_routes_without_roles_stay_optional_by_default():
+    import server
+
+    with TestClient(_app_with(server.authorize())) as client:
+        assert client.get("/protected").json() == {"sub": None}
+
+
+def test_revocation_reaches_other_workers():
+    async def run():
+        shared = MemoryRevocationRepository()
+        worker_a, worker_b = TokenManager("secret"), TokenManager("secret")
+        tokens = worker_a.issue({"id": "u1", "role": "admin"})
+
+        revoked_at = worker_a.revoke("u1")
+        await shared.revoke("u1", revoked_at, revoked_at + worker_a.refresh_ttl)
+        accepted_before_sync = worker_b.verify(tokens['access_token'])['sub']
+        worker_b.apply(await shared.since(0))
+        try:
+            worker_b.verify(tokens['access_token'])
+        except Exception as e:
+            return accepted_before_sync, e.status_code
+        return accepted_before_sync, None
+
+    assert asyncio.run(run()) == ("u1", 401)
+
+
+def test_mongo_revocations_keep_the_latest():
+    async def run():
+        repository = MongoStorage(AsyncMongoMockClient()["test"]).revocations
+        await repository.revoke("u1", 200.0, 1000.0)
+        await repository.revoke("u1", 100.0, 900.0)
+        await repository.revoke("u2", 50.0, 800.0)
+        return sorted(await repository.since(60.0))
+
+    assert asyncio.run(run()) == [("u1", 200.0)]
+
+
+def _admin(user_id: str, status: str) -> dict:
+    return {"id": user_id, "email": f"{user_id}@example.com", "role": "admin", "status": status,
+            "favorite_mosques": [], "created_at": "2025-01-01T00:00:00"}
+
+
+def test_batch_moderation_reports_only_admins_that_moved():
+    async def run(users):
+        for doc in (_admin("p1", "pending"), _admin("p2", "pending"), _admin("ok", "approved")):
+            await users.insert(doc)
+        return sorted(await users.moderate_pending_admins(["p1", "ok", "p2", "p1", "missing"], "rejected"))
+
+    mongo = MongoStorage(AsyncMongoMockClient()["test"])
+    assert asyncio.run(run(MemoryUserRepository())) == ["p1", "p2"]
+    assert asyncio.run(run(mongo.users)) == ["p1", "p2"]
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import tracemalloc
+
+from feed_hub import ALL_MOSQUES, FeedHub
+
+
+class FakeWebSocket:
+    """Records sent text; `disconnect()` delivers the client's close."""
+
+    def __init__(self, fail_send: bool = False):
+        self.sent = []
+        self.fail_send = fail_send
+        self.incoming = asyncio.Queue()
+
+    async def send_text(self, text: str):
+        if self.fail_send:
+            raise RuntimeError("Cannot call send once a close message has been sent")
+        self.sent.append(json.loads(text))
+
+    async def receive(self) -> dict:
+        return await self.incoming.get()
+
+    def disconnect(self):
+        self.incoming.put_nowait({"type": "websocket.disconnect", "code": 1001})
+
+
+def test_ten_thousand_subscribers_fan_out_and_unsubscribe():
+    async def run():
+        hub = FeedHub()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        contexts = [hub.subscribe(f"mosque-{i % 100}") for i in range(10_000)]
+        queues = [context.__enter__() for context in contexts]
+        per_subscription = (tracemalloc.get_traced_memory()[0] - before) / len(queues)
+        tracemalloc.stop()
+        global_context = hub.subscribe(ALL_MOSQUES)
+        everything = global_context.__enter__()
+
+        delivered = hub.publish({"id": "p1", "mosque_id": "mosque-7", "title": "Jumuah"})
+        assert delivered == 100 + 1
+        assert everything.get_nowait() == queues[7].get_nowait()
+        assert all(queue.empty() for queue in queues[8:100])
+        # A queue and its context manager, a few KB; nothing grows with the post count
+        assert per_subscription < 8192, per_subscription
+
+        for context in contexts:
+            context.__exit__(None, None, None)
+        global_context.__exit__(None, None, None)
+        assert hub.subscriber_count == 0
+        assert hub.publish({"id": "p2", "mosque_id": "mosque-7"}) == 0
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_keeps_only_the_newest_posts():
+    async def run():
+        hub = FeedHub(queue_size=2)
+        with hub.subscribe("m") as queue:
+            for n in range(5):
+                hub.publish({"id": n, "mosque_id": "m"})
+            assert [json.loads(queue.get_nowait())["id"] for _ in range(2)] == [3, 4]
+
+    asyncio.run(run())
+
+
+def test_idle_websocket_disconnect_unsubscribes_without_a_publish():
+    async def run():
+        hub, websocket = FeedHub(), FakeWebSocket()
+        serving = asyncio.create_task(hub.serve_websocket(websocket, "m"))
+        await asyncio.sleep(0)
+        assert hub.subscriber_count == 1
+        hub.publish({"id": "p1", "mosque_id": "m"})
+        await asyncio.sleep(0.01)
+        assert [post["id"] for post in websocket.sent] == ["p1"]
+
+        websocket.disconnect()
+        await asyncio.wait_for(serving, 1)
+        assert hub.subscriber_count == 0
+
+    asyncio.run(run())
+
+
+def test_failed_send_unsubscribes():
+    async def run():
+        hub, websocket = FeedHub(), FakeWebSocket(fail_send=True)
+        serving = asyncio.create_task(hub.serve_websocket(websocket))
+        await asyncio.sleep(0)
+        hub.publish({"id": "p1", "mosque_id": "m"})
+        await asyncio.wait_for(serving, 1)
+        assert hub.subscriber_count == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_connection_unsubscribes():
+    async def run():
+        hub = FeedHub()
+        serving = asyncio.create_task(hub.serve_websocket(FakeWebSocket(), "m"))
+        await asyncio.sleep(0)
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        assert hub.subscriber_count == 0
+
+    asyncio.run(run())
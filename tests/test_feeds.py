@@ -0,0 +1,61 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from feeds import ALL_MOSQUES, FeedStore
+
+
+def _post(number: int, mosque_id: str = "m1", status: str = "approved") -> dict:
+    return {"id": f"p{number}", "mosque_id": mosque_id, "title": f"Post {number}", "status": status,
+            "created_at": f"2025-01-{number:02d}T00:00:00+00:00"}
+
+
+async def _store(posts=(), size: int = 3) -> FeedStore:
+    db = AsyncMongoMockClient()["test"]
+    if posts:
+        await db.posts.insert_many([dict(post) for post in posts])
+    return FeedStore(db.feeds, db.posts, size)
+
+
+async def _approve(store: FeedStore, post_ids):
+    await store.posts.update_many({"id": {"$in": post_ids}}, {"$set": {"status": "approved"}})
+    await store.add(await store.posts.find({"id": {"$in": post_ids}}, {"_id": 0}).to_list(None))
+
+
+def _ids(posts):
+    return [post['id'] for post in posts]
+
+
+def test_pushed_posts_keep_newest_first_across_feeds():
+    async def run():
+        store = await _store([_post(2), _post(5, "m2"), _post(4, status="pending"), _post(1, status="pending"),
+                              _post(3, "m2", "pending")])
+        for mosque_id in ("m1", "m2", ALL_MOSQUES):
+            await store.read(mosque_id)
+        # Approved out of order, into existing feeds
+        await _approve(store, ["p4", "p1", "p3"])
+        return _ids(await store.read("m1")), _ids(await store.read("m2")), _ids(await store.read(ALL_MOSQUES))
+
+    assert asyncio.run(run()) == (["p4", "p2", "p1"], ["p5", "p3"], ["p5", "p4", "p3"])
+
+
+def test_feeds_are_capped_and_read_with_a_limit():
+    async def run():
+        store = await _store([_post(number) for number in range(1, 6)] + [_post(6, status="pending")])
+        full = _ids(await store.read("m1"))
+        first_page = _ids(await store.read("m1", limit=2))
+        await _approve(store, ["p6"])
+        return full, first_page, _ids(await store.read("m1"))
+
+    assert asyncio.run(run()) == (["p5", "p4", "p3"], ["p5", "p4"], ["p6", "p5", "p4"])
+
+
+def test_removing_a_post_brings_back_the_one_sliced_off():
+    async def run():
+        store = await _store([_post(number) for number in range(1, 5)])
+        before = _ids(await store.read("m1"))
+        await store.posts.update_one({"id": "p3"}, {"$set": {"status": "rejected"}})
+        await store.remove(_post(3))
+        return before, _ids(await store.read("m1")), _ids(await store.read())
+
+    assert asyncio.run(run()) == (["p4", "p3", "p2"], ["p4", "p2", "p1"], ["p4", "p2", "p1"])
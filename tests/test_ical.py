@@ -0,0 +1,60 @@
+from datetime import date
+
+from ical import CalendarCache, MonthBlock, day_events, escape_text, fold, month_bounds, month_keys
+
+MOSQUE = {"id": "m1", "name": "Masjid Al-Noor", "address": "1 Main St", "city": "Toronto",
+          "country": "Canada", "timezone": "America/Toronto"}
+
+
+def _row(day: str, fajr: str, manual: bool = False) -> dict:
+    return {"date": day, "fajr": fajr, "dhuhr": "12:30", "asr": "15:00", "maghrib": "17:00", "isha": "18:30",
+            "is_manual": manual, "created_at": "2025-01-01T00:00:00+00:00"}
+
+
+def test_fold_keeps_lines_short_without_splitting_characters():
+    line = "SUMMARY:" + "Fajr – مسجد النور " * 10
+    folded = fold(line)
+    pieces = folded.split("\r\n")
+    assert all(len(piece.encode()) <= 75 for piece in pieces)
+    assert all(piece.startswith(" ") for piece in pieces[1:])
+    assert folded.replace("\r\n ", "") == line
+
+
+def test_escape_text():
+    assert escape_text("a,b;c\\d\ne") == "a\\,b\\;c\\\\d\\ne"
+
+
+def test_events_are_in_utc():
+    events = day_events(MOSQUE, _row("2025-01-15", "06:00")).decode()
+    # Toronto is UTC-5 in January
+    assert "DTSTART:20250115T110000Z" in events
+    assert events.count("BEGIN:VEVENT") == 5
+
+
+def test_manual_times_win_over_api_times_in_either_order():
+    api, manual = _row("2025-01-15", "06:00"), _row("2025-01-15", "06:20", manual=True)
+    for rows in ([api, manual], [manual, api]):
+        block = MonthBlock.build(MOSQUE, rows)
+        assert b"DTSTART:20250115T112000Z" in block.days["2025-01-15"]
+
+
+def test_days_outside_the_requested_range_are_left_out():
+    block = MonthBlock.build(MOSQUE, [_row(f"2025-01-{day:02d}", "06:00") for day in (1, 15, 31)])
+    body = block.between("2025-01-02", "2025-01-30")
+    assert body.count(b"BEGIN:VEVENT") == 5
+    assert b"UID:m1-2025-01-15-fajr" in body
+    assert b"UID:m1-2025-01-01" not in body and b"UID:m1-2025-01-31" not in body
+
+
+def test_months_across_a_year_boundary():
+    assert month_keys("m1", date(2024, 12, 20), date(2025, 2, 1)) == [("m1", 2024, 12), ("m1", 2025, 1), ("m1", 2025, 2)]
+    assert month_bounds(2024, 2) == ("2024-02-01", "2024-02-29")
+
+
+def test_invalidate_drops_only_the_edited_month():
+    cache = CalendarCache()
+    block = MonthBlock.build(MOSQUE, [])
+    cache.put(("m1", 2025, 1), block)
+    cache.put(("m1", 2025, 2), block)
+    cache.invalidate("m1", "2025-01-15")
+    assert cache.get(("m1", 2025, 1)) is None and cache.get(("m1", 2025, 2)) is block
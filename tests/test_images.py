@@ -0,0 +1,44 @@
+import io
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, ImageDraw  # noqa: E402
+
+from images import normalize_image  # noqa: E402
+
+
+def qr_like(mode: str) -> bytes:
+    """Black squares on a fully transparent background."""
+    img = Image.new("RGBA", (200, 200), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for x in range(20, 180, 40):
+        for y in range(20, 180, 40):
+            draw.rectangle((x, y, x + 19, y + 19), fill=(0, 0, 0, 255))
+    if mode == "P":
+        img = img.convert("P", palette=Image.ADAPTIVE)
+        img.info["transparency"] = img.getpixel((0, 0))
+    elif mode == "LA":
+        img = img.convert("LA")
+    out = io.BytesIO()
+    img.save(out, format="PNG", **({"transparency": img.info["transparency"]} if mode == "P" else {}))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA", "P"])
+def test_transparent_background_becomes_white(mode):
+    full = Image.open(io.BytesIO(normalize_image(qr_like(mode))["full"])).convert("RGB")
+    colours = {colour for _, colour in full.getcolors(maxcolors=1 << 16)}
+    # The modules survive: both the white background and black squares remain
+    assert (255, 255, 255) in colours
+    assert min(sum(colour) for colour in colours) < 60
+    assert full.getpixel((0, 0)) == (255, 255, 255)
+
+
+def test_opaque_image_is_unchanged_in_colour():
+    img = Image.new("RGB", (100, 100), (255, 255, 255))
+    ImageDraw.Draw(img).rectangle((30, 30, 69, 69), fill=(200, 0, 0))
+    out = io.BytesIO()
+    img.save(out, format="PNG")
+    full = Image.open(io.BytesIO(normalize_image(out.getvalue())["full"])).convert("RGB")
+    assert full.getpixel((full.width // 2, full.height // 2))[0] > 150
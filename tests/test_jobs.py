@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from jobs import FAILED, SUCCEEDED, JobRunner
+from repositories import MemoryJobRepository, MemoryStorage, MongoStorage
+
+T0, T1, T2, T3 = (f"2025-01-01T00:00:0{n}+00:00" for n in range(4))
+
+
+def _job(job_id: str, priority: int = 0, run_after: str = T0) -> dict:
+    return {"id": job_id, "kind": "test", "params": {}, "status": "queued", "priority": priority,
+            "attempts": 0, "max_attempts": 3, "progress": None, "result": None, "error": None,
+            "created_by": "s1", "created_at": T0, "run_after": run_after, "started_at": None,
+            "finished_at": None, "worker": None, "lease_until": None}
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def repository(request):
+    if request.param == "memory":
+        return MemoryJobRepository()
+    return MongoStorage(AsyncMongoMockClient()["test"]).jobs
+
+
+def test_claim_takes_the_highest_priority_due_job_once(repository):
+    async def run():
+        for job in (_job("low"), _job("high", priority=5), _job("later", priority=9, run_after=T3)):
+            await repository.insert(job)
+        first = await repository.claim("w1", T1, T2)
+        second = await repository.claim("w2", T1, T2)
+        third = await repository.claim("w3", T1, T2)
+        return first, second, third
+
+    first, second, third = asyncio.run(run())
+    assert (first['id'], first['worker'], first['attempts']) == ("high", "w1", 1)
+    assert second['id'] == "low"
+    assert third is None
+
+
+def test_an_expired_lease_is_claimed_again(repository):
+    async def run():
+        await repository.insert(_job("a"))
+        await repository.claim("w1", T0, T1)
+        held = await repository.claim("w2", T0, T2)
+        taken = await repository.claim("w2", T2, T3)
+        lost = await repository.finish("a", "w1", {"status": SUCCEEDED})
+        return held, taken, lost, await repository.renew("a", "w1", T3)
+
+    held, taken, lost, renewed = asyncio.run(run())
+    assert held is None
+    assert (taken['worker'], taken['attempts']) == ("w2", 2)
+    assert not lost and not renewed
+
+
+def test_release_requeues_without_using_an_attempt(repository):
+    async def run():
+        await repository.insert(_job("a"))
+        await repository.claim("w1", T1, T2)
+        await repository.release("a", "w2")  # not the holder: no effect
+        still_running = (await repository.get("a"))['status']
+        await repository.release("a", "w1")
+        return still_running, await repository.get("a"), await repository.claim("w2", T1, T2)
+
+    still_running, released, reclaimed = asyncio.run(run())
+    assert still_running == "running"
+    assert (released['status'], released['attempts'], released['worker']) == ("queued", 0, None)
+    assert (reclaimed['worker'], reclaimed['attempts']) == ("w2", 1)
+
+
+def _runner(repository) -> JobRunner:
+    return JobRunner(lambda: repository, concurrency=1, poll_seconds=0.01, retry_seconds=0)
+
+
+def test_failed_attempts_are_retried_until_max_attempts():
+    async def run():
+        repository = MemoryJobRepository()
+        runner, calls = _runner(repository), {"flaky": 0, "broken": 0}
+
+        @runner.handler("flaky")
+        async def flaky(job):
+            calls["flaky"] += 1
+            if calls["flaky"] == 1:
+                raise RuntimeError("first try fails")
+            return "done"
+
+        @runner.handler("broken")
+        async def broken(job):
+            calls["broken"] += 1
+            raise RuntimeError("always fails")
+
+        jobs = [await runner.submit("flaky"), await runner.submit("broken", max_attempts=2)]
+        runner.start()
+        for _ in range(200):
+            results = [await runner.get(job['id']) for job in jobs]
+            if all(job['status'] in (SUCCEEDED, FAILED) for job in results):
+                break
+            await asyncio.sleep(0.01)
+        await runner.close()
+        return results, calls
+
+    (flaky, broken), calls = asyncio.run(run())
+    assert (flaky['status'], flaky['attempts'], flaky['result'], flaky['error']) == (SUCCEEDED, 2, "done", None)
+    assert (broken['status'], broken['attempts'], broken['error']) == (FAILED, 2, "always fails")
+    assert calls == {"flaky": 2, "broken": 2}
+
+
+def test_jobs_are_visible_only_to_the_admin_who_queued_them():
+    import server
+
+    async def run():
+        server.services.override(storage=MemoryStorage())
+        job = await server.job_runner.submit("rebuild_feeds", created_by="s1")
+        own = await server.get_job(job['id'], {"sub": "s1", "role": "superadmin"})
+        with pytest.raises(HTTPException) as refused:
+            await server.get_job(job['id'], {"sub": "s2", "role": "superadmin"})
+        return own, refused.value.status_code
+
+    own, status = asyncio.run(run())
+    assert own['created_by'] == "s1" and status == 404
+
+
+def test_claim_takes_the_same_arguments_in_both_repositories(repository):
+    async def run():
+        await repository.insert(_job("only"))
+        return await repository.claim(worker="w1", now=T1, lease_until=T2, tries=1)
+
+    assert asyncio.run(run())['id'] == "only"
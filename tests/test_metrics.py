@@ -0,0 +1,50 @@
+import asyncio
+import random
+
+import metrics
+from metrics import Histogram, MetricsMiddleware
+
+
+async def _call(middleware, count: int):
+    headers = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            headers.append(dict(message["headers"]))
+
+    for _ in range(count):
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": [], "app": middleware.app}
+        await middleware(scope, receive, send)
+    return headers
+
+
+async def _app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+
+
+_app.routes = []
+
+
+def test_sampled_requests_estimate_total_traffic(monkeypatch):
+    histogram = Histogram("test_duration_seconds", "test", ("method", "route", "status"))
+    monkeypatch.setattr(metrics, "http_request_duration", histogram)
+    random.seed(1)
+    headers = asyncio.run(_call(MetricsMiddleware(_app, sample_rate=0.1), 2000))
+
+    counts, _, count = histogram._series[("GET", "unmatched", "200")]
+    sampled = sum(b"server-timing" in h for h in headers)
+    assert 100 < sampled < 300
+    assert count == sampled * 10
+    assert 1500 < count < 2500
+
+
+def test_full_rate_times_every_request(monkeypatch):
+    histogram = Histogram("test_duration_seconds", "test", ("method", "route", "status"))
+    monkeypatch.setattr(metrics, "http_request_duration", histogram)
+    headers = asyncio.run(_call(MetricsMiddleware(_app), 50))
+
+    assert histogram._series[("GET", "unmatched", "200")][2] == 50
+    assert all(b"server-timing" in h for h in headers)
@@ -0,0 +1,48 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from repositories import PENDING_ADMINS, PENDING_POSTS, MongoStorage
+
+
+def _pending_admin(n: int) -> dict:
+    return {"id": f"a{n}", "email": f"a{n}@example.com", "role": "admin", "status": "pending",
+            "favorite_mosques": [], "created_at": f"2025-01-01T00:00:0{n}"}
+
+
+def test_counters_start_from_a_real_count_on_legacy_data():
+    async def run():
+        storage = MongoStorage(AsyncMongoMockClient()["test"])
+        # Pending admins written before the counters existed
+        await storage.db.users.insert_many([_pending_admin(n) for n in range(3)])
+
+        await storage.counters.adjust(PENDING_ADMINS, -1)  # not seeded: no effect
+        await storage.seed_pending_counts()
+        seeded = await storage.counters.get([PENDING_ADMINS, PENDING_POSTS])
+
+        await storage.users.set_status("a0", "approved")
+        return seeded, await storage.pending_counts()
+
+    seeded, counts = asyncio.run(run())
+    assert seeded == {PENDING_ADMINS: 3, PENDING_POSTS: 0}
+    assert counts == {PENDING_ADMINS: 2, PENDING_POSTS: 0}
+
+
+def test_seeding_keeps_existing_counters():
+    async def run():
+        storage = MongoStorage(AsyncMongoMockClient()["test"])
+        await storage.counters.set({PENDING_ADMINS: 7, PENDING_POSTS: 1})
+        await storage.seed_pending_counts()
+        return await storage.counters.get([PENDING_ADMINS, PENDING_POSTS])
+
+    assert asyncio.run(run()) == {PENDING_ADMINS: 7, PENDING_POSTS: 1}
+
+
+def test_negative_counter_is_rebuilt():
+    async def run():
+        storage = MongoStorage(AsyncMongoMockClient()["test"])
+        await storage.db.users.insert_one(_pending_admin(0))
+        await storage.counters.set({PENDING_ADMINS: -4, PENDING_POSTS: 0})
+        return await storage.pending_counts()
+
+    assert asyncio.run(run()) == {PENDING_ADMINS: 1, PENDING_POSTS: 0}
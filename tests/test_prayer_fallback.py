@@ -0,0 +1,63 @@
+import asyncio
+import time
+
+from repositories import MemoryStorage
+from upstream import OPEN
+
+MOSQUE = {"id": "m1", "name": "Masjid Al-Noor", "address": "1 Main St", "city": "Toronto", "country": "Canada",
+          "latitude": 43.65, "longitude": -79.38, "timezone": "America/Toronto", "created_at": "2025-01-01T00:00:00"}
+
+
+class HangingHttp:
+    """An Aladhan that accepts requests and never answers."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def get(self, url, params=None):
+        self.calls += 1
+        await asyncio.Event().wait()
+
+
+def _open_breaker_lookup(stored_rows=()):
+    import server
+
+    async def run():
+        storage, http = MemoryStorage(), HangingHttp()
+        server.services.override(storage=storage, http=http)
+        await storage.mosques.insert(dict(MOSQUE))
+        for row in stored_rows:
+            await storage.prayer_times.insert(row)
+        # Open, and due a probe
+        server.aladhan_breaker.state = OPEN
+        server.aladhan_breaker.opened_at = time.monotonic() - server.aladhan_breaker.reset_timeout
+        try:
+            start = time.perf_counter()
+            times = await server.find_prayer_times("m1", "2025-01-15")
+            elapsed = time.perf_counter() - start
+            await asyncio.sleep(0.05)
+            return times, elapsed, http.calls
+        finally:
+            server.aladhan_breaker.record_success()
+            for task in list(server.upstream_fetches._tasks.values()):
+                task.cancel()
+
+    return asyncio.run(run())
+
+
+def test_open_breaker_serves_calculated_times_without_waiting():
+    times, elapsed, calls = _open_breaker_lookup()
+    assert times['stale'] and times['source'] == "calculated"
+    assert elapsed < 0.5
+    # The probe still went out, in the background
+    assert calls == 1
+
+
+def test_open_breaker_prefers_the_stored_previous_day():
+    previous = {"id": "p1", "mosque_id": "m1", "date": "2025-01-14", "fajr": "06:11", "dhuhr": "12:27",
+                "asr": "14:49", "maghrib": "17:02", "isha": "18:29", "is_manual": False,
+                "created_at": "2025-01-01T00:00:00+00:00"}
+    times, elapsed, _ = _open_breaker_lookup([previous])
+    assert times['stale'] and times['source'] == "previous_day"
+    assert (times['date'], times['fajr']) == ("2025-01-15", "06:11")
+    assert elapsed < 0.5
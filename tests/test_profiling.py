@@ -0,0 +1,59 @@
+import asyncio
+import time
+
+import httpx
+
+from profiling import SamplingProfiler
+
+
+def _spin(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_profiler_samples_a_request_and_stops_when_idle():
+    profiler = SamplingProfiler(interval=0.001)
+
+    async def handler():
+        samples = profiler.start_request()
+        try:
+            _spin(0.1)
+        finally:
+            profiler.finish_request("GET /spin", samples)
+
+    async def run():
+        await handler()
+        # The sampling thread exits once no request is being profiled
+        for _ in range(100):
+            if profiler._thread is None:
+                break
+            await asyncio.sleep(0.01)
+        return profiler._thread
+
+    assert asyncio.run(run()) is None
+    summary = profiler.summary()
+    assert summary["GET /spin"]["requests"] == 1 and summary["GET /spin"]["samples"] > 0
+    stacks = profiler.collapsed("GET /spin")
+    assert "_spin (test_profiling.py" in stacks and "handler (test_profiling.py" in stacks
+    assert profiler.collapsed().startswith("GET /spin;")
+
+    profiler.reset()
+    assert profiler.summary() == {} and profiler.collapsed() == "\n"
+
+
+def test_profiles_are_only_shown_to_superadmins():
+    import server
+
+    def bearer(role: str) -> dict:
+        tokens = server.token_manager.issue({"id": f"{role}-1", "role": role})
+        return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [(await client.request(method, "/api/admin/profiles", headers=headers)).status_code
+                    for method in ("GET", "DELETE")
+                    for headers in ({}, {"X-Profile": "guess"}, bearer("admin"), bearer("superadmin"))]
+
+    assert asyncio.run(run()) == [401, 401, 403, 200] * 2
@@ -0,0 +1,48 @@
+import asyncio
+
+from pymongo.errors import DuplicateKeyError
+from starlette.requests import Request
+
+from rate_limit import MongoRateLimitBackend, Rate, client_ip, parse_trusted_proxies
+
+PROXIES = parse_trusted_proxies("10.0.0.0/8, 192.168.1.5")
+
+
+def _request(peer: str, forwarded: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded.encode())] if forwarded else []
+    return Request({"type": "http", "headers": headers, "client": (peer, 4321)})
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert client_ip(_request("203.0.113.9", "1.2.3.4")) == "203.0.113.9"
+
+
+def test_forwarded_for_is_ignored_from_an_untrusted_peer():
+    assert client_ip(_request("203.0.113.9", "1.2.3.4"), PROXIES) == "203.0.113.9"
+
+
+def test_client_is_the_last_untrusted_hop_behind_a_trusted_proxy():
+    # The client spoofed 1.2.3.4; the proxies appended the real address
+    request = _request("10.1.2.3", "1.2.3.4, 198.51.100.7, 192.168.1.5")
+    assert client_ip(request, PROXIES) == "198.51.100.7"
+    assert client_ip(_request("10.1.2.3"), PROXIES) == "10.1.2.3"
+
+
+class RacingCollection:
+    """Loses the first-use upsert race once, as a second worker would."""
+
+    def __init__(self):
+        self.calls = []
+
+    async def find_one_and_update(self, filter, update, upsert=False, return_document=None):
+        self.calls.append(upsert)
+        if len(self.calls) == 1:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return {"key": filter["key"], "allowed": True, "tokens": 4.0}
+
+
+def test_mongo_bucket_retries_when_another_worker_created_it():
+    collection = RacingCollection()
+    allowed, retry_after = asyncio.run(MongoRateLimitBackend(collection).take("auth:ip:1", Rate(1, 5)))
+    assert (allowed, retry_after) == (True, 0.0)
+    assert collection.calls == [True, False]
@@ -0,0 +1,73 @@
+import asyncio
+
+from mongomock_motor import AsyncMongoMockClient
+
+from repositories import MongoStorage, allow_secondary_reads, primary_reads, secondary_reads
+
+MOSQUE = {"id": "m1", "name": "Masjid Al-Noor", "address": "1 Main St", "city": "Toronto", "country": "Canada",
+          "latitude": 43.65, "longitude": -79.38, "timezone": "America/Toronto", "created_at": "2025-01-01T00:00:00"}
+
+
+def _times(fajr: str) -> dict:
+    return {"id": f"t-{fajr}", "mosque_id": "m1", "date": "2025-01-15", "fajr": fajr, "dhuhr": "12:27",
+            "asr": "14:49", "maghrib": "17:02", "isha": "18:29", "is_manual": False,
+            "created_at": "2025-01-01T00:00:00+00:00"}
+
+
+def _replica_set():
+    """A primary and a lagging secondary: two databases holding different copies."""
+    client = AsyncMongoMockClient()
+    primary, secondary = client["primary"], client["secondary"]
+    return primary, secondary, MongoStorage(primary, replica_db=secondary)
+
+
+async def _seed(primary, secondary):
+    await primary.mosques.insert_one({**MOSQUE, "name": "Primary copy"})
+    await secondary.mosques.insert_one({**MOSQUE, "name": "Secondary copy"})
+    await primary.prayer_times.insert_one(_times("06:11"))
+    await secondary.prayer_times.insert_one(_times("06:05"))
+
+
+def test_reads_go_to_the_primary_unless_the_route_allows_secondaries():
+    async def run():
+        primary, secondary, storage = _replica_set()
+        await _seed(primary, secondary)
+        before = (await storage.mosques.get("m1"))['name']
+        allow_secondary_reads()
+        after = (await storage.mosques.get("m1"))['name'], (await storage.prayer_times.get("m1", "2025-01-15"))['fajr']
+        return before, after
+
+    assert asyncio.run(run()) == ("Primary copy", ("Secondary copy", "06:05"))
+
+
+def test_writes_and_read_after_write_go_to_the_primary():
+    async def run():
+        primary, secondary, storage = _replica_set()
+        allow_secondary_reads()
+        await storage.mosques.insert(dict(MOSQUE))
+        await storage.prayer_times.insert(_times("06:11"))
+        lagging = await storage.mosques.get("m1")
+        with primary_reads():
+            written = await storage.mosques.get("m1"), await storage.prayer_times.get("m1", "2025-01-15")
+        return await secondary.mosques.count_documents({}), lagging, written, secondary_reads.get()
+
+    on_secondary, lagging, (mosque, times), still_allowed = asyncio.run(run())
+    assert on_secondary == 0 and lagging is None
+    assert mosque['name'] == MOSQUE['name'] and times['fajr'] == "06:11"
+    # Only the block reads from the primary; the route's preference is restored
+    assert still_allowed
+
+
+def test_reminders_read_the_primary_without_changing_the_callers_preference():
+    import server
+
+    async def run():
+        primary, secondary, storage = _replica_set()
+        await _seed(primary, secondary)
+        server.services.override(storage=storage)
+        reminder = await server.resolve_reminder_times("m1", "2025-01-15")
+        after_reminder = secondary_reads.get()
+        route = await server.get_prayer_times("m1", "2025-01-15")
+        return reminder['fajr'], after_reminder, route['fajr']
+
+    assert asyncio.run(run()) == ("06:11", False, "06:05")
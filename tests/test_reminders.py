@@ -0,0 +1,146 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+
+from reminders import ReminderBatch, ReminderDispatcher, SimulatedClock, WebhookSink, load_schedule
+from repositories import MemoryReminderClaimRepository, MemoryUserRepository, MongoReminderClaimRepository
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc).timestamp()
+DAY = "2025-01-01"
+
+
+class RecordingSink:
+    def __init__(self, delay: float = 0):
+        self.batches = []
+        self.delay = delay
+
+    async def deliver(self, batch):
+        await asyncio.sleep(self.delay)
+        self.batches.append(batch)
+
+
+def test_each_reminder_is_sent_by_one_worker():
+    async def run():
+        claims = MemoryReminderClaimRepository()
+        sinks = [RecordingSink(), RecordingSink()]
+        clock = SimulatedClock(START)
+        workers = [ReminderDispatcher([sink], clock=clock, claim=claims.claim) for sink in sinks]
+        for dispatcher in workers:
+            dispatcher.subscribe("m1", "u1")
+            dispatcher.schedule("m1", "fajr", START + 60, DAY)
+        clock.advance(60)
+        await asyncio.gather(*(dispatcher.fire_due() for dispatcher in workers))
+        return sum(len(sink.batches) for sink in sinks)
+
+    assert asyncio.run(run()) == 1
+
+
+def test_mongo_claim_is_taken_once():
+    async def run():
+        repository = MongoReminderClaimRepository(AsyncMongoMockClient()["test"].reminder_claims)
+        return [await repository.claim("m1", "fajr", DAY), await repository.claim("m1", "fajr", DAY),
+                await repository.claim("m1", "fajr", "2025-01-02")]
+
+    assert asyncio.run(run()) == [True, False, True]
+
+
+def test_moved_reminder_fires_once_at_its_new_time():
+    async def run():
+        sink = RecordingSink()
+        clock = SimulatedClock(START)
+        dispatcher = ReminderDispatcher([sink], clock=clock)
+        dispatcher.subscribe("m1", "u1")
+        dispatcher.schedule("m1", "fajr", START + 60, DAY)
+        dispatcher.schedule("m1", "fajr", START + 120, DAY)  # admin edited the time
+        assert dispatcher.pending() == 1
+        clock.advance(60)
+        assert await dispatcher.fire_due() == 0
+        clock.advance(60)
+        assert await dispatcher.fire_due() == 1
+        # Edited again after it fired: not sent a second time
+        dispatcher.schedule("m1", "fajr", START + 180, DAY)
+        clock.advance(60)
+        assert await dispatcher.fire_due() == 0
+        return [batch.fire_at for batch in sink.batches]
+
+    assert asyncio.run(run()) == [START + 120]
+
+
+def test_slow_sink_does_not_hold_up_the_others():
+    async def run():
+        fast, slow = RecordingSink(), RecordingSink(delay=60)
+        clock = SimulatedClock(START)
+        dispatcher = ReminderDispatcher([slow, fast], clock=clock, sink_timeout=0.1)
+        dispatcher.subscribe("m1", "u1")
+        dispatcher.subscribe("m2", "u2")
+        dispatcher.schedule("m1", "fajr", START + 60, DAY)
+        dispatcher.schedule("m2", "fajr", START + 60, DAY)
+        clock.advance(60)
+        started = time.perf_counter()
+        await dispatcher.fire_due()
+        return time.perf_counter() - started, len(fast.batches), len(slow.batches)
+
+    elapsed, fast_batches, slow_batches = asyncio.run(run())
+    assert elapsed < 1
+    assert (fast_batches, slow_batches) == (2, 0)
+
+
+def test_reload_applies_unsubscribes_from_other_workers():
+    async def run():
+        users = MemoryUserRepository()
+        for user_id in ("u1", "u2"):
+            await users.insert({"id": user_id, "email": f"{user_id}@example.com", "role": "user",
+                                "status": "approved", "favorite_mosques": ["m1"],
+                                "created_at": "2025-01-01T00:00:00"})
+        dispatcher = ReminderDispatcher([RecordingSink()], clock=SimulatedClock(START))
+
+        async def no_times(mosque_id, day):
+            return None
+
+        await load_schedule(dispatcher, users, no_times)
+        first = set(dispatcher.subscriptions["m1"])
+        await users.remove_favorite("u2", "m1")  # handled by another worker
+        await load_schedule(dispatcher, users, no_times)
+        return first, set(dispatcher.subscriptions["m1"])
+
+    assert asyncio.run(run()) == ({"u1", "u2"}, {"u1"})
+
+
+def test_schedule_is_loaded_for_the_dispatcher_clock_days():
+    async def run():
+        users = MemoryUserRepository()
+        await users.insert({"id": "u1", "email": "u1@example.com", "role": "user", "status": "approved",
+                            "favorite_mosques": ["m1"], "created_at": "2025-01-01T00:00:00"})
+        dispatcher = ReminderDispatcher([RecordingSink()], clock=SimulatedClock(START))
+        days = []
+
+        async def record(mosque_id, day):
+            days.append(day)
+            return {"fajr": "06:00"}
+
+        await load_schedule(dispatcher, users, record)
+        return days, dispatcher.pending()
+
+    assert asyncio.run(run()) == (["2025-01-01", "2025-01-02"], 2)
+
+
+def test_webhook_sink_posts_through_the_shared_client():
+    requests = []
+
+    def handler(request):
+        requests.append((str(request.url), json.loads(request.content)))
+        return httpx.Response(204)
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            sink = WebhookSink("https://hooks.example.com/reminders", lambda: client)
+            await sink.deliver(ReminderBatch("m1", "fajr", START, ["u1", "u2"]))
+
+    asyncio.run(run())
+    assert requests == [("https://hooks.example.com/reminders",
+                         {"mosque_id": "m1", "prayer": "fajr", "fire_at": "2025-01-01T00:00:00+00:00",
+                          "subscribers": ["u1", "u2"]})]
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from repositories import MemoryStorage, MongoStorage
+
+
+@pytest.fixture(params=["memory", "mongo"])
+def storage(request):
+    if request.param == "memory":
+        return MemoryStorage()
+    return MongoStorage(AsyncMongoMockClient()["test"])
+
+
+def _times(mosque_id: str, day: str, fajr: str = "05:00", manual: bool = False) -> dict:
+    return {"id": f"{mosque_id}-{day}-{manual}", "mosque_id": mosque_id, "date": day, "fajr": fajr,
+            "dhuhr": "12:30", "asr": "15:45", "maghrib": "18:15", "isha": "19:45", "is_manual": manual,
+            "created_at": "2025-01-01T00:00:00+00:00"}
+
+
+def _user(user_id: str, role: str = "user", status: str = "approved", created_at: str = "2025-01-01T00:00:00+00:00"):
+    return {"id": user_id, "email": f"{user_id}@example.com", "role": role, "status": status,
+            "favorite_mosques": [], "created_at": created_at}
+
+
+def _post(post_id: str, created_at: str, status: str = "pending") -> dict:
+    return {"id": post_id, "mosque_id": "m1", "admin_id": "a1", "title": post_id, "content": "",
+            "status": status, "created_at": created_at}
+
+
+def test_prayer_times_prefer_the_manual_row(storage):
+    async def run():
+        times = storage.prayer_times
+        await times.insert(_times("m1", "2025-01-01"))
+        await times.insert(_times("m1", "2025-01-01", "05:30", manual=True))
+        # A later API fetch does not hide the admin's times
+        await times.insert(_times("m1", "2025-01-01", "05:10"))
+        return (await times.get("m1", "2025-01-01"))['fajr'], await times.get("m1", "2025-01-02")
+
+    assert asyncio.run(run()) == ("05:30", None)
+
+
+def test_insert_missing_skips_days_already_stored(storage):
+    async def run():
+        times = storage.prayer_times
+        await times.insert(_times("m1", "2025-01-01", "05:30", manual=True))
+        inserted = await times.insert_missing([_times("m1", "2025-01-01"), _times("m1", "2025-01-02"),
+                                               _times("m2", "2025-01-01")])
+        again = await times.insert_missing([_times("m1", "2025-01-02")])
+        return inserted, again, (await times.get("m1", "2025-01-01"))['fajr']
+
+    assert asyncio.run(run()) == (2, 0, "05:30")
+
+
+def test_range_returns_the_listed_mosques_between_the_dates(storage):
+    async def run():
+        times = storage.prayer_times
+        await times.insert_missing([_times(mosque_id, f"2025-01-{day:02d}")
+                                    for mosque_id in ("m1", "m2", "m3") for day in range(1, 6)])
+        rows = await times.range(["m1", "m2", "unknown"], "2025-01-02", "2025-01-04")
+        return sorted((row['mosque_id'], row['date']) for row in rows)
+
+    assert asyncio.run(run()) == [(mosque_id, f"2025-01-{day:02d}") for mosque_id in ("m1", "m2") for day in (2, 3, 4)]
+
+
+def test_favourites_add_once_remove_and_list(storage):
+    async def run():
+        users = storage.users
+        await users.insert(_user("u1"))
+        await users.insert(_user("u2"))
+        results = [await users.add_favorite("u1", "m1"), await users.add_favorite("u1", "m1"),
+                   await users.add_favorite("u1", "m2"), await users.add_favorite("u2", "m1"),
+                   await users.remove_favorite("u2", "m1"), await users.add_favorite("unknown", "m1")]
+        favorites = {user_id: mosque_ids async for user_id, mosque_ids in users.favorites()}
+        return results, favorites, (await users.get("u1"))['favorite_mosques']
+
+    results, favorites, stored = asyncio.run(run())
+    assert results == [True, True, True, True, True, False]
+    assert favorites == {"u1": ["m1", "m2"]}
+    assert stored == ["m1", "m2"]
+
+
+def test_pending_pages_are_newest_first_with_ties_broken_by_id(storage):
+    async def run():
+        for user_id, created_at in (("a", "2025-01-01"), ("b", "2025-01-03"), ("c", "2025-01-02"), ("d", "2025-01-03")):
+            await storage.users.insert(_user(user_id, "admin", "pending", created_at))
+        await storage.users.insert(_user("approved", "admin", "approved", "2025-01-04"))
+        for post_id, created_at in (("p1", "2025-01-01"), ("p2", "2025-01-02"), ("p3", "2025-01-03")):
+            await storage.posts.insert(_post(post_id, created_at))
+        await storage.posts.insert(_post("p4", "2025-01-04", "approved"))
+
+        admins, pages, after = storage.users.pending_admins, [], None
+        while True:
+            page = await admins(limit=3, after=after)
+            if not page:
+                break
+            pages.append([user['id'] for user in page])
+            after = (page[-1]['created_at'], page[-1]['id'])
+        first_posts = await storage.posts.pending(limit=2)
+        last_posts = await storage.posts.pending(limit=2, after=(first_posts[-1]['created_at'], first_posts[-1]['id']))
+        counts = await storage.users.count_pending_admins(), await storage.posts.count_pending()
+        return pages, [post['id'] for post in first_posts + last_posts], counts
+
+    assert asyncio.run(run()) == ([["d", "b", "c"], ["a"]], ["p3", "p2", "p1"], (4, 3))
+
+
+def test_memory_storage_loads_every_repository_including_uploads(storage):
+    async def run():
+        await storage.mosques.insert({"id": "m1", "name": "Masjid Al-Noor", "city": "Toronto", "country": "Canada",
+                                      "latitude": 43.65, "longitude": -79.38, "created_at": "2025-01-01"})
+        await storage.users.insert(_user("u1"))
+        await storage.prayer_times.insert(_times("m1", "2025-01-01"))
+        await storage.posts.insert(_post("p1", "2025-01-01"))
+        await storage.images.insert_if_absent({"id": "i1", "content_type": "image/png", "created_at": "2025-01-01"})
+        for n, data in enumerate((b"first ", b"second")):
+            await storage.uploads.write_chunk("upload-1", n, data)
+
+        copy = MemoryStorage()
+        counts = await copy.load_from(storage)
+        chunks = [chunk async for chunk in copy.uploads.chunks("upload-1")]
+        return counts, chunks, (await copy.posts.pending())[0]['id']
+
+    counts, chunks, post_id = asyncio.run(run())
+    assert counts == {"mosques": 1, "users": 1, "prayer_times": 1, "posts": 1, "images": 1, "uploads": 2}
+    assert chunks == [b"first ", b"second"] and post_id == "p1"
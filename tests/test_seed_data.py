@@ -0,0 +1,19 @@
+from datetime import date
+
+from seed_data import approximate_prayer_times, clock_time
+
+
+def test_clock_time_carries_rounded_minutes_into_the_hour():
+    assert clock_time(5.9999) == "06:00"
+    assert clock_time(12 + 59.5 / 60) == "13:00"
+    assert clock_time(23.995) == "00:00"
+    assert clock_time(-0.5) == "23:30"
+    assert clock_time(4.25) == "04:15"
+
+
+def test_approximate_prayer_times_are_valid_clock_times():
+    for longitude in range(-180, 181, 7):
+        times = approximate_prayer_times(40.0, longitude + 0.37, date(2025, 3, 1))
+        for value in times.values():
+            hour, minute = map(int, value.split(":"))
+            assert 0 <= hour < 24 and 0 <= minute < 60
@@ -0,0 +1,99 @@
+import asyncio
+
+from services import Services, WarmUp
+
+
+class FakeHttp:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeMongoClient:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _services(built):
+    services = Services()
+    for name in ("http", "mongo_client", "db"):
+        services.provide(name, lambda s, name=name: built.append(name) or object())
+    return services
+
+
+def test_instances_are_built_once_on_first_use():
+    built = []
+    services = _services(built)
+    assert built == [] and not services.built("db")
+    first = services.db
+    assert services.db is first and built == ["db"]
+
+
+def test_override_keeps_overrides_and_rebuilds_the_rest():
+    built = []
+    services = _services(built)
+    old_db = services.db
+    http = FakeHttp()
+    services.override(http=http)
+    # Anything built before the override may depend on what it replaced
+    assert not services.built("db") and services.db is not old_db
+    # A later provide does not displace the override
+    services.provide("http", lambda s: FakeHttp())
+    assert services.http is http
+    assert built == ["db", "db"]
+
+
+def test_close_releases_clients_and_the_next_use_builds_new_ones():
+    services = Services()
+    http, client = FakeHttp(), FakeMongoClient()
+    services.override(http=http, mongo_client=client)
+    asyncio.run(services.close())
+    assert http.closed and client.closed
+    assert not services.built("http") and not services.built("mongo_client")
+
+    services.provide("http", lambda s: FakeHttp())
+    assert services.http is not http
+
+
+def test_warm_up_is_ready_only_when_every_step_succeeds():
+    warm_up = WarmUp()
+    ran = []
+
+    @warm_up.step("indexes")
+    async def indexes():
+        ran.append("indexes")
+
+    @warm_up.step("caches")
+    async def caches():
+        ran.append("caches")
+
+    assert warm_up.status()["pending"] == ["indexes", "caches"] and not warm_up.ready
+    asyncio.run(warm_up.run())
+    status = warm_up.status()
+    assert ran == ["indexes", "caches"]
+    assert status["ready"] and status["pending"] == [] and set(status["completed"]) == {"indexes", "caches"}
+
+
+def test_failed_warm_up_step_leaves_the_worker_not_ready():
+    warm_up = WarmUp()
+    ran = []
+
+    @warm_up.step("indexes")
+    async def indexes():
+        raise RuntimeError("no primary")
+
+    @warm_up.step("caches")
+    async def caches():
+        ran.append("caches")
+
+    asyncio.run(warm_up.run())
+    status = warm_up.status()
+    # Later steps still run
+    assert ran == ["caches"]
+    assert not status["ready"] and status["failed"] == {"indexes": "no primary"}
+    assert list(status["completed"]) == ["caches"] and status["warm_up_seconds"] is not None
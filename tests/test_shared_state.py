@@ -0,0 +1,41 @@
+import asyncio
+from datetime import date
+
+from repositories import MemoryStorage
+from shared_state import SharedGridTimetables, load_warm_state
+
+START = date(2025, 1, 1)
+CELL = (39.5, -7.4)
+
+
+def _times(fajr: str) -> dict:
+    return {"fajr": fajr, "dhuhr": "12:30", "asr": "15:00", "maghrib": "17:00", "isha": "18:30"}
+
+
+def test_a_cell_on_a_zone_border_has_a_row_per_zone():
+    table = SharedGridTimetables(0.05, START, 2, {
+        (CELL, "Europe/Lisbon"): {"2025-01-01": _times("06:20")},
+        (CELL, "Europe/Madrid"): {"2025-01-01": _times("07:20")},
+    })
+    assert table.get((CELL, "Europe/Lisbon"), "2025-01-01")['fajr'] == "06:20"
+    assert table.get((CELL, "Europe/Madrid"), "2025-01-01")['fajr'] == "07:20"
+    assert table.get((CELL, "Africa/Casablanca"), "2025-01-01") is None
+    assert table.get((CELL, "Europe/Lisbon"), "2025-01-02") is None
+
+
+def test_warm_state_groups_cached_rows_by_cell_and_zone():
+    async def run():
+        storage = MemoryStorage()
+        for mosque_id, longitude, zone in (("elvas", -7.41, "Europe/Lisbon"), ("badajoz", -7.39, "Europe/Madrid")):
+            await storage.mosques.insert({"id": mosque_id, "latitude": 39.5, "longitude": longitude, "timezone": zone})
+        await storage.prayer_times.insert_missing([
+            {"id": "1", "mosque_id": "elvas", "date": "2025-01-01", **_times("06:20"), "is_manual": False},
+            {"id": "2", "mosque_id": "badajoz", "date": "2025-01-01", **_times("07:20"), "is_manual": False},
+        ])
+        return await load_warm_state(storage, 0.05, START, 2, resolve_zone=None)
+
+    state = asyncio.run(run())
+    assert state.timetables == {
+        (CELL, "Europe/Lisbon"): {"2025-01-01": _times("06:20")},
+        (CELL, "Europe/Madrid"): {"2025-01-01": _times("07:20")},
+    }
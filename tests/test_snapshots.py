@@ -0,0 +1,60 @@
+from datetime import date
+
+from snapshots import MosqueTimetable, Snapshot, decode
+
+START = date(2025, 1, 1)
+MOSQUE = {"id": "m1", "name": "Masjid Al-Noor", "city": "Toronto", "country": "Canada"}
+
+
+def _row(day: str, fajr: str, manual: bool = False, created_at: str = "2025-01-01T00:00:00+00:00") -> dict:
+    return {"date": day, "fajr": fajr, "dhuhr": "12:30", "asr": "15:45", "maghrib": "18:05", "isha": "23:59",
+            "is_manual": manual, "created_at": created_at}
+
+
+def test_encode_decode_round_trip():
+    rows = [_row("2025-01-01", "06:10"), _row("2025-01-02", "00:05"), _row("2025-01-04", "05:58")]
+    snapshot = Snapshot(START, 4, [MosqueTimetable.from_docs(MOSQUE, rows, START, 4)])
+
+    header = decode(snapshot.encode())
+
+    assert header['days'] == 4 and header['start'] == "2025-01-01"
+    times = header['mosques'][0]['times']
+    # Wrap-around deltas (06:10 -> 00:05) and a missing day survive the trip
+    assert times['fajr'] == ["06:10", "00:05", None, "05:58"]
+    assert times['isha'] == ["23:59", "23:59", None, "23:59"]
+    assert header['mosques'][0]['hash'] == snapshot.timetables[0].hash
+
+
+def test_encoding_is_deterministic():
+    rows = [_row("2025-01-01", "06:10")]
+    first = Snapshot(START, 2, [MosqueTimetable.from_docs(MOSQUE, rows, START, 2)])
+    second = Snapshot(START, 2, [MosqueTimetable.from_docs(MOSQUE, rows, START, 2)])
+    assert first.encode() == second.encode() and first.hash == second.hash
+
+
+def test_manual_times_win_over_api_times_in_either_order():
+    api = _row("2025-01-01", "06:10")
+    manual = _row("2025-01-01", "06:30", manual=True, created_at="2025-01-01T09:00:00+00:00")
+    for rows in ([api, manual], [manual, api]):
+        timetable = MosqueTimetable.from_docs(MOSQUE, rows, START, 1)
+        assert timetable.day(0, 1)[0] == "06:30"
+        assert timetable.changed_at[0] == "2025-01-01T09:00:00+00:00"
+
+
+def test_days_outside_the_range_are_ignored():
+    rows = [_row("2024-12-31", "06:00"), _row("2025-01-01", "06:10"), _row("2025-01-03", "06:20")]
+    timetable = MosqueTimetable.from_docs(MOSQUE, rows, START, 2)
+    assert [timetable.day(offset, 2)[0] for offset in range(2)] == ["06:10", None]
+
+
+def test_delta_holds_only_days_changed_since():
+    rows = [_row("2025-01-01", "06:10"),
+            _row("2025-01-02", "06:11", manual=True, created_at="2025-03-01T00:00:00+00:00")]
+    snapshot = Snapshot(START, 2, [MosqueTimetable.from_docs(MOSQUE, rows, START, 2)])
+
+    delta = snapshot.delta("2025-02-01T00:00:00+00:00")
+
+    assert delta['as_of'] == "2025-03-01T00:00:00+00:00"
+    assert list(delta['mosques']['m1']['days']) == ["2025-01-02"]
+    assert delta['mosques']['m1']['days']["2025-01-02"][0] == "06:11"
+    assert snapshot.delta(delta['as_of'])['mosques'] == {}
@@ -0,0 +1,73 @@
+import asyncio
+from datetime import date, datetime, timezone
+
+from repositories import MemoryStorage
+from timetable_store import StoreWriter, TimetableStore, apply_overrides, build_store, encode_row
+
+START = date(2025, 1, 1)
+DAYS = 3
+OFFSETS = {f"2025-01-0{offset + 1}": offset for offset in range(DAYS)}
+
+
+def _row(day: str, fajr: str, manual: bool = False, created_at: str = "2025-01-01T00:00:00+00:00") -> dict:
+    return {"date": day, "fajr": fajr, "dhuhr": "12:30", "asr": "15:00", "maghrib": "17:00", "isha": "18:30",
+            "is_manual": manual, "created_at": created_at}
+
+
+def _store(tmp_path, rows_by_mosque: dict) -> TimetableStore:
+    path = str(tmp_path / "timetables.bin")
+    with StoreWriter(path, START, DAYS, list(rows_by_mosque)) as writer:
+        for rows in rows_by_mosque.values():
+            writer.append(encode_row(rows, OFFSETS, DAYS))
+    return TimetableStore(path)
+
+
+def test_manual_times_win_over_api_times_in_either_order(tmp_path):
+    api, manual = _row("2025-01-02", "06:00"), _row("2025-01-02", "06:20", manual=True)
+    store = _store(tmp_path, {"a": [api, manual], "b": [manual, api]})
+    for mosque_id in ("a", "b"):
+        doc = store.get(mosque_id, "2025-01-02")
+        assert doc['fajr'] == "06:20" and doc['is_manual']
+
+
+def test_days_outside_the_store_are_unknown(tmp_path):
+    store = _store(tmp_path, {"a": [_row("2024-12-31", "06:00"), _row("2025-01-01", "06:10"),
+                                    _row("2025-01-04", "06:30")]})
+    assert store.get("a", "2025-01-01")['fajr'] == "06:10"
+    assert store.get("a", "2024-12-31") is None and store.get("a", "2025-01-04") is None
+    assert store.get("a", "2025-01-02") is None
+    assert store.get("unknown", "2025-01-01") is None
+    assert not store.put("a", "2025-01-04", _row("2025-01-04", "06:30"), False, None)
+
+
+def test_put_patches_in_place_and_keeps_manual_times(tmp_path):
+    store = _store(tmp_path, {"a": []})
+    created_at = datetime(2025, 1, 2, 9, 30, tzinfo=timezone.utc)
+    assert store.put("a", "2025-01-02", _row("2025-01-02", "06:20"), True, created_at)
+    assert not store.put("a", "2025-01-02", _row("2025-01-02", "06:00"), False, created_at)
+
+    reopened = TimetableStore(store.path)
+    doc = reopened.get("a", "2025-01-02")
+    assert (doc['fajr'], doc['is_manual'], doc['created_at']) == ("06:20", True, created_at)
+
+
+def test_overrides_set_elsewhere_after_the_build_are_patched_in(tmp_path):
+    async def run():
+        storage = MemoryStorage()
+        await storage.mosques.insert({"id": "a", "latitude": 0.0, "longitude": 0.0})
+        await storage.prayer_times.insert({"id": "1", "mosque_id": "a", **_row("2025-01-02", "06:00")})
+        path = str(tmp_path / "timetables.bin")
+        await build_store(storage, path, START, DAYS)
+        store = TimetableStore(path)
+
+        # Set through another host, which patched only its own store
+        later = datetime.fromtimestamp(store.built_at + 30, timezone.utc).isoformat()
+        await storage.prayer_times.replace({"id": "2", "mosque_id": "a", **_row("2025-01-02", "06:20", True, later)})
+        stale = store.get("a", "2025-01-02")['fajr']
+        patched = await apply_overrides(store, storage)
+        return stale, patched, store.get("a", "2025-01-02"), store.synced_at - store.built_at
+
+    stale, patched, doc, advanced = asyncio.run(run())
+    assert (stale, patched) == ("06:00", 1)
+    assert doc['fajr'] == "06:20" and doc['is_manual']
+    assert advanced == 30
@@ -0,0 +1,45 @@
+import pytest
+
+import timezones
+from timezones import DEFAULT_TIMEZONE, HAVE_TIMEZONEFINDER, TimezoneResolver
+
+CITIES = [
+    ((51.5074, -0.1278), "Europe/London"),
+    ((40.4168, -3.7038), "Europe/Madrid"),
+    ((24.7136, 46.6753), "Asia/Riyadh"),
+]
+
+
+@pytest.fixture(params=["timezonefinder", "zone1970.tab"])
+def resolver(request, monkeypatch):
+    if request.param == "timezonefinder" and not HAVE_TIMEZONEFINDER:
+        pytest.skip("timezonefinder is not installed")
+    monkeypatch.setattr(timezones, "HAVE_TIMEZONEFINDER", request.param == "timezonefinder")
+    return TimezoneResolver()
+
+
+@pytest.mark.parametrize("coordinates, zone", CITIES)
+def test_cities_resolve_to_their_zone(resolver, coordinates, zone):
+    assert resolver.lookup(*coordinates) == zone
+
+
+@pytest.mark.skipif(not HAVE_TIMEZONEFINDER, reason="the zone1970.tab fallback is only right away from borders")
+@pytest.mark.parametrize("west, east", [
+    ((38.88, -7.16, "Europe/Lisbon"), (38.88, -6.97, "Europe/Madrid")),  # Elvas / Badajoz
+    ((42.79, 0.60, "Europe/Paris"), (42.70, 0.90, "Europe/Madrid")),  # across the Pyrenees
+])
+def test_each_side_of_a_border_gets_its_own_zone(west, east):
+    resolver = TimezoneResolver()
+    assert [resolver.lookup(lat, lng) for lat, lng, _ in (west, east)] == [west[2], east[2]]
+
+
+def test_lookup_before_load_loads_on_first_use(resolver):
+    # Missing coordinates are answered without touching the dataset
+    assert resolver.lookup(None, 46.6753) == DEFAULT_TIMEZONE
+    assert (resolver._finder, resolver._points) == (None, None)
+    assert resolver.lookup(24.7136, 46.6753) == "Asia/Riyadh"
+    assert resolver._finder is not None or resolver._points
+    # A later explicit load keeps the dataset already loaded
+    loaded = resolver._finder or resolver._points
+    resolver.load()
+    assert (resolver._finder or resolver._points) is loaded
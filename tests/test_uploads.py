@@ -0,0 +1,191 @@
+import asyncio
+import base64
+import json
+import os
+import tempfile
+import tracemalloc
+
+import httpx
+import pytest
+from fastapi import FastAPI, File, HTTPException, UploadFile
+
+from repositories import MemoryUploadRepository
+from uploads import CHUNK_SIZE, RequestSizeLimitMiddleware, StorageSink, json_with_base64, read_upload
+
+PNG_HEAD = b"\x89PNG\r\n\x1a\n"
+
+
+class DiscardingUploads:
+    """An uploads repository that keeps nothing, as if chunks went to a database."""
+
+    def __init__(self):
+        self.chunks = 0
+
+    async def write_chunk(self, upload_id, n, data):
+        self.chunks += 1
+
+    async def delete(self, upload_id):
+        pass
+
+
+def upload_file(data: bytes) -> UploadFile:
+    f = tempfile.TemporaryFile()
+    f.write(data)
+    f.seek(0)
+    return UploadFile(f, size=None, filename="upload.png")
+
+
+def test_large_upload_is_stored_chunk_by_chunk_in_bounded_memory():
+    size = 8 * 1024 * 1024
+    file = upload_file(PNG_HEAD + os.urandom(size - len(PNG_HEAD)))
+    uploads = DiscardingUploads()
+
+    async def read():
+        tracemalloc.start()
+        try:
+            upload = await read_upload(file, 2 * size, sink=StorageSink(uploads))
+            return upload, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    upload, peak = asyncio.run(read())
+    assert upload.size == size and upload.data is None and upload.upload_id
+    assert uploads.chunks == size // CHUNK_SIZE + (size % CHUNK_SIZE > 0)
+    # A few chunks in flight at most, never the file (or its base64)
+    assert peak < 4 * CHUNK_SIZE, peak
+
+
+def test_stored_chunks_round_trip_as_base64():
+    data = PNG_HEAD + os.urandom(CHUNK_SIZE * 2 + 7)
+    uploads = MemoryUploadRepository()
+
+    async def store_and_read():
+        upload = await read_upload(upload_file(data), len(data), sink=StorageSink(uploads))
+        return b"".join([piece async for piece in json_with_base64({"content_type": upload.content_type},
+                                                                   "id_proof", uploads.chunks(upload.upload_id))])
+
+    body = asyncio.run(store_and_read())
+    decoded = json.loads(body)
+    assert decoded["content_type"] == "image/png"
+    assert base64.b64decode(decoded["id_proof"]) == data
+
+
+@pytest.mark.parametrize("data, status", [
+    (PNG_HEAD + b"\0" * (CHUNK_SIZE * 3), 413),
+    (b"MZ" + b"\0" * CHUNK_SIZE * 3, 415),
+    (b"", 400),
+])
+def test_rejected_upload_leaves_nothing_stored(data, status):
+    uploads = MemoryUploadRepository()
+    file = upload_file(data)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(read_upload(file, CHUNK_SIZE * 2, sink=StorageSink(uploads)))
+    assert error.value.status_code == status
+    assert uploads._chunks == {}
+    if status == 415:
+        # Refused on the first chunk, not after reading everything
+        assert file.file.tell() == CHUNK_SIZE
+
+
+def limited_app(max_bytes: int):
+    app = FastAPI()
+    calls = []
+
+    @app.post("/upload")
+    async def receive(file: UploadFile = File(...)):
+        calls.append(file.filename)
+        return {"ok": True}
+
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=max_bytes)
+    return app, calls
+
+
+def post(app, **kwargs) -> httpx.Response:
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            return await client.post("/upload", **kwargs)
+    return asyncio.run(send())
+
+
+def test_declared_oversized_body_is_refused_before_it_is_read():
+    app, calls = limited_app(1024)
+    response = post(app, files={"file": ("big.png", PNG_HEAD + b"\0" * 4096, "image/png")})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_undeclared_oversized_body_is_cut_off():
+    app, calls = limited_app(1024)
+
+    boundary = "limit-test"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode()
+
+    async def body():
+        # Streamed without a Content-Length
+        yield head + PNG_HEAD
+        for _ in range(8):
+            yield b"\0" * 512
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = post(app, content=body(), headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_body_within_the_limit_is_accepted():
+    app, calls = limited_app(64 * 1024)
+    response = post(app, files={"file": ("small.png", PNG_HEAD + b"\0" * 1024, "image/png")})
+    assert response.status_code == 200
+    assert calls == ["small.png"]
+
+
+def test_concurrent_large_uploads_stream_in_bounded_memory():
+    """50 simultaneous 10MB multipart uploads through the size limit and
+    read_upload: memory holds chunks in flight, not the files."""
+    size, uploads_count = 10 * 1024 * 1024, 50
+    piece = b"\0" * (64 * 1024)
+    uploads = DiscardingUploads()
+    sizes = []
+
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def receive(file: UploadFile = File(...)):
+        upload = await read_upload(file, size, sink=StorageSink(uploads))
+        sizes.append(upload.size)
+        return {"ok": True}
+
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=size + 64 * 1024)
+
+    boundary = "concurrent-test"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"big.png\"\r\n"
+            f"Content-Type: image/png\r\n\r\n").encode()
+
+    async def body():
+        # Generated as it is sent; every piece is the same bytes object
+        yield head + PNG_HEAD + piece[:len(piece) - len(PNG_HEAD)]
+        for _ in range(size // len(piece) - 1):
+            yield piece
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    async def send_all():
+        tracemalloc.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                responses = await asyncio.gather(*[
+                    client.post("/upload", content=body(),
+                                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+                    for _ in range(uploads_count)
+                ])
+            return responses, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    responses, peak = asyncio.run(send_all())
+    assert [response.status_code for response in responses] == [200] * uploads_count
+    assert sizes == [size] * uploads_count
+    # Starlette spools each part past 1MB to disk: at most about a megabyte
+    # per upload is held, a tenth of the 500MB sent
+    assert peak < uploads_count * 1024 * 1024, peak
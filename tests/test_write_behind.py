@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import AutoReconnect
+
+from write_behind import WriteBehindFull, WriteBehindQueue
+
+
+class FakeCollection:
+    """Records bulk_writes; fails the first `failures` of them as an unreachable server would."""
+
+    name = "users"
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches = []
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect("connection refused")
+        self.batches.append(list(operations))
+
+
+def _update(user_id: str, value: int) -> UpdateOne:
+    return UpdateOne({"id": user_id}, {"$set": {"value": value}})
+
+
+def test_writes_to_one_key_coalesce_to_the_last():
+    async def run():
+        queue, collection = WriteBehindQueue(window=60), FakeCollection()
+        for value in range(3):
+            await queue.put(collection, "u1", _update("u1", value))
+        await queue.put(collection, "u2", _update("u2", 0))
+        await queue.flush()
+        await queue.close()
+        return collection.batches
+
+    assert asyncio.run(run()) == [[_update("u1", 2), _update("u2", 0)]]
+
+
+def test_full_queue_flushes_before_queueing():
+    async def run():
+        queue, collection = WriteBehindQueue(window=60, max_pending=2), FakeCollection()
+        for n in range(3):
+            await queue.put(collection, f"u{n}", _update(f"u{n}", n))
+        pending = len(queue)
+        await queue.close()
+        return collection.batches, pending
+
+    batches, pending = asyncio.run(run())
+    assert batches == [[_update("u0", 0), _update("u1", 1)], [_update("u2", 2)]]
+    assert pending == 1
+
+
+def test_full_queue_sheds_writes_while_the_database_is_failing():
+    async def run():
+        queue, collection = WriteBehindQueue(window=60, max_pending=2), FakeCollection(failures=100)
+        await queue.put(collection, "u0", _update("u0", 0))
+        await queue.put(collection, "u1", _update("u1", 1))
+        with pytest.raises(WriteBehindFull):
+            await queue.put(collection, "u2", _update("u2", 2))
+        attempts = 100 - collection.failures
+        # No further flush attempt per write once one has failed
+        with pytest.raises(WriteBehindFull):
+            await queue.put(collection, "u3", _update("u3", 3))
+        # A write to a queued key still coalesces
+        await queue.put(collection, "u1", _update("u1", 10))
+        return attempts, 100 - collection.failures, len(queue)
+
+    assert asyncio.run(run()) == (1, 1, 2)
+
+
+def test_failed_batches_are_retried_then_dropped():
+    async def run():
+        queue = WriteBehindQueue(window=60, max_attempts=3)
+        recovers, down = FakeCollection(failures=1), FakeCollection(failures=100)
+        await queue.put(recovers, "a", _update("a", 1))
+        await queue.flush()
+        retried = len(queue)
+        await queue.flush()
+        applied = recovers.batches
+
+        await queue.put(down, "b", _update("b", 1))
+        for _ in range(3):
+            await queue.flush()
+        return retried, applied, len(queue), 100 - down.failures
+
+    retried, applied, left, attempts = asyncio.run(run())
+    assert retried == 1 and applied == [[_update("a", 1)]]
+    assert (left, attempts) == (0, 3)
+
+
+def test_close_drains_pending_writes():
+    async def run():
+        queue, collection = WriteBehindQueue(window=60), FakeCollection()
+        await queue.put(collection, "u1", _update("u1", 1))
+        await asyncio.sleep(0)
+        await queue.close()
+        # Writes after shutdown go straight to the database
+        await queue.put(collection, "u2", _update("u2", 2))
+        return collection.batches, len(queue)
+
+    assert asyncio.run(run()) == ([[_update("u1", 1)], [_update("u2", 2)]], 0)